@@ -0,0 +1,158 @@
+# Database overhead: engine per command vs. shared pool, ORM vs. Core
+# lookups, and per-row vs. bulk reads and writes of a whole cohort
+#
+# Usage: DB_URI=postgresql+asyncpg://... python -m benchmarks.database_benchmark
+# Without DB_URI a temporary sqlite+aiosqlite file database is used.
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import delete, select
+
+from midgard_discord import database
+
+ITERATIONS = int(os.getenv("BENCH_ITERATIONS", 200))
+COHORT_SIZE = int(os.getenv("BENCH_COHORT_SIZE", 200))
+
+
+def report(label: str, samples: list[float]) -> None:
+    """Print mean and tail latency in milliseconds."""
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(
+        f"{label:<24} mean={statistics.mean(samples) * 1000:8.3f}ms "
+        f"p95={p95 * 1000:8.3f}ms n={len(samples)}"
+    )
+
+
+async def per_command(DB_URI: str, discord_user_id: str) -> list[float]:
+    """Old behaviour: build engine, create schema, query, dispose."""
+    samples = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        engine, session = await database.init_async_db(DB_URI)
+        await database.find_user(session, discord_user_id)
+        await engine.dispose()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def pooled(DB_URI: str, discord_user_id: str) -> list[float]:
+    """New behaviour: one engine for the process, sessions from the pool."""
+    engine, session = database.create_engine(DB_URI)
+    samples = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        await database.find_user(session, discord_user_id)
+        samples.append(time.perf_counter() - start)
+    await engine.dispose()
+    return samples
+
+
+async def orm_lookups(DB_URI: str, discord_user_id: str) -> list[float]:
+    """Old lookup: a full ORM entity per user, through the identity map."""
+    engine, session = database.create_engine(DB_URI)
+    stmt = select(database.OpenStackCredential).where(
+        database.OpenStackCredential.username == discord_user_id
+    )
+    samples = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        async with session() as s:
+            (await s.execute(stmt)).first()
+        samples.append(time.perf_counter() - start)
+    await engine.dispose()
+    return samples
+
+
+async def timed(func) -> list[float]:
+    """Time one call of func()."""
+    start = time.perf_counter()
+    await func()
+    return [time.perf_counter() - start]
+
+
+async def cohort(DB_URI: str) -> None:
+    """Store and look up COHORT_SIZE users row by row, then in bulk."""
+    engine, session = database.create_engine(DB_URI)
+    rows = [
+        {
+            "username": f"cohort_{i}",
+            "password": "password",
+            "project_name": f"project_{i}",
+        }
+        for i in range(COHORT_SIZE)
+    ]
+    usernames = [row["username"] for row in rows]
+
+    async def clear():
+        async with session() as s, s.begin():
+            await s.execute(
+                delete(database.credentials).where(
+                    database.credentials.c.username.in_(usernames)
+                )
+            )
+
+    async def create_per_row():
+        for row in rows:
+            await database.create_user(
+                session,
+                row["username"],
+                password=row["password"],
+                project_name=row["project_name"],
+            )
+
+    await clear()
+    report(f"create_user x{COHORT_SIZE}", await timed(create_per_row))
+    await clear()
+    report(
+        f"upsert_users({COHORT_SIZE})",
+        await timed(lambda: database.upsert_users(session, rows)),
+    )
+    report(
+        f"upsert_users({COHORT_SIZE}) again",
+        await timed(lambda: database.upsert_users(session, rows)),
+    )
+
+    async def find_per_row():
+        for username in usernames:
+            await database.find_user(session, username)
+
+    report(f"find_user x{COHORT_SIZE}", await timed(find_per_row))
+    report(
+        f"find_users({COHORT_SIZE})",
+        await timed(lambda: database.find_users(session, usernames)),
+    )
+    await clear()
+    await engine.dispose()
+
+
+async def run(DB_URI: str) -> None:
+    engine, session = await database.init_async_db(DB_URI)
+    discord_user_id = "benchmark_user"
+    if await database.find_user(session, discord_user_id) is None:
+        await database.create_user(
+            session, discord_user_id, password="password", project_name="project"
+        )
+    await engine.dispose()
+
+    report("engine per command", await per_command(DB_URI, discord_user_id))
+    report("shared pool", await pooled(DB_URI, discord_user_id))
+    report("ORM lookup", await orm_lookups(DB_URI, discord_user_id))
+    await cohort(DB_URI)
+
+
+def main() -> None:
+    DB_URI = os.getenv("DB_URI")
+    if DB_URI:
+        asyncio.run(run(DB_URI))
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(f"sqlite+aiosqlite:///{tmp}/benchmark.db"))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
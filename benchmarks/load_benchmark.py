@@ -0,0 +1,359 @@
+# Load test: synthetic Discord users running the bot's commands concurrently
+# against an in-process fake OpenStack and a local fake CloudFlare API
+#
+# Usage: python -m benchmarks.load_benchmark
+# BENCH_USERS users each register, pick a flavor and an image through the
+# autocompletes, add a keypair, create a server and forward a port, with
+# BENCH_CONCURRENCY of them at once. BENCH_OS_LATENCY, BENCH_CF_LATENCY and
+# BENCH_DISCORD_LATENCY set the round-trip in seconds of each fake API.
+# Results are appended to benchmarks/results/load.jsonl (BENCH_RESULTS) and
+# compared with the last run of the same settings.
+import asyncio
+import contextlib
+import datetime
+import inspect
+import json
+import os
+import resource
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from midgard_discord import cloud
+from midgard_discord import jobs
+from midgard_discord import networking
+from midgard_discord import tracing
+from tests.fakes.cloudflare import FakeCloudflare
+from tests.fakes.discord import FakeContext
+from tests.fakes.openstack import FakeCloud
+
+USERS = int(os.getenv("BENCH_USERS", 200))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", USERS))
+OS_LATENCY = float(os.getenv("BENCH_OS_LATENCY", 0.02))
+CF_LATENCY = float(os.getenv("BENCH_CF_LATENCY", 0.05))
+DISCORD_LATENCY = float(os.getenv("BENCH_DISCORD_LATENCY", 0.05))
+# tracemalloc finds the peak Python heap, but slows every allocation down
+TRACE_MEMORY = os.getenv("BENCH_TRACE_MEMORY", "true").lower() == "true"
+RESULTS = os.getenv(
+    "BENCH_RESULTS",
+    os.path.join(os.path.dirname(__file__), "results", "load.jsonl"),
+)
+FIRST_USER_ID = 100000000000000000
+AUTOCOMPLETE_KEYSTROKES = 10
+KEYSTROKE_INTERVAL = 0.5
+PUBLIC_KEY = (
+    "ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIGmipAeHdN9WM05SzB6815H5Y0Mld/97ubrZU8XCt51C"
+    " load@benchmark"
+)
+# Order of the steps in the report
+STEPS = (
+    "register",
+    "autocomplete flavor",
+    "autocomplete image",
+    "add keypair",
+    "server create",
+    "server create job",
+    "add portforward",
+)
+
+
+def settings() -> dict:
+    """Return the settings a run is compared on."""
+    return {
+        "users": USERS,
+        "concurrency": CONCURRENCY,
+        "os_latency": OS_LATENCY,
+        "cf_latency": CF_LATENCY,
+        "discord_latency": DISCORD_LATENCY,
+        "trace_memory": TRACE_MEMORY,
+    }
+
+
+def configure(db_path: str, api_url: str) -> None:
+    """Point the bot at the fakes, before main reads its environment."""
+    os.environ.setdefault("DISCORD_TOKEN", "benchmark")
+    os.environ.setdefault("DISCORD_DEFAULT_GUILD_ID", "1")
+    os.environ.setdefault("OS_DEFAULT_GUILD_PREFIX", "midgard")
+    os.environ.update(
+        DB_URI=os.getenv("BENCH_DB_URI") or f"sqlite+aiosqlite:///{db_path}",
+        CF_API_URL=api_url,
+        CF_API_KEY="benchmark",
+        CF_ACCOUNT_ID="account",
+        CF_TUNNEL_ID="tunnel",
+        CF_ZONE_ID="zone",
+        CF_DOMAIN="midgard.io",
+        # The fake only stands in for the SDK, not the REST API
+        OS_ASYNC_READS="false",
+        TRACE_LOG="false",
+    )
+
+
+def handlers(bot) -> dict:
+    """Return the /midgard subcommand handlers, traced as in the bot.
+
+    The interactions layer is left out: autodefer holds every call for its
+    whole delay, which would cap throughput at concurrency / delay.
+    """
+    return {
+        name: tracing.command(name)(inspect.unwrap(coro))
+        for name, coro in bot.midgard.coroutines.items()
+    }
+
+
+class Step:
+    """Latencies and errors of one step of the user journey."""
+
+    def __init__(self):
+        """Initialise an empty step."""
+        self.latency = tracing.Histogram(max_samples=None)
+        self.first_response = tracing.Histogram(max_samples=None)
+        self.errors = 0
+
+    def summary(self) -> dict:
+        """Return the step's count, errors and latencies in seconds."""
+        latency = self.latency.snapshot()
+        return {
+            "count": self.latency.count,
+            "errors": self.errors,
+            "p50": latency["p50"],
+            "p95": latency["p95"],
+            "p99": latency["p99"],
+            "max": max(self.latency.samples, default=0.0),
+            "first_response_p95": (
+                self.first_response.percentile(95)
+                if self.first_response.count
+                else None
+            ),
+        }
+
+
+async def timed(step: Step, ctx: FakeContext, call) -> None:
+    """Run one call of a step, noting its latency and time to first response."""
+    started = time.perf_counter()
+    try:
+        await call
+    except Exception:
+        step.errors += 1
+    finally:
+        step.latency.observe(time.perf_counter() - started)
+        if ctx is not None and ctx.responded_at is not None:
+            step.first_response.observe(ctx.responded_at - ctx.created_at)
+
+
+async def autocomplete(step: Step, context, handler, query: str) -> FakeContext:
+    """Type into an option until the autocomplete offers choices.
+
+    An autocomplete over the rate limit answers with no choices, so the
+    user types another key a moment later, as they would in Discord.
+    """
+    for _ in range(AUTOCOMPLETE_KEYSTROKES):
+        ctx = context()
+        await timed(step, ctx, handler(ctx, query))
+        if ctx.choices:
+            break
+        await asyncio.sleep(KEYSTROKE_INTERVAL)
+    return ctx
+
+
+async def journey(bot, commands: dict, steps: dict, user_id: int) -> None:
+    """Take a new user from registration to a server with a forwarded port."""
+
+    def context() -> FakeContext:
+        return FakeContext(user_id, latency=DISCORD_LATENCY)
+
+    ctx = context()
+    await timed(steps["register"], ctx, commands["register"](ctx))
+
+    flavor_ctx = await autocomplete(
+        steps["autocomplete flavor"],
+        context,
+        bot.server_create_flavor_autocomplete,
+        "m1",
+    )
+    image_ctx = await autocomplete(
+        steps["autocomplete image"], context, bot.server_create_image_autocomplete, ""
+    )
+
+    ctx = context()
+    await timed(
+        steps["add keypair"], ctx, commands["add keypair"](ctx, public_key=PUBLIC_KEY)
+    )
+
+    # Users pick the first choices the autocompletes offered
+    ctx = context()
+    await timed(
+        steps["server create"],
+        ctx,
+        commands["server create"](
+            ctx,
+            flavor=(flavor_ctx.choices or [{"value": None}])[0]["value"],
+            image=(image_ctx.choices or [{"value": None}])[0]["value"],
+        ),
+    )
+    await timed(
+        steps["server create job"],
+        None,
+        asyncio.gather(*(job.wait() for job in jobs.get_queue().jobs(str(user_id)))),
+    )
+
+    ctx = context()
+    await timed(
+        steps["add portforward"],
+        ctx,
+        commands["add portforward"](ctx, port=8080, protocol="http"),
+    )
+
+
+async def run(bot, fake_cloud: FakeCloud, fake_cloudflare: FakeCloudflare) -> dict:
+    """Run every user's journey and return the result of the run."""
+    await bot.database.create_schema(bot.db_engine)
+    bot.startup.start()
+    await bot.startup.wait_ready(timeout=30)
+
+    commands = handlers(bot)
+    steps = {name: Step() for name in STEPS}
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def limited(user_id: int) -> None:
+        async with semaphore:
+            await journey(bot, commands, steps, user_id)
+
+    if TRACE_MEMORY:
+        tracemalloc.start()
+    started = time.perf_counter()
+    # The bot logs every command, which is part of its cost
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        await asyncio.gather(
+            *(limited(FIRST_USER_ID + i) for i in range(USERS)),
+        )
+    wall = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] if TRACE_MEMORY else None
+    if TRACE_MEMORY:
+        tracemalloc.stop()
+
+    # The server build runs in the background, after its command answered
+    calls = sum(
+        step.latency.count
+        for name, step in steps.items()
+        if name != "server create job"
+    )
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit(),
+        "settings": settings(),
+        "wall": wall,
+        "throughput": calls / wall,
+        "journeys_per_second": USERS / wall,
+        "steps": {name: step.summary() for name, step in steps.items()},
+        "operations": tracing.snapshot(limit=10)["operations"],
+        "pools": cloud.executor_stats(),
+        "peak_memory_mb": peak / 2**20 if peak is not None else None,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10,
+        "servers": len(fake_cloud.servers),
+        "dns_records": len(fake_cloudflare.dns_records),
+    }
+
+
+def commit() -> str:
+    """Return the commit under test, if run from a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_result(path: str, current: dict) -> dict:
+    """Return the last stored result with the same settings, if any."""
+    previous = None
+    with contextlib.suppress(FileNotFoundError):
+        with open(path) as f:
+            for line in f:
+                result = json.loads(line)
+                if result["settings"] == current["settings"]:
+                    previous = result
+    return previous
+
+
+def change(new: float, old: float) -> str:
+    """Return the relative change from old to new."""
+    if not old:
+        return ""
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def report(result: dict, previous: dict = None) -> None:
+    """Print throughput, tail latency and memory, next to the last run."""
+    old_steps = previous["steps"] if previous else {}
+    print(
+        f"{USERS} users, {CONCURRENCY} at once, "
+        f"OpenStack {OS_LATENCY * 1000:.0f}ms, CloudFlare {CF_LATENCY * 1000:.0f}ms, "
+        f"Discord {DISCORD_LATENCY * 1000:.0f}ms"
+        + (f" (vs. {previous['commit']} {previous['timestamp']})" if previous else "")
+    )
+    print(
+        f"{'step':<24} {'count':>6} {'errors':>6} {'p50':>9} {'p95':>9} "
+        f"{'p99':>9} {'max':>9} {'first p95':>10}"
+    )
+    for name, step in result["steps"].items():
+        p95_change = change(step["p95"], old_steps.get(name, {}).get("p95"))
+        print(
+            f"{name:<24} {step['count']:>6} {step['errors']:>6} "
+            + " ".join(f"{step[q] * 1000:7.1f}ms" for q in ("p50", "p95", "p99", "max"))
+            + (
+                f" {step['first_response_p95'] * 1000:8.1f}ms"
+                if step["first_response_p95"] is not None
+                else f" {'-':>10}"
+            )
+            + f" {p95_change}"
+        )
+    print(
+        f"throughput={result['throughput']:.1f} commands/s "
+        f"{change(result['throughput'], previous and previous['throughput'])} "
+        f"journeys={result['journeys_per_second']:.1f}/s wall={result['wall']:.2f}s"
+    )
+    if result["peak_memory_mb"] is not None:
+        print(f"peak traced memory={result['peak_memory_mb']:.1f}MB", end=" ")
+    print(f"max RSS={result['max_rss_mb']:.1f}MB")
+    print(f"servers={result['servers']} DNS records={result['dns_records']}")
+
+
+def store(path: str, result: dict) -> None:
+    """Append a result to the results file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(result) + "\n")
+
+
+async def main() -> None:
+    fake_cloud = FakeCloud(latency=OS_LATENCY)
+    fake_cloudflare = FakeCloudflare(latency=CF_LATENCY)
+    api_url = await fake_cloudflare.start()
+    with tempfile.TemporaryDirectory() as tmp:
+        configure(os.path.join(tmp, "midgard.db"), api_url)
+        from midgard_discord import main as bot
+
+        cloud.connect = fake_cloud.connect
+        try:
+            result = await run(bot, fake_cloud, fake_cloudflare)
+        finally:
+            await bot.startup.close()
+            await jobs.close_queue()
+            bot.connections.close()
+            cloud.close_executors()
+            await networking.close_client()
+            await bot.db_engine.dispose()
+            await fake_cloudflare.close()
+
+    previous = previous_result(RESULTS, result)
+    report(result, previous)
+    store(RESULTS, result)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
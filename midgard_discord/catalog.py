@@ -0,0 +1,305 @@
+# In-process flavor and image catalog for autocomplete
+import asyncio
+import bisect
+import collections
+import contextlib
+import itertools
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable
+
+from midgard_discord import concurrency
+
+
+DEFAULT_CATALOG_TTL = 300
+DEFAULT_MAX_SCOPES = 256
+DEFAULT_LIMIT = 25
+NGRAM_SIZE = 3
+SCAN_THRESHOLD = 1024
+
+
+def ngrams(text: str, size: int = NGRAM_SIZE) -> set[str]:
+    """Return every substring of text up to size characters long."""
+    return {
+        text[i : i + n] for n in range(1, size + 1) for i in range(len(text) - n + 1)
+    }
+
+
+class NameIndex:
+    """Prefix and trigram index over the names of catalog resources.
+
+    Resources are kept sorted by lower-cased name so prefix matches come from
+    a bisect, and every 1-3 character substring maps to the positions of the
+    names containing it, so a substring query only verifies a few candidates.
+    Predicates are evaluated once at build time and stored as position sets,
+    and render, if given, turns every resource into its ready-to-send form
+    (e.g. an autocomplete choice) once instead of on every lookup.
+    """
+
+    def __init__(
+        self,
+        items: Iterable[Any],
+        predicates: dict[str, Callable[[Any], bool]] = None,
+        render: Callable[[Any], Any] = None,
+    ):
+        """Build the index."""
+        self.items = sorted(items, key=lambda item: item.name.lower())
+        self.names = [item.name.lower() for item in self.items]
+        self.postings = collections.defaultdict(set)
+        for position, name in enumerate(self.names):
+            for gram in ngrams(name):
+                self.postings[gram].add(position)
+        self.predicates = {
+            label: {
+                position for position, item in enumerate(self.items) if predicate(item)
+            }
+            for label, predicate in (predicates or {}).items()
+        }
+        self.rendered = [render(item) for item in self.items] if render else None
+
+    def __len__(self) -> int:
+        """Return the number of indexed resources."""
+        return len(self.items)
+
+    def positions(
+        self, query: str = "", where: str = None, limit: int = DEFAULT_LIMIT
+    ) -> list[int]:
+        """Return up to limit positions of matching resources, prefixes first."""
+        query = query.lower()
+        allowed = self.predicates[where] if where else None
+        if not query:
+            candidates = range(len(self.items)) if allowed is None else sorted(allowed)
+            return list(itertools.islice(candidates, limit))
+
+        # Prefix matches are contiguous in the sorted name list
+        start = bisect.bisect_left(self.names, query)
+        end = bisect.bisect_right(self.names, query + "\uffff")
+        prefixed = list(
+            itertools.islice(
+                (
+                    position
+                    for position in range(start, end)
+                    if allowed is None or position in allowed
+                ),
+                limit,
+            )
+        )
+        if len(prefixed) == limit:
+            return prefixed
+        return prefixed + self._substring(
+            query, allowed, set(prefixed), limit - len(prefixed)
+        )
+
+    def _substring(self, query: str, allowed: set, seen: set, limit: int) -> list[int]:
+        """Return up to limit non-prefix positions whose name contains query."""
+        grams = [query[i : i + NGRAM_SIZE] for i in range(len(query) - NGRAM_SIZE + 1)]
+        grams = grams or [query]
+        # Intersect the smallest posting lists first
+        postings = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+        if len(postings[0]) > SCAN_THRESHOLD:
+            # Common query: walking names in order stops after a few matches
+            candidates = (
+                position
+                for position in range(len(self.names))
+                if position in postings[0]
+            )
+        else:
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                candidates &= posting
+            candidates = sorted(candidates)
+        matches = (
+            position
+            for position in candidates
+            if position not in seen
+            and (allowed is None or position in allowed)
+            and query in self.names[position]
+        )
+        return list(itertools.islice(matches, limit))
+
+    def search(
+        self, query: str = "", limit: int = DEFAULT_LIMIT, where: str = None
+    ) -> list[Any]:
+        """Return up to limit resources whose name contains query."""
+        return [
+            self.items[position] for position in self.positions(query, where, limit)
+        ]
+
+    def render(
+        self, query: str = "", limit: int = DEFAULT_LIMIT, where: str = None
+    ) -> list[Any]:
+        """Return the rendered form of up to limit matching resources."""
+        rendered = self.items if self.rendered is None else self.rendered
+        return [rendered[position] for position in self.positions(query, where, limit)]
+
+
+class Catalog:
+    """A TTL cache of NameIndex objects, one per visibility scope.
+
+    Expired entries are served stale while a background task reloads them,
+    so only the very first lookup of a scope waits on the cloud. Given a
+    stream such as cloud.iter_flavors, that first lookup is answered from
+    the first matching results while the full index is built. Resources
+    are rendered with render when their index is built, so a refresh also
+    replaces the rendered forms. A limiter such as a
+    concurrency.TokenBucket is acquired before loading a scope, waiting at
+    most limit_wait seconds: past that, a cold scope has no matches and a
+    stale one is served as it is.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[..., Awaitable[list[Any]]],
+        ttl: float = DEFAULT_CATALOG_TTL,
+        predicates: dict[str, Callable[[Any], bool]] = None,
+        max_scopes: int = DEFAULT_MAX_SCOPES,
+        stream: Callable[..., AsyncIterator[Any]] = None,
+        render: Callable[[Any], Any] = None,
+        limiter: Any = None,
+        limit_wait: float = None,
+    ):
+        """Initialise an empty catalog around a loader such as cloud.list_flavors."""
+        self.loader = loader
+        self.ttl = ttl
+        self.predicates = predicates
+        self.max_scopes = max_scopes
+        self.stream = stream
+        self.render = render
+        self.limiter = limiter
+        self.limit_wait = limit_wait
+        self.hits = 0
+        self.misses = 0
+        self._indexes = collections.OrderedDict()
+        self._refreshing = {}
+
+    async def _acquire(self) -> None:
+        """Take a token of the limiter, or raise RateLimitedError."""
+        if self.limiter is not None and not await self.limiter.acquire(self.limit_wait):
+            raise concurrency.RateLimitedError("Catalog loads are rate limited.")
+
+    async def _load(self, scope: Any, client: Any, limited: bool = True) -> NameIndex:
+        """Load a scope from the cloud and store its index."""
+        try:
+            if limited:
+                await self._acquire()
+            items = await self.loader(client)
+            # Building a large index takes a while, keep it off the event loop
+            index = await asyncio.to_thread(
+                NameIndex, items, self.predicates, self.render
+            )
+            self._indexes[scope] = (index, time.monotonic() + self.ttl)
+            self._indexes.move_to_end(scope)
+            while len(self._indexes) > self.max_scopes:
+                self._indexes.popitem(last=False)
+            return index
+        finally:
+            self._refreshing.pop(scope, None)
+
+    def refresh(self, scope: Any, client: Any, limited: bool = True) -> asyncio.Task:
+        """Reload a scope in the background, sharing any reload in flight.
+
+        Pass limited=False when the caller already took a limiter token.
+        """
+        task = self._refreshing.get(scope)
+        if task is None:
+            task = asyncio.ensure_future(self._load(scope, client, limited))
+            task.add_done_callback(self._report)
+            self._refreshing[scope] = task
+        return task
+
+    @staticmethod
+    def _report(task: asyncio.Task) -> None:
+        """Log a failed reload; the stale index keeps being served."""
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Catalog refresh failed: {task.exception()}")
+
+    def invalidate(self, scope: Any = None) -> None:
+        """Forget one scope, or every scope."""
+        if scope is None:
+            self._indexes.clear()
+        else:
+            self._indexes.pop(scope, None)
+
+    async def index(self, scope: Any, client: Any) -> NameIndex:
+        """Return the index of a scope, loading it on first use."""
+        entry = self._indexes.get(scope)
+        if entry is None:
+            self.misses += 1
+            return await asyncio.shield(self.refresh(scope, client))
+        self.hits += 1
+        index, expires_at = entry
+        self._indexes.move_to_end(scope)
+        if time.monotonic() >= expires_at:
+            self.refresh(scope, client)
+        return index
+
+    async def search(
+        self,
+        scope: Any,
+        client: Any,
+        query: str = "",
+        limit: int = DEFAULT_LIMIT,
+        where: str = None,
+    ) -> list[Any]:
+        """Return up to limit resources of a scope whose name contains query."""
+        try:
+            if self._cold(scope):
+                return await self._first_matches(scope, client, query, limit, where)
+            return (await self.index(scope, client)).search(query, limit, where)
+        except concurrency.RateLimitedError:
+            return []
+
+    async def choices(
+        self,
+        scope: Any,
+        client: Any,
+        query: str = "",
+        limit: int = DEFAULT_LIMIT,
+        where: str = None,
+    ) -> list[Any]:
+        """Return the rendered forms of up to limit matching resources."""
+        try:
+            if self._cold(scope):
+                matches = await self._first_matches(scope, client, query, limit, where)
+                if self.render is None:
+                    return matches
+                return [self.render(resource) for resource in matches]
+            return (await self.index(scope, client)).render(query, limit, where)
+        except concurrency.RateLimitedError:
+            return []
+
+    def _cold(self, scope: Any) -> bool:
+        """Tell whether a scope is best answered from the stream."""
+        return (
+            self.stream is not None
+            and scope not in self._indexes
+            and scope not in self._refreshing
+        )
+
+    async def _first_matches(
+        self, scope: Any, client: Any, query: str, limit: int, where: str = None
+    ) -> list[Any]:
+        """Stream the first matches of a cold scope while its index loads.
+
+        One limiter token covers both the stream and the load; lookups of the
+        scope made meanwhile wait for the load instead of streaming again.
+        """
+        self.misses += 1
+        await self._acquire()
+        self.refresh(scope, client, limited=False)
+        return await self._stream(client, query, limit, where)
+
+    async def _stream(
+        self, client: Any, query: str, limit: int, where: str = None
+    ) -> list[Any]:
+        """Return the first matches of a streaming listing."""
+        predicate = self.predicates[where] if where else None
+        matches = []
+        # Only the stream can stop at limit when there is no predicate
+        resources = self.stream(client, query, None if predicate else limit)
+        async with contextlib.aclosing(resources):
+            async for resource in resources:
+                if predicate is None or predicate(resource):
+                    matches.append(resource)
+                    if len(matches) == limit:
+                        break
+        return matches
@@ -1,6 +1,24 @@
 # OpenStack Cloud helper functions
 import asyncio
+import collections
+import contextlib
+import functools
+import itertools
+import os
+import time
+import weakref
+from typing import AsyncIterator, Awaitable, Callable, Iterator
+
 import openstack
+import sqlalchemy
+
+from midgard_discord import concurrency
+from midgard_discord import database
+from midgard_discord import executor
+from midgard_discord import openstack_api
+from midgard_discord import provisioning
+from midgard_discord import tracing
+from midgard_discord import utils
 
 
 # Default values
@@ -20,6 +38,19 @@ DEFAULT_SG_PROTOCOL = "tcp"
 DEFAULT_SG_NAME = "midgard"
 DEFAULT_SG_REMOTE_IP_PREFIX = "0.0.0.0/0"
 DEFAULT_SERVER_NAME = "midgard-server"
+DEFAULT_IMAGE_USER = "root"
+DEFAULT_POLL_INTERVAL = 2
+DEFAULT_POLL_MAX_INTERVAL = 15
+# Well within the 15 minutes an interaction token lasts
+DEFAULT_POLL_TIMEOUT = 600
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_RESOURCE_TTL = 30
+
+# Thread pools for blocking openstacksdk calls and their default sizes
+READ = "read"
+MUTATE = "mutate"
+WAIT = "wait"
+DEFAULT_POOL_WORKERS = {READ: 8, MUTATE: 4, WAIT: 4}
 
 
 def connect(
@@ -46,31 +77,167 @@ def connect(
         )
 
 
+class ConnectionManager:
+    """Keep one authenticated OpenStack connection per (username, project).
+
+    A live connection holds its Keystone token and service catalog, which the
+    auth plugin reuses until the token is about to expire, so borrowing a
+    connection skips re-authentication and catalog discovery. Connections are
+    evicted least recently used first once max_size is reached. An evicted
+    connection is only forgotten, not closed: a command or a server build
+    may still be using it, and it is reclaimed once they let go of it.
+    """
+
+    def __init__(self, max_size: int = 64):
+        """Initialise an empty connection pool."""
+        self.max_size = max_size
+        self._connections = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        """Return the number of live connections."""
+        return len(self._connections)
+
+    def get(
+        self,
+        auth_url: str = None,
+        region_name: str = None,
+        project_name: str = None,
+        username: str = None,
+        password: str = None,
+        user_domain: str = None,
+        project_domain: str = None,
+    ) -> openstack.connection.Connection:
+        """Borrow a connection, creating it on first use."""
+        key = (username, project_name)
+        entry = self._connections.get(key)
+        if entry is not None:
+            secret, client = entry
+            if secret == password:
+                self._connections.move_to_end(key)
+                return client
+            # Credentials changed (e.g. password reset), drop the stale session
+            self.evict(username, project_name)
+
+        client = connect(
+            auth_url=auth_url,
+            region_name=region_name,
+            project_name=project_name,
+            username=username,
+            password=password,
+            user_domain=user_domain,
+            project_domain=project_domain,
+        )
+        self._connections[key] = (password, client)
+        while len(self._connections) > self.max_size:
+            self._connections.popitem(last=False)
+        return client
+
+    def evict(self, username: str = None, project_name: str = None) -> None:
+        """Forget the connection of a credential, leaving it to its borrowers."""
+        self._connections.pop((username, project_name), None)
+
+    def close(self) -> None:
+        """Close every live connection."""
+        while self._connections:
+            _, (_, client) = self._connections.popitem()
+            client.close()
+
+
+_executors = {}
+
+
+def get_executor(pool: str) -> executor.Executor:
+    """Get a shared thread pool for openstacksdk calls.
+
+    Quick lookups use the read pool, create/update/delete calls the mutate
+    pool and calls that block until a resource settles the wait pool, so a
+    slow build never delays an autocomplete. Pools are sized by
+    OS_<POOL>_WORKERS and OS_<POOL>_QUEUE_SIZE; OS_EXECUTOR_BUSY_TIMEOUT
+    bounds how long a call waits for room in a saturated pool.
+    """
+    pool_executor = _executors.get(pool)
+    if pool_executor is None:
+        prefix = f"OS_{pool.upper()}"
+        pool_executor = executor.Executor(
+            pool,
+            max_workers=utils.getenv_int(
+                f"{prefix}_WORKERS", DEFAULT_POOL_WORKERS[pool]
+            ),
+            max_queue=utils.getenv_int(f"{prefix}_QUEUE_SIZE"),
+            busy_timeout=utils.getenv_float("OS_EXECUTOR_BUSY_TIMEOUT"),
+        )
+        _executors[pool] = pool_executor
+    return pool_executor
+
+
+async def run_in_pool(pool: str, func: Callable, *args, **kwargs):
+    """Run a blocking openstacksdk call in one of the shared thread pools."""
+    return await get_executor(pool).run(func, *args, **kwargs)
+
+
+def executor_stats() -> dict[str, dict]:
+    """Return queue depth and wait-time metrics of every thread pool."""
+    return {pool: _executors[pool].stats() for pool in sorted(_executors)}
+
+
+def close_executors() -> None:
+    """Stop the thread pools, e.g. on bot shutdown."""
+    while _executors:
+        _, pool_executor = _executors.popitem()
+        pool_executor.shutdown()
+
+
+# Async read clients, dropped together with their connection
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def async_reads() -> bool:
+    """Return whether hot reads use the aiohttp client (OS_ASYNC_READS)."""
+    return utils.getenv_bool("OS_ASYNC_READS")
+
+
+def get_async_client(
+    client: openstack.connection.Connection,
+) -> openstack_api.AsyncOpenStackClient:
+    """Get the async read client sharing the token and catalog of a connection."""
+    async_client = _async_clients.get(client)
+    if async_client is None:
+        async_client = openstack_api.AsyncOpenStackClient(
+            client, run_blocking=functools.partial(run_in_pool, READ)
+        )
+        _async_clients[client] = async_client
+    return async_client
+
+
 async def find_project(client: openstack.connection.Connection, project_name: str):
     """Find a project in Keystone database."""
-    return await asyncio.to_thread(
-        client.identity.find_project, project_name, ignore_missing=True
+    if async_reads():
+        return await get_async_client(client).find_project(project_name)
+    return await run_in_pool(
+        READ, client.identity.find_project, project_name, ignore_missing=True
     )
 
 
 async def find_user(client: openstack.connection.Connection, discord_user_id: str):
     """Find a user in Keystone database."""
-    return await asyncio.to_thread(
-        client.identity.find_user, discord_user_id, ignore_missing=True
+    if async_reads():
+        return await get_async_client(client).find_user(discord_user_id)
+    return await run_in_pool(
+        READ, client.identity.find_user, discord_user_id, ignore_missing=True
     )
 
 
 async def create_project(client: openstack.connection.Connection, project_name: str):
     """Create a new project in Keystone database."""
-    return await asyncio.to_thread(client.identity.create_project, name=project_name)
+    return await run_in_pool(MUTATE, client.identity.create_project, name=project_name)
 
 
 async def create_user(
     client: openstack.connection.Connection, discord_user_id: str, **kwargs
 ):
     """Create a new user in Keystone database."""
-    return await asyncio.to_thread(
-        client.identity.create_user, name=discord_user_id, **kwargs
+    return await run_in_pool(
+        MUTATE, client.identity.create_user, name=discord_user_id, **kwargs
     )
 
 
@@ -80,7 +247,7 @@ async def update_user(
     **kwargs,
 ):
     """Update a user in Keystone database."""
-    return await asyncio.to_thread(client.identity.update_user, user, **kwargs)
+    return await run_in_pool(MUTATE, client.identity.update_user, user, **kwargs)
 
 
 async def set_default_roles(
@@ -89,50 +256,296 @@ async def set_default_roles(
     project: openstack.identity.v3.project.Project,
 ) -> None:
     """Set default roles for a user in a project."""
-    member_role = await asyncio.to_thread(client.identity.find_role, DEFAULT_ROLE_NAME)
-    await asyncio.to_thread(
-        client.identity.assign_project_role_to_user, project, user, member_role
+    member_role = await find_role(client)
+    await run_in_pool(
+        MUTATE, client.identity.assign_project_role_to_user, project, user, member_role
     )
 
 
+# Roles and external networks are set up once per deployment
+_roles = {}
+_external_networks = {}
+
+
+async def find_role(
+    client: openstack.connection.Connection,
+    name: str = DEFAULT_ROLE_NAME,
+    refresh: bool = False,
+) -> openstack.identity.v3.role.Role:
+    """Find a role, cached for the lifetime of the process.
+
+    refresh looks the role up again, keeping the cached one if it fails.
+    """
+    role = None if refresh else _roles.get(name)
+    if role is None:
+        role = await run_in_pool(READ, client.identity.find_role, name)
+        if role is None:
+            return _roles.get(name)
+        _roles[name] = role
+    return role
+
+
+async def find_external_network(
+    client: openstack.connection.Connection,
+    name: str = DEFAULT_EXTERNAL_NETWORK,
+    refresh: bool = False,
+) -> openstack.network.v2.network.Network:
+    """Find an external network, cached for the lifetime of the process.
+
+    refresh looks the network up again, keeping the cached one if it fails.
+    """
+    network = None if refresh else _external_networks.get(name)
+    if network is None:
+        network = await run_in_pool(READ, client.network.find_network, name)
+        if network is None:
+            return _external_networks.get(name)
+        _external_networks[name] = network
+    return network
+
+
+def default_network_steps(
+    client: openstack.connection.Connection,
+) -> list[provisioning.Step]:
+    """Provisioning steps for the default network of the "project" result."""
+    return [
+        # Find default NAT project ID
+        provisioning.Step(
+            "external_network", lambda results: find_external_network(client)
+        ),
+        # Create default NAT router
+        provisioning.Step(
+            "router",
+            lambda results: run_in_pool(
+                MUTATE,
+                client.network.create_router,
+                name=DEFAULT_ROUTER_NAME,
+                project_id=results["project"].id,
+                external_gateway_info={"network_id": results["external_network"].id},
+            ),
+            requires=("project", "external_network"),
+        ),
+        # Create network
+        provisioning.Step(
+            "network",
+            lambda results: run_in_pool(
+                MUTATE,
+                client.network.create_network,
+                project_id=results["project"].id,
+                name=DEFAULT_NETWORK_NAME,
+            ),
+            requires=("project",),
+        ),
+        # Create subnet
+        provisioning.Step(
+            "subnet",
+            lambda results: run_in_pool(
+                MUTATE,
+                client.network.create_subnet,
+                network_id=results["network"].id,
+                cidr=DEFAULT_SUBNET_CIDR,
+                project_id=results["project"].id,
+                name=DEFAULT_SUBNET_NAME,
+                gateway_ip=DEFAULT_SUBNET_GATEWAY_IP,
+                dns_nameservers=DEFAULT_DNS_NAMESERVERS,
+                ip_version=DEFAULT_IP_VERSION,
+            ),
+            requires=("project", "network"),
+        ),
+        # Add router interface
+        provisioning.Step(
+            "router_interface",
+            lambda results: run_in_pool(
+                MUTATE,
+                client.network.add_interface_to_router,
+                results["router"],
+                subnet_id=results["subnet"].id,
+            ),
+            requires=("router", "subnet"),
+        ),
+    ]
+
+
 async def setup_default_network(
     client: openstack.connection.Connection,
     project: openstack.identity.v3.project.Project,
+    results: dict = None,
+    on_done: Callable[[str, object], Awaitable[None]] = None,
 ) -> None:
-    """Setup default network for a project."""
-    # Find default NAT project ID
-    external_gateway = await asyncio.to_thread(
-        client.network.find_network, DEFAULT_EXTERNAL_NETWORK
-    )
-    # Create default NAT router
-    router = await asyncio.to_thread(
-        client.network.create_router,
-        name=DEFAULT_ROUTER_NAME,
-        project_id=project.id,
-        external_gateway_info={"network_id": external_gateway.id},
+    """Setup default network for a project.
+
+    The router and the network/subnet branches are created concurrently.
+    Steps already in results, e.g. from an interrupted attempt, are skipped.
+    """
+    await provisioning.run(
+        default_network_steps(client), {**(results or {}), "project": project}, on_done
     )
 
-    # Create network
-    network = await asyncio.to_thread(
-        client.network.create_network, project_id=project.id, name=DEFAULT_NETWORK_NAME
+
+def new_user_steps(
+    client: openstack.connection.Connection,
+    discord_user_id: str,
+    project_name: str,
+    password: str,
+    on_done: Callable[[str, object], Awaitable[None]] = None,
+) -> list[provisioning.Step]:
+    """Provisioning steps for a new user, its project and default resources.
+
+    Roles, network and security group only depend on the project (and user),
+    so they run concurrently once those exist. on_done is passed on to the
+    default network steps, which run as one step here.
+    """
+    return [
+        provisioning.Step(
+            "project", lambda results: create_project(client, project_name)
+        ),
+        provisioning.Step(
+            "user",
+            lambda results: create_user(
+                client,
+                discord_user_id,
+                default_project=results["project"],
+                password=password,
+            ),
+            requires=("project",),
+        ),
+        provisioning.Step(
+            "roles",
+            lambda results: set_default_roles(
+                client, results["user"], results["project"]
+            ),
+            requires=("project", "user"),
+        ),
+        provisioning.Step(
+            "default_network",
+            lambda results: setup_default_network(
+                client, results["project"], results, on_done
+            ),
+            requires=("project",),
+        ),
+        provisioning.Step(
+            "security_group",
+            lambda results: create_security_group(client, results["project"]),
+            requires=("project",),
+        ),
+    ]
+
+
+# Steps whose completion is stored, with the resource class of their result
+STEP_RESOURCES = {
+    "project": openstack.identity.v3.project.Project,
+    "user": openstack.identity.v3.user.User,
+    "roles": None,
+    "router": openstack.network.v2.router.Router,
+    "network": openstack.network.v2.network.Network,
+    "subnet": openstack.network.v2.subnet.Subnet,
+    "router_interface": None,
+    "default_network": None,
+    "security_group": openstack.network.v2.security_group.SecurityGroup,
+}
+
+
+def resume_results(state: dict[str, str]) -> dict:
+    """Return the results of completed steps from their stored resource IDs.
+
+    Resources are rebuilt from their ID alone, without asking OpenStack.
+    """
+    results = {}
+    for name, resource_id in state.items():
+        if name not in STEP_RESOURCES:
+            continue
+        resource = STEP_RESOURCES[name]
+        results[name] = (
+            resource.existing(id=resource_id)
+            if resource is not None and resource_id is not None
+            else None
+        )
+    return results
+
+
+def project_name(discord_user_id: str) -> str:
+    """Return the project name of a Discord user."""
+    return f"{os.getenv('OS_DEFAULT_GUILD_PREFIX')}_{discord_user_id}"
+
+
+async def find_resources(
+    client: openstack.connection.Connection, discord_user_id: str, name: str
+) -> dict:
+    """Return the results of the steps a user's existing resources satisfy.
+
+    Covers users provisioned before their steps were recorded.
+    """
+    project, os_user = await asyncio.gather(
+        find_project(client, name), find_user(client, discord_user_id)
     )
+    results = {}
+    if project is not None:
+        results["project"] = project
+        network, security_group = await asyncio.gather(
+            find_default_network(client, project_id=project.id),
+            find_default_security_group(client, project_id=project.id),
+        )
+        if network is not None:
+            results["default_network"] = network
+        if security_group is not None:
+            results["security_group"] = security_group
+    if os_user is not None:
+        results["user"] = os_user
+    return results
 
-    # Create subnet
-    subnet = await asyncio.to_thread(
-        client.network.create_subnet,
-        network_id=network.id,
-        cidr=DEFAULT_SUBNET_CIDR,
-        project_id=project.id,
-        name=DEFAULT_SUBNET_NAME,
-        gateway_ip=DEFAULT_SUBNET_GATEWAY_IP,
-        dns_nameservers=DEFAULT_DNS_NAMESERVERS,
-        ip_version=DEFAULT_IP_VERSION,
+
+# Provisioning in flight, shared by a user's duplicate registrations
+provisions = concurrency.SingleFlight()
+# Commands and cohort registrations changing a user's resources take turns
+user_locks = concurrency.KeyedLock()
+
+
+async def provision_user(
+    db_session: sqlalchemy.ext.asyncio.async_sessionmaker,
+    client: openstack.connection.Connection,
+    discord_user_id: str,
+) -> dict:
+    """Provision a user and return the credential row to store.
+
+    Every completed step is recorded, so an interrupted attempt resumes from
+    the recorded steps without looking them up in OpenStack. An existing
+    Keystone user gets a new password. Callers provisioning a user who is
+    already being provisioned get the result of the attempt in flight.
+    """
+    return await provisions.run(
+        discord_user_id,
+        lambda: _provision_user(db_session, client, discord_user_id),
     )
 
-    # Add router interface
-    await asyncio.to_thread(
-        client.network.add_interface_to_router, router, subnet_id=subnet.id
+
+async def _provision_user(
+    db_session: sqlalchemy.ext.asyncio.async_sessionmaker,
+    client: openstack.connection.Connection,
+    discord_user_id: str,
+) -> dict:
+    """Run the provisioning steps of a user."""
+    name = project_name(discord_user_id)
+    password = utils.generate_password()
+    results = resume_results(
+        await database.find_provisioning_state(db_session, discord_user_id)
+    )
+    if "project" not in results or "user" not in results:
+        results = {**await find_resources(client, discord_user_id, name), **results}
+    if "user" in results:
+        await update_user(client, results["user"], password=password)
+
+    async def record(step: str, result) -> None:
+        if step in STEP_RESOURCES:
+            resource_id = result.id if STEP_RESOURCES[step] is not None else None
+            await database.record_provisioning_step(
+                db_session, discord_user_id, step, resource_id
+            )
+
+    await provisioning.run(
+        new_user_steps(client, discord_user_id, name, password, record),
+        results,
+        record,
     )
+    return {"username": discord_user_id, "password": password, "project_name": name}
 
 
 async def find_default_network(
@@ -141,8 +554,12 @@ async def find_default_network(
 ) -> openstack.network.v2.network.Network:
     """Find default network for a project."""
 
-    return await asyncio.to_thread(
-        client.network.find_network, DEFAULT_NETWORK_NAME, ignore_missing=True, **kwargs
+    return await run_in_pool(
+        READ,
+        client.network.find_network,
+        DEFAULT_NETWORK_NAME,
+        ignore_missing=True,
+        **kwargs,
     )
 
 
@@ -151,7 +568,8 @@ async def create_security_group(
     project: openstack.identity.v3.project.Project,
 ) -> openstack.network.v2.security_group.SecurityGroup:
     """Create a new security group for a project."""
-    return await asyncio.to_thread(
+    return await run_in_pool(
+        MUTATE,
         client.network.create_security_group,
         name=DEFAULT_SG_NAME,
         project_id=project.id,
@@ -164,15 +582,15 @@ async def add_security_group_rule(
     direction: str = DEFAULT_SG_DIRECTION,
 ) -> None:
     """Setup default security group for a project."""
-    # Find security group
-    security_group = await asyncio.to_thread(
-        client.network.find_security_group,
-        DEFAULT_SG_NAME,
-    )
+    # Find security group, usually already in the project's snapshot
+    security_group = (
+        await resource_cache.get(client, ("security_group",))
+    ).security_group
 
     # Create security group rule
     try:
-        await asyncio.to_thread(
+        await run_in_pool(
+            MUTATE,
             client.network.create_security_group_rule,
             security_group_id=security_group.id,
             direction=direction,
@@ -190,8 +608,12 @@ async def find_default_security_group(
     **kwargs,
 ) -> openstack.network.v2.security_group.SecurityGroup:
     """Find default security group for a project."""
-    return await asyncio.to_thread(
-        client.network.find_security_group, DEFAULT_SG_NAME, **kwargs
+    if async_reads():
+        return await get_async_client(client).find_security_group(
+            DEFAULT_SG_NAME, **kwargs
+        )
+    return await run_in_pool(
+        READ, client.network.find_security_group, DEFAULT_SG_NAME, **kwargs
     )
 
 
@@ -200,14 +622,17 @@ async def find_floating_ip(
     **kwargs,
 ) -> openstack.network.v2.floating_ip.FloatingIP:
     """Retrun the first available floating IP"""
-    return await asyncio.to_thread(client.available_floating_ip, **kwargs)
+    return await run_in_pool(MUTATE, client.available_floating_ip, **kwargs)
 
 
 async def find_keypair(
     client: openstack.connection.Connection,
 ) -> openstack.compute.v2.keypair.Keypair:
     """Find a keypair in a project."""
-    return await asyncio.to_thread(
+    if async_reads():
+        return await get_async_client(client).find_keypair(DEFAULT_KEYPAIR_NAME)
+    return await run_in_pool(
+        READ,
         client.compute.find_keypair,
         DEFAULT_KEYPAIR_NAME,
         ignore_missing=True,
@@ -220,14 +645,17 @@ async def create_keypair(
 ) -> None:
     """Create a new keypair for a project."""
     try:
-        await asyncio.to_thread(
+        keypair = await run_in_pool(
+            MUTATE,
             client.compute.create_keypair,
             name=DEFAULT_KEYPAIR_NAME,
             public_key=public_key,
             type=DEFAULT_KEYPAIR_TYPE,
         )
     except openstack.exceptions.BadRequestException as e:
+        resource_cache.invalidate(client, "keypair")
         raise Exception(e.details)
+    resource_cache.set(client, "keypair", keypair)
 
 
 async def delete_keypair(
@@ -235,23 +663,119 @@ async def delete_keypair(
     keypair: openstack.compute.v2.keypair.Keypair,
 ) -> None:
     """Delete a keypair from a project."""
-    await asyncio.to_thread(client.compute.delete_keypair, keypair)
+    await run_in_pool(MUTATE, client.compute.delete_keypair, keypair)
+    resource_cache.set(client, "keypair", None)
+
+
+async def stream(
+    list_resources: Callable[..., Iterator],
+    page_size: int = DEFAULT_PAGE_SIZE,
+    **query,
+) -> AsyncIterator:
+    """Yield the resources of an SDK listing, one page per pool call.
+
+    The SDK generator fetches the next page only when it runs dry, so pulling
+    page_size items at a time issues exactly one request per page.
+    """
+    resources = list_resources(limit=page_size, **query)
+    while True:
+        page = await run_in_pool(
+            READ, lambda: list(itertools.islice(resources, page_size))
+        )
+        for resource in page:
+            yield resource
+        if len(page) < page_size:
+            return
+
+
+async def name_contains(
+    resources: AsyncIterator, query: str = None, limit: int = None
+) -> AsyncIterator:
+    """Yield the resources whose name contains query, stopping after limit."""
+    query = (query or "").lower()
+    found = 0
+    async with contextlib.aclosing(resources):
+        async for resource in resources:
+            if query in (resource.name or "").lower():
+                yield resource
+                found += 1
+                if found == limit:
+                    # Closing the listing skips the pages not fetched yet
+                    return
+
+
+def iter_flavors(
+    client: openstack.connection.Connection,
+    query: str = None,
+    limit: int = None,
+) -> AsyncIterator[openstack.compute.v2.flavor.Flavor]:
+    """Yield flavors by name whose name contains query, fetched page by page.
+
+    Nova cannot filter flavors by name, so names are matched here, but the
+    listing is sorted server-side and stops as soon as limit flavors match.
+    """
+    query_params = {"sort_key": "name", "sort_dir": "asc"}
+    if async_reads():
+        flavors = get_async_client(client).flavors(**query_params)
+    else:
+        flavors = stream(client.compute.flavors, **query_params)
+    return name_contains(flavors, query, limit)
+
+
+def iter_images(
+    client: openstack.connection.Connection,
+    query: str = None,
+    limit: int = None,
+) -> AsyncIterator[openstack.image.v2.image.Image]:
+    """Yield active images by name whose name contains query, page by page.
+
+    Glance only filters names exactly, so only the status filter and the
+    sort are pushed server-side and names are matched here.
+    """
+    query_params = {"status": "active", "sort_key": "name", "sort_dir": "asc"}
+    if async_reads():
+        images = get_async_client(client).images(**query_params)
+    else:
+        images = stream(client.image.images, **query_params)
+    return name_contains(images, query, limit)
 
 
 async def list_flavors(
     client: openstack.connection.Connection,
 ) -> list[openstack.compute.v2.flavor.Flavor]:
     """List all flavors."""
-    flavors = await asyncio.to_thread(client.compute.flavors)
-    return [flavor for flavor in flavors]
+    return [flavor async for flavor in iter_flavors(client)]
 
 
 async def list_images(
     client: openstack.connection.Connection,
 ) -> list[openstack.image.v2.image.Image]:
-    """List all images."""
-    images = await asyncio.to_thread(client.image.images)
-    return [image for image in images]
+    """List all active images."""
+    return [image async for image in iter_images(client)]
+
+
+async def find_flavor(
+    client: openstack.connection.Connection,
+    flavor_id: str,
+) -> openstack.compute.v2.flavor.Flavor:
+    """Find a flavor by name or ID."""
+    return await run_in_pool(
+        READ, client.compute.find_flavor, flavor_id, ignore_missing=True
+    )
+
+
+def uses_flavor(
+    server: openstack.compute.v2.server.Server,
+    flavor: openstack.compute.v2.flavor.Flavor,
+) -> bool:
+    """Return whether a server runs on a flavor.
+
+    Newer compute microversions embed the flavor without its ID, so fall
+    back to comparing names.
+    """
+    if server.flavor.id is not None:
+        return server.flavor.id == flavor.id
+    return (server.flavor.original_name or server.flavor.name) == flavor.name
 
 
 async def find_server(
@@ -262,7 +786,10 @@ async def find_server(
     """Find a server in a project."""
     if name is None:
         name = DEFAULT_SERVER_NAME
-    return await asyncio.to_thread(
+    if async_reads():
+        return await get_async_client(client).find_server(name, **kwargs)
+    return await run_in_pool(
+        READ,
         client.compute.find_server,
         name,
         ignore_missing=True,
@@ -276,6 +803,204 @@ async def create_server(
     """Create a new server in a project."""
     name = kwargs.pop("name", DEFAULT_SERVER_NAME)
     try:
-        return await asyncio.to_thread(client.create_server, name=name, **kwargs)
+        server = await run_in_pool(
+            WAIT if kwargs.get("wait") else MUTATE,
+            client.create_server,
+            name=name,
+            **kwargs,
+        )
     except openstack.exceptions.BadRequestException as e:
         raise Exception(e.details)
+    resource_cache.set(client, "server", server)
+    return server
+
+
+async def get_server(
+    client: openstack.connection.Connection,
+    server: openstack.compute.v2.server.Server,
+) -> openstack.compute.v2.server.Server:
+    """Refresh a server from Nova."""
+    return await run_in_pool(READ, client.compute.get_server, server)
+
+
+async def wait_for_server(
+    client: openstack.connection.Connection,
+    server: openstack.compute.v2.server.Server,
+    status: str = "ACTIVE",
+    progress: Callable[[openstack.compute.v2.server.Server], Awaitable] = None,
+    interval: float = DEFAULT_POLL_INTERVAL,
+    max_interval: float = DEFAULT_POLL_MAX_INTERVAL,
+    timeout: float = DEFAULT_POLL_TIMEOUT,
+) -> openstack.compute.v2.server.Server:
+    """Poll a server until it reaches status, backing off between checks.
+
+    Unlike wait=True, no worker thread is held while Nova builds the server;
+    each check is one short GET. progress is awaited whenever the status or
+    task state changes.
+    """
+    deadline = asyncio.get_running_loop().time() + timeout
+    last_state = None
+    while True:
+        server = await get_server(client, server)
+        state = (server.status, getattr(server, "task_state", None))
+        if state != last_state and progress is not None:
+            await progress(server)
+        last_state = state
+        if server.status == status:
+            resource_cache.set(client, "server", server)
+            return server
+        if server.status == "ERROR":
+            fault = getattr(server, "fault", None) or {}
+            raise Exception(fault.get("message", f"Server {server.name} failed."))
+        if asyncio.get_running_loop().time() + interval > deadline:
+            raise Exception(f"Server {server.name} is still {server.status}.")
+        await asyncio.sleep(interval)
+        interval = min(interval * 1.5, max_interval)
+
+
+async def add_floating_ip(
+    client: openstack.connection.Connection,
+    server: openstack.compute.v2.server.Server,
+) -> openstack.compute.v2.server.Server:
+    """Attach a floating IP to a server, reusing a free one if possible."""
+    server = await run_in_pool(
+        WAIT, client.add_ips_to_server, server, auto_ip=True, reuse=True, wait=True
+    )
+    resource_cache.set(client, "server", server)
+    return server
+
+
+async def rebuild_server(
+    client: openstack.connection.Connection,
+    server: openstack.compute.v2.server.Server,
+    image_id: str,
+) -> openstack.compute.v2.server.Server:
+    """Rebuild a server from an image, keeping its IPs."""
+    resource_cache.invalidate(client, "server")
+    try:
+        return await run_in_pool(
+            MUTATE, client.compute.rebuild_server, server, image=image_id
+        )
+    except openstack.exceptions.BadRequestException as e:
+        raise Exception(e.details)
+
+
+async def resize_server(
+    client: openstack.connection.Connection,
+    server: openstack.compute.v2.server.Server,
+    flavor_id: str,
+) -> None:
+    """Start resizing a server to another flavor."""
+    resource_cache.invalidate(client, "server")
+    try:
+        await run_in_pool(MUTATE, client.compute.resize_server, server, flavor_id)
+    except openstack.exceptions.BadRequestException as e:
+        raise Exception(e.details)
+
+
+async def confirm_server_resize(
+    client: openstack.connection.Connection,
+    server: openstack.compute.v2.server.Server,
+) -> None:
+    """Confirm a finished resize."""
+    resource_cache.invalidate(client, "server")
+    await run_in_pool(MUTATE, client.compute.confirm_server_resize, server)
+
+
+async def find_image_user(
+    client: openstack.connection.Connection,
+    image_id: str,
+) -> str:
+    """Return the login user of an image.
+
+    Uses the os_admin_user property if the image sets one, otherwise the
+    distribution name, which is the default user of most cloud images.
+    """
+    image = await run_in_pool(READ, client.image.find_image, image_id)
+    if image is None:
+        return DEFAULT_IMAGE_USER
+    properties = image.properties or {}
+    return (
+        properties.get("os_admin_user")
+        or getattr(image, "os_distro", None)
+        or DEFAULT_IMAGE_USER
+    )
+
+
+class ProjectResources:
+    """The resources of a project that commands look up together."""
+
+    __slots__ = ("server", "keypair", "security_group")
+
+    def __init__(self, server=None, keypair=None, security_group=None):
+        """Initialise the snapshot."""
+        self.server = server
+        self.keypair = keypair
+        self.security_group = security_group
+
+
+# How each resource of a snapshot is looked up
+RESOURCE_LOOKUPS = {
+    "server": lambda client: find_server(client),
+    "keypair": lambda client: find_keypair(client),
+    "security_group": lambda client: find_default_security_group(client),
+}
+
+
+class ResourceCache:
+    """A short-lived snapshot of each project's server, keypair and security group.
+
+    Missing or expired resources are looked up concurrently in one fan-out,
+    instead of one round-trip after the other. The bot's own changes write
+    through with set or invalidate, so the TTL only bounds how long changes
+    made outside the bot (e.g. in Horizon) go unnoticed. Entries are keyed
+    by connection, i.e. per (user, project), and go away with it.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_RESOURCE_TTL):
+        """Initialise an empty cache. A ttl of 0 disables caching."""
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = weakref.WeakKeyDictionary()
+
+    async def get(
+        self,
+        client: openstack.connection.Connection,
+        names: tuple[str, ...] = tuple(RESOURCE_LOOKUPS),
+    ) -> ProjectResources:
+        """Return a snapshot of the named resources of the client's project."""
+        entry = self._entries.setdefault(client, {})
+        now = time.monotonic()
+        missing = [name for name in names if name not in entry or entry[name][1] <= now]
+        self.hits += len(names) - len(missing)
+        self.misses += len(missing)
+        values = await asyncio.gather(
+            *(RESOURCE_LOOKUPS[name](client) for name in missing)
+        )
+        expires_at = time.monotonic() + self.ttl
+        for name, value in zip(missing, values):
+            entry[name] = (value, expires_at)
+        return ProjectResources(**{name: entry[name][0] for name in names})
+
+    def set(self, client: openstack.connection.Connection, name: str, value) -> None:
+        """Store a resource the bot has just created or changed."""
+        self._entries.setdefault(client, {})[name] = (
+            value,
+            time.monotonic() + self.ttl,
+        )
+
+    def invalidate(self, client: openstack.connection.Connection, *names) -> None:
+        """Forget some resources of a project, or all of them."""
+        entry = self._entries.get(client)
+        if entry is None:
+            return
+        for name in names or list(entry):
+            entry.pop(name, None)
+
+
+resource_cache = ResourceCache()
+
+
+# Time every OpenStack helper; pool waits are attributed by the executor
+tracing.instrument(globals(), exclude=("run_in_pool",))
@@ -0,0 +1,137 @@
+# Bulk registration of whole classes
+import argparse
+import asyncio
+import os
+import re
+import sys
+
+import openstack
+import sqlalchemy
+from dotenv import load_dotenv
+
+from midgard_discord import cloud
+from midgard_discord import database
+
+
+DEFAULT_COHORT_CONCURRENCY = 8
+DISCORD_ID = re.compile(r"\d{15,20}")
+
+
+def parse_discord_ids(text: str) -> list[str]:
+    """Return the unique Discord IDs in text, e.g. mentions or pasted IDs."""
+    return list(dict.fromkeys(DISCORD_ID.findall(text)))
+
+
+class CohortReport:
+    """What a bulk registration did for each Discord user."""
+
+    def __init__(self):
+        """Initialise an empty report."""
+        self.registered = []
+        self.existing = []
+        self.failed = {}
+
+    def __repr__(self) -> str:
+        """Return the representation of the report."""
+        return (
+            f"<CohortReport {len(self.registered)} registered, "
+            f"{len(self.existing)} existing, {len(self.failed)} failed>"
+        )
+
+
+async def register_cohort(
+    db_session: sqlalchemy.ext.asyncio.async_sessionmaker,
+    client: openstack.connection.Connection,
+    discord_user_ids: list[str],
+    concurrency: int = DEFAULT_COHORT_CONCURRENCY,
+) -> CohortReport:
+    """Register many Discord users, at most concurrency at a time.
+
+    Users already in the database are skipped and a failure only affects
+    its own user, so the same list can simply be submitted again. The
+    credentials of every provisioned user are written in one statement.
+    """
+    report = CohortReport()
+    semaphore = asyncio.Semaphore(concurrency)
+    rows = []
+
+    async def register(discord_user_id: str) -> None:
+        async with semaphore, cloud.user_locks(discord_user_id):
+            try:
+                # The user may have registered since the cohort started
+                if await database.find_user(db_session, discord_user_id) is not None:
+                    report.existing.append(discord_user_id)
+                    return
+                rows.append(
+                    await cloud.provision_user(db_session, client, discord_user_id)
+                )
+            except Exception as e:
+                report.failed[discord_user_id] = str(e)
+
+    users = await database.find_users(db_session, discord_user_ids)
+    report.existing = [
+        discord_user_id for discord_user_id, user in users.items() if user is not None
+    ]
+    await asyncio.gather(
+        *(
+            register(discord_user_id)
+            for discord_user_id, user in users.items()
+            if user is None
+        )
+    )
+    # A user who registered themselves before this write holds a newer
+    # password, which is kept. Provisioned users without a stored password
+    # are picked up again, with a new password, by the next run if it fails
+    await database.insert_users(db_session, rows)
+    report.registered = [row["username"] for row in rows]
+    return report
+
+
+async def run(discord_user_ids: list[str], concurrency: int) -> CohortReport:
+    """Register a cohort with the connections configured in the environment."""
+    db_engine, db_session = database.create_engine(os.getenv("DB_URI"))
+    client = cloud.connect()
+    try:
+        await database.create_schema(db_engine)
+        return await register_cohort(db_session, client, discord_user_ids, concurrency)
+    finally:
+        client.close()
+        cloud.close_executors()
+        await db_engine.dispose()
+
+
+def main():
+    """Register the Discord IDs read from files or standard input."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument(
+        "files",
+        nargs="*",
+        type=argparse.FileType("r"),
+        default=[sys.stdin],
+        help="files of Discord IDs or mentions, standard input by default",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_COHORT_CONCURRENCY,
+        help="users provisioned at the same time",
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    discord_user_ids = parse_discord_ids(" ".join(f.read() for f in args.files))
+    report = asyncio.run(run(discord_user_ids, args.concurrency))
+
+    for discord_user_id in report.registered:
+        print(f"registered {discord_user_id}")
+    for discord_user_id in report.existing:
+        print(f"existing {discord_user_id}")
+    for discord_user_id, error in report.failed.items():
+        print(f"failed {discord_user_id}: {error}")
+    print(report)
+    sys.exit(1 if report.failed else 0)
+
+
+if __name__ == "__main__":
+    """Run main function"""
+    main()
@@ -1,16 +1,44 @@
 # Internal commands module for Midgard Discord Bot
+import functools
 import os
+import time
 import interactions
 import openstack
 import sqlalchemy
 
 from midgard_discord import cloud
+from midgard_discord import cohort
+from midgard_discord import concurrency
 from midgard_discord import database
+from midgard_discord import jobs
 from midgard_discord import networking
 from midgard_discord import texts
 from midgard_discord import utils
 
 
+# Registrations in flight, whose outcome every duplicate click shares
+registrations = concurrency.SingleFlight()
+# Jobs that build a server, one at a time per user
+SERVER_JOBS = ("server create", "server rebuild")
+# Seconds a command's interaction token can answer, 15 minutes less a margin
+INTERACTION_TTL = 15 * 60 - 30
+
+
+def one_at_a_time(handler):
+    """Run a command once the user's other mutating commands have finished.
+
+    A double-clicked command then finds what the first click did, instead
+    of racing it to create the same resources.
+    """
+
+    @functools.wraps(handler)
+    async def wrapper(ctx: interactions.CommandContext, *args, **kwargs):
+        async with cloud.user_locks(str(ctx.author.user.id)):
+            return await handler(ctx, *args, **kwargs)
+
+    return wrapper
+
+
 async def help(ctx: interactions.CommandContext):
     """Send a welcome message."""
     await ctx.send(texts.WELCOME, suppress_embeds=True)
@@ -21,52 +49,16 @@ async def register(
     db_session: sqlalchemy.ext.asyncio.async_sessionmaker,
     os_client: openstack.connection.Connection,
 ):
-    """Register a user to Midgard."""
-    user = await database.find_user(db_session, str(ctx.author.user.id))
-
-    project_name = f"{os.getenv('OS_DEFAULT_GUILD_PREFIX')}_{ctx.author.user.id}"
-    # If we miss the cache, check the database
-    if user is None:
-        os_user = await cloud.find_user(os_client, str(ctx.author.user.id))
-        # If we miss the database, create the user
-        if os_user is None:
-            # Create user and project in OpenStack
-            os_project = await cloud.create_project(os_client, project_name)
-            user_password = utils.generate_password()
-            os_user = await cloud.create_user(
-                os_client,
-                str(ctx.author.user.id),
-                default_project=os_project,
-                password=user_password,
-            )
-
-            # # Set roles
-            await cloud.set_default_roles(os_client, os_user, os_project)
+    """Register a user to Midgard.
 
-            # Setup default network
-            await cloud.setup_default_network(os_client, os_project)
-
-            # Create security group
-            await cloud.create_security_group(os_client, os_project)
-
-            # Cache user in database
-            await database.create_user(
-                db_session,
-                str(ctx.author.user.id),
-                password=user_password,
-                project_name=project_name,
-            )
-        # If we find the user in OpenStack, reset the password and cache it in database
-        else:
-            user_password = utils.generate_password()
-            await cloud.update_user(os_client, os_user, password=user_password)
-            project = await cloud.find_project(os_client, project_name)
-            await database.create_user(
-                db_session,
-                str(ctx.author.user.id),
-                password=user_password,
-                project_name=project.name,
-            )
+    Clicks made while the user's registration is in flight get its reply.
+    """
+    discord_user_id = str(ctx.author.user.id)
+    registered = await registrations.run(
+        discord_user_id,
+        lambda: register_user(db_session, os_client, discord_user_id),
+    )
+    if registered:
         await ctx.send(
             texts.REGISTERED.format(discord_user_id=ctx.author.user.id),
             suppress_embeds=True,
@@ -78,9 +70,99 @@ async def register(
         )
 
 
+async def register_user(
+    db_session: sqlalchemy.ext.asyncio.async_sessionmaker,
+    os_client: openstack.connection.Connection,
+    discord_user_id: str,
+) -> bool:
+    """Register a user unless already registered, and tell whether it was."""
+    async with cloud.user_locks(discord_user_id):
+        if await database.find_user(db_session, discord_user_id) is not None:
+            return False
+        # If we miss the cache and the database, provision the user, resuming
+        # any earlier attempt, and store its new password in the database,
+        # over any older one a cohort registration wrote meanwhile
+        row = await cloud.provision_user(db_session, os_client, discord_user_id)
+        await database.upsert_users(db_session, [row])
+        return True
+
+
+async def register_cohort(
+    ctx: interactions.CommandContext,
+    db_session: sqlalchemy.ext.asyncio.async_sessionmaker,
+    os_client: openstack.connection.Connection,
+    users: str,
+):
+    """Register every user mentioned or listed by ID in users."""
+    discord_user_ids = cohort.parse_discord_ids(users)
+    if not discord_user_ids:
+        return await ctx.send(
+            texts.ERROR_NO_DISCORD_IDS.format(discord_user_id=ctx.author.user.id),
+            suppress_embeds=True,
+        )
+    report = await cohort.register_cohort(
+        db_session,
+        os_client,
+        discord_user_ids,
+        concurrency=utils.getenv_int(
+            "COHORT_CONCURRENCY", cohort.DEFAULT_COHORT_CONCURRENCY
+        ),
+    )
+    message = texts.COHORT_REGISTERED.format(
+        discord_user_id=ctx.author.user.id,
+        registered=len(report.registered),
+        existing=len(report.existing),
+        failed=len(report.failed),
+    )
+    # Keep the report within a Discord message
+    for failed_user_id, error in list(report.failed.items())[:20]:
+        message += texts.COHORT_FAILED.format(
+            failed_user_id=failed_user_id, error=error
+        )
+    await ctx.send(message, suppress_embeds=True)
+    return report
+
+
+def format_latencies(title: str, histograms: dict[str, dict]) -> list[str]:
+    """Render latency histograms as aligned lines in milliseconds."""
+    lines = [f"{title} (count p50/p95/p99 ms)"]
+    for name, h in histograms.items():
+        percentiles = "/".join(f"{h[q] * 1000:.0f}" for q in ("p50", "p95", "p99"))
+        lines.append(f"  {name:<32} {h['count']:>6} {percentiles}")
+    return lines
+
+
+async def stats(ctx: interactions.CommandContext, snapshot: dict):
+    """Send latency histograms, pool saturation and cache metrics."""
+    lines = format_latencies("Commands", snapshot["commands"])
+    lines += format_latencies("Slowest operations", snapshot["operations"])
+    lines += format_latencies("Pool queue waits", snapshot["waits"])
+    lines.append("Pools (running/workers queued blocked rejected)")
+    for name, pool in snapshot["pools"].items():
+        lines.append(
+            f"  {name:<32} {pool['running']}/{pool['workers']} {pool['queued']} "
+            f"{pool['blocked']} {pool['rejected']}"
+        )
+    cache = snapshot["credential_cache"]
+    lines.append(
+        f"Credential cache: {cache['hits']} hits, {cache['misses']} misses, "
+        f"{cache['size']} cached"
+    )
+    lines.append(
+        "Warm-up: "
+        + ", ".join(f"{name} {status}" for name, status in snapshot["warmup"].items())
+    )
+    await ctx.send(
+        texts.STATS.format(discord_user_id=ctx.author.user.id, stats="\n".join(lines)),
+        ephemeral=True,
+        suppress_embeds=True,
+    )
+
+
+@one_at_a_time
 async def add_keypair(
     ctx: interactions.CommandContext,
-    user: database.OpenStackCredential,
+    user: sqlalchemy.Row,
     os_client: openstack.connection.Connection,
     public_key: str,
 ):
@@ -91,7 +173,7 @@ async def add_keypair(
             suppress_embeds=True,
         )
     else:
-        keypair = await cloud.find_keypair(os_client)
+        keypair = (await cloud.resource_cache.get(os_client, ("keypair",))).keypair
         # Create a new keypair if it doesn't exist
         if keypair is None:
             try:
@@ -117,7 +199,7 @@ async def add_keypair(
 
 async def add_cname(
     ctx: interactions.CommandContext,
-    user: database.OpenStackCredential,
+    user: sqlalchemy.Row,
     os_client: openstack.connection.Connection,
     hostname: str,
     port: int,
@@ -129,22 +211,20 @@ async def add_cname(
         return await ctx.send(
             texts.ERROR_NOT_REGISTERED.format(discord_user_id=ctx.author.user.id)
         )
-    server = await cloud.find_server(os_client)
+    server = (await cloud.resource_cache.get(os_client, ("server",))).server
     if server is None:
         return await ctx.send(
             texts.ERROR_SERVER_NOT_FOUND.format(discord_user_id=ctx.author.user.id),
             suppress_embeds=True,
         )
     try:
-        tunnels = await networking.get_tunnel_config()
         public_ip = [
             ip["addr"]
             for ip in server.addresses["default"]
             if ip["OS-EXT-IPS:type"] == "floating"
         ][0]
         service = f"{protocol}://{public_ip}:{port}"
-        networking.add_tunnel_config(tunnels, service, hostname)
-        await networking.update_tunnel_config(tunnels)
+        await networking.add_ingress(service, hostname)
         await networking.create_dns_record(hostname)
         await ctx.send(
             texts.CNAME_ADDED.format(discord_user_id=ctx.author.user.id),
@@ -157,7 +237,7 @@ async def add_cname(
 
 async def add_portforward(
     ctx: interactions.CommandContext,
-    user: database.OpenStackCredential,
+    user: sqlalchemy.Row,
     os_client: openstack.connection.Connection,
     port: int,
     protocol: str = "http",
@@ -168,14 +248,15 @@ async def add_portforward(
             texts.ERROR_NOT_REGISTERED.format(discord_user_id=ctx.author.user.id),
             suppress_embeds=True,
         )
-    server = await cloud.find_server(os_client)
+    # The security group rule below reuses the same snapshot
+    resources = await cloud.resource_cache.get(os_client, ("server", "security_group"))
+    server = resources.server
     if server is None:
         return await ctx.send(
             texts.ERROR_SERVER_NOT_FOUND.format(discord_user_id=ctx.author.user.id),
             suppress_embeds=True,
         )
     try:
-        tunnels = await networking.get_tunnel_config()
         await cloud.add_security_group_rule(os_client, port)
         public_ip = [
             ip["addr"]
@@ -184,8 +265,7 @@ async def add_portforward(
         ][0]
         service = f"{protocol}://{public_ip}:{port}"
         hostname = f"{user.username}-{protocol}-{port}.{os.getenv('CF_DOMAIN')}"
-        networking.add_tunnel_config(tunnels, service, hostname)
-        await networking.update_tunnel_config(tunnels)
+        await networking.add_ingress(service, hostname)
         await networking.create_dns_record(hostname)
         await ctx.send(
             texts.PORT_FORWARDED.format(
@@ -203,54 +283,158 @@ async def add_portforward(
         await ctx.send(f"<@{ctx.author.user.id}> {e}")
 
 
+@one_at_a_time
 async def create_server(
     ctx: interactions.CommandContext,
-    user: database.OpenStackCredential,
+    user: sqlalchemy.Row,
     os_client: openstack.connection.Connection,
     flavor_id: str,
     image_id: str,
 ):
-    """Create a server."""
+    """Create a server.
+
+    The checks run inline, the build runs as a background job that reports
+    progress in the deferred response and mentions the user when done.
+    """
     if user is None:
         return await ctx.send(
             texts.ERROR_NOT_REGISTERED.format(discord_user_id=ctx.author.user.id),
             suppress_embeds=True,
         )
-    server = await cloud.find_server(os_client)
+    # The build of a server carries on after its command answered
+    if any(
+        job.name in SERVER_JOBS
+        for job in jobs.get_queue().jobs(str(ctx.author.user.id))
+    ):
+        return await ctx.send(
+            texts.ERROR_JOB_IN_PROGRESS.format(discord_user_id=ctx.author.user.id),
+            suppress_embeds=True,
+        )
+    # Server, keypair and security group are looked up in one fan-out
+    resources = await cloud.resource_cache.get(os_client)
+    server = resources.server
     if server is not None:
-        public_ip = [
+        public_ips = [
             ip["addr"]
-            for ip in server.addresses["default"]
+            for ip in (server.addresses or {}).get("default", [])
             if ip["OS-EXT-IPS:type"] == "floating"
-        ][0]
+        ]
+        if server.status != "ACTIVE" or not public_ips:
+            return await ctx.send(
+                texts.ERROR_SERVER_BUILDING.format(
+                    discord_user_id=ctx.author.user.id,
+                    server_name=server.name,
+                    status=server.status,
+                ),
+                suppress_embeds=True,
+            )
         return await ctx.send(
             texts.ERROR_SERVER_ALREADY_EXISTS.format(
                 discord_user_id=ctx.author.user.id,
                 server_name=server.name,
-                server_ip=public_ip,
+                server_ip=public_ips[0],
                 hostname=f"{ctx.author.user.id}-ssh.{os.getenv('CF_DOMAIN')}",
             ),
             suppress_embeds=True,
         )
-    keypair = await cloud.find_keypair(os_client)
+    keypair = resources.keypair
     if keypair is None:
         return await ctx.send(
             texts.ERROR_KEYPAIR_NOT_FOUND.format(discord_user_id=ctx.author.user.id),
             suppress_embeds=True,
         )
+    started = time.monotonic()
+    try:
+        job = jobs.get_queue().submit(
+            str(ctx.author.user.id),
+            "server create",
+            lambda job: create_server_job(
+                ctx,
+                user,
+                os_client,
+                keypair,
+                resources.security_group,
+                flavor_id,
+                image_id,
+                started=started,
+            ),
+        )
+    except jobs.JobLimitError:
+        return await ctx.send(
+            texts.ERROR_JOB_IN_PROGRESS.format(discord_user_id=ctx.author.user.id),
+            suppress_embeds=True,
+        )
+    await ctx.send(
+        texts.SERVER_CREATING.format(discord_user_id=ctx.author.user.id),
+        suppress_embeds=True,
+    )
+    return job
+
+
+async def follow_up(
+    ctx: interactions.CommandContext, started: float, content: str, **kwargs
+) -> None:
+    """Send a job's reply through the interaction, or through the channel
+    once the interaction token, issued at started, has expired."""
+    if time.monotonic() < started + INTERACTION_TTL:
+        await ctx.send(content, **kwargs)
+    else:
+        channel = await ctx.get_channel()
+        await channel.send(content)
+
+
+def report_progress(ctx: interactions.CommandContext, started: float):
+    """Return a callback that shows a server's build state in the response,
+    while the interaction token issued at started lasts."""
+
+    async def progress(server: openstack.compute.v2.server.Server) -> None:
+        if time.monotonic() >= started + INTERACTION_TTL:
+            return
+        try:
+            await ctx.edit(
+                texts.SERVER_PROGRESS.format(
+                    discord_user_id=ctx.author.user.id,
+                    server_name=server.name,
+                    status=server.status,
+                    task_state=getattr(server, "task_state", None) or "-",
+                ),
+                suppress_embeds=True,
+            )
+        except Exception as e:
+            # Progress is best effort, the job carries on regardless
+            print(e)
+
+    return progress
+
+
+async def create_server_job(
+    ctx: interactions.CommandContext,
+    user: sqlalchemy.Row,
+    os_client: openstack.connection.Connection,
+    keypair: openstack.compute.v2.keypair.Keypair,
+    security_group: openstack.network.v2.security_group.SecurityGroup,
+    flavor_id: str,
+    image_id: str,
+    started: float = None,
+):
+    """Build a server, then expose it over SSH through the tunnel.
+
+    started is when the command was received, time.monotonic() by default.
+    """
+    started = time.monotonic() if started is None else started
     try:
-        security_group = await cloud.find_default_security_group(os_client)
         server = await cloud.create_server(
             os_client,
             key_name=keypair.name,
             flavor=flavor_id,
             image=image_id,
-            auto_ip=True,
             security_groups=[security_group.name],
-            reuse_ips=True,
-            wait=True,
+            wait=False,
+        )
+        server = await cloud.wait_for_server(
+            os_client, server, progress=report_progress(ctx, started)
         )
-        tunnels = await networking.get_tunnel_config()
+        server = await cloud.add_floating_ip(os_client, server)
         await cloud.add_security_group_rule(os_client, 22)
         public_ip = [
             ip["addr"]
@@ -259,24 +443,26 @@ async def create_server(
         ][0]
         service = f"ssh://{public_ip}:22"
         hostname = f"{user.username}-ssh.{os.getenv('CF_DOMAIN')}"
-        networking.add_tunnel_config(tunnels, service, hostname)
-        await networking.update_tunnel_config(tunnels)
+        await networking.add_ingress(service, hostname)
         await networking.create_dns_record(hostname)
-        await ctx.send(
+        await follow_up(
+            ctx,
+            started,
             texts.SERVER_CREATED.format(
                 discord_user_id=ctx.author.user.id,
                 server_name=server.name,
+                image_user=await cloud.find_image_user(os_client, image_id),
                 hostname=hostname,
             ),
             suppress_embeds=True,
         )
     except Exception as e:
-        await ctx.send(f"<@{ctx.author.user.id}> {e}")
+        await follow_up(ctx, started, f"<@{ctx.author.user.id}> {e}")
 
 
 async def rebuild_server(
     ctx: interactions.CommandContext,
-    user: database.OpenStackCredential,
+    user: sqlalchemy.Row,
     os_client: openstack.connection.Connection,
     flavor_id: str,
     image_id: str,
@@ -287,19 +473,71 @@ async def rebuild_server(
             texts.ERROR_NOT_REGISTERED.format(discord_user_id=ctx.author.user.id),
             suppress_embeds=True,
         )
-    server = await cloud.find_server(os_client)
+    server = (await cloud.resource_cache.get(os_client, ("server",))).server
     if server is None:
         return await ctx.send(
             texts.ERROR_SERVER_NOT_FOUND.format(discord_user_id=ctx.author.user.id),
             suppress_embeds=True,
         )
+    started = time.monotonic()
     try:
-        await cloud.rebuild_server(os_client, flavor_id, image_id)
-        await ctx.send(
+        job = jobs.get_queue().submit(
+            str(ctx.author.user.id),
+            "server rebuild",
+            lambda job: rebuild_server_job(
+                ctx, user, os_client, server, flavor_id, image_id, started=started
+            ),
+        )
+    except jobs.JobLimitError:
+        return await ctx.send(
+            texts.ERROR_JOB_IN_PROGRESS.format(discord_user_id=ctx.author.user.id),
+            suppress_embeds=True,
+        )
+    await ctx.send(
+        texts.SERVER_REBUILDING.format(
+            discord_user_id=ctx.author.user.id, server_name=server.name
+        ),
+        suppress_embeds=True,
+    )
+    return job
+
+
+async def rebuild_server_job(
+    ctx: interactions.CommandContext,
+    user: sqlalchemy.Row,
+    os_client: openstack.connection.Connection,
+    server: openstack.compute.v2.server.Server,
+    flavor_id: str,
+    image_id: str,
+    started: float = None,
+):
+    """Rebuild a server from an image, resizing it if the flavor changed.
+
+    started is when the command was received, time.monotonic() by default.
+    """
+    started = time.monotonic() if started is None else started
+    try:
+        progress = report_progress(ctx, started)
+        server = await cloud.rebuild_server(os_client, server, image_id)
+        server = await cloud.wait_for_server(os_client, server, progress=progress)
+        flavor = await cloud.find_flavor(os_client, flavor_id)
+        if flavor is not None and not cloud.uses_flavor(server, flavor):
+            await cloud.resize_server(os_client, server, flavor.id)
+            server = await cloud.wait_for_server(
+                os_client, server, status="VERIFY_RESIZE", progress=progress
+            )
+            await cloud.confirm_server_resize(os_client, server)
+            server = await cloud.wait_for_server(os_client, server, progress=progress)
+        await follow_up(
+            ctx,
+            started,
             texts.SERVER_REBUILT.format(
-                discord_user_id=ctx.author.user.id, server_name=server.name
+                discord_user_id=ctx.author.user.id,
+                server_name=server.name,
+                image_user=await cloud.find_image_user(os_client, image_id),
+                hostname=f"{user.username}-ssh.{os.getenv('CF_DOMAIN')}",
             ),
             suppress_embeds=True,
         )
     except Exception as e:
-        await ctx.send(f"<@{ctx.author.user.id}> {e}")        
+        await follow_up(ctx, started, f"<@{ctx.author.user.id}> {e}")
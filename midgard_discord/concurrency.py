@@ -0,0 +1,151 @@
+# Request coalescing, per-key locking and rate limiting primitives
+import asyncio
+import time
+import weakref
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SupersededError(Exception):
+    """Raised when a call is cancelled because a newer one replaced it."""
+
+
+class RateLimitedError(Exception):
+    """Raised when a call would wait for the rate limit longer than allowed."""
+
+
+class SingleFlight:
+    """Share one in-flight call between every caller asking for the same key.
+
+    The call is cancelled only once every caller waiting on it has gone, so
+    one impatient caller cannot cancel the result the others wait for.
+    """
+
+    def __init__(self):
+        """Initialise with nothing in flight."""
+        self._flights = {}
+
+    def __len__(self) -> int:
+        """Return the number of calls in flight."""
+        return len(self._flights)
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the result of func(), joining a call in flight for key."""
+        flight = self._flights.get(key)
+        if flight is None:
+            task = asyncio.ensure_future(func())
+            flight = self._flights[key] = [task, 0]
+            task.add_done_callback(lambda _: self._forget(key, task))
+        task = flight[0]
+        flight[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not task.done():
+                # Abandoned by all of its callers: later callers start afresh
+                task.cancel()
+                self._forget(key, task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        """Drop a finished call."""
+        flight = self._flights.get(key)
+        if flight is not None and flight[0] is task:
+            del self._flights[key]
+
+
+class KeyedLock:
+    """One lock per key, e.g. to run a Discord user's commands one at a time.
+
+    The table only holds the locks weakly: a lock lives while a caller
+    holds or waits for it, so the table never outgrows the callers in flight.
+    """
+
+    def __init__(self):
+        """Initialise with no locks."""
+        self._locks = weakref.WeakValueDictionary()
+
+    def __len__(self) -> int:
+        """Return the number of locks in use."""
+        return len(self._locks)
+
+    def __call__(self, key: Hashable) -> asyncio.Lock:
+        """Return the lock of key, to use as async with locks(key)."""
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+
+class LatestOnly:
+    """Run at most one call per key, cancelling the older one.
+
+    Suited to autocomplete, where each keystroke makes the previous lookup of
+    the same user worthless.
+    """
+
+    def __init__(self):
+        """Initialise with nothing running."""
+        self._tasks = {}
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the result of func(), or raise SupersededError if replaced."""
+        previous = self._tasks.get(key)
+        if previous is not None:
+            previous.cancel()
+        task = asyncio.ensure_future(func())
+        self._tasks[key] = task
+        try:
+            # Unlike awaiting the task, wait tells our own cancellation apart
+            # from the task's
+            await asyncio.wait({task})
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+        if task.cancelled():
+            raise SupersededError(f"{key} was superseded.")
+        return task.result()
+
+
+class TokenBucket:
+    """Limit calls to rate per second with bursts of up to burst calls.
+
+    Callers over the limit wait their turn in arrival order, or give up when
+    their turn is further away than the timeout they can afford.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        """Initialise a full bucket."""
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        """Add the tokens earned since the last refill."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, timeout: float = None) -> bool:
+        """Take a token, waiting until it is earned.
+
+        Waiting callers reserve their token, so the bucket goes into debt and
+        later callers queue behind them. Return False, taking nothing, when
+        the token would be earned after timeout seconds.
+        """
+        self._refill()
+        wait = max(0.0, (1 - self.tokens) / self.rate)
+        if timeout is not None and wait > timeout:
+            return False
+        self.tokens -= 1
+        if wait:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # Give the reserved token back to the callers behind
+                self.tokens += 1
+                raise
+        return True
@@ -1,13 +1,24 @@
 # Cache database functions
+import collections
+import contextlib
+import time
+from typing import AsyncIterator, Optional
 
 from sqlalchemy import select
 from sqlalchemy import DateTime
+from sqlalchemy import Row
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.sql import func
 from sqlalchemy.orm import DeclarativeBase, Mapped
 from sqlalchemy.orm import mapped_column
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
+from midgard_discord import tracing
+
+
+DEFAULT_CACHE_SIZE = 1024
+
 
 class Base(DeclarativeBase):
     """Base class for all models."""
@@ -35,27 +46,197 @@ class OpenStackCredential(Base):
         return self.__dict__[field]
 
 
-async def init_async_db(DB_URI: str) -> tuple[create_async_engine, async_sessionmaker]:
-    """Initialise the database."""
-    engine = create_async_engine(DB_URI)
+class ProvisioningState(Base):
+    """A completed provisioning step of a user and the resource it created."""
+
+    __tablename__ = "provisioning_states"
+
+    username: Mapped[str] = mapped_column(primary_key=True)
+    step: Mapped[str] = mapped_column(primary_key=True)
+    resource_id: Mapped[Optional[str]]
+    completed_at: Mapped[DateTime] = mapped_column(
+        DateTime(), server_default=func.now()
+    )
+
+    def __repr__(self):
+        """Return a string representation of the model."""
+        return f"<ProvisioningState(username={self.username}, step={self.step}>"
+
+
+class CredentialCache:
+    """Read-through LRU cache of credential rows by Discord user id.
+
+    Unregistered users are cached too (as None), for negative_ttl seconds,
+    so autocomplete bursts from them stay off the database. A ttl of None
+    or 0 disables the cache. Readers take a version() before querying and
+    pass it to set(), which drops the row if an invalidation happened
+    meanwhile: the read may predate the write that invalidated it.
+    """
+
+    def __init__(
+        self,
+        ttl: float = None,
+        max_size: int = DEFAULT_CACHE_SIZE,
+        negative_ttl: float = None,
+    ):
+        """Initialise an empty cache."""
+        self.ttl = ttl
+        self.max_size = max_size
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._generation = 0
+
+    def __len__(self) -> int:
+        """Return the number of cached users."""
+        return len(self._entries)
+
+    @property
+    def enabled(self) -> bool:
+        """Return whether lookups are cached at all."""
+        return bool(self.ttl)
+
+    def get(self, discord_user_id: str) -> tuple[bool, Row]:
+        """Return (found, credential); found is False on a miss."""
+        entry = self._entries.get(discord_user_id)
+        if entry is not None:
+            credential, expires_at = entry
+            if time.monotonic() < expires_at:
+                self._entries.move_to_end(discord_user_id)
+                self.hits += 1
+                return True, credential
+            del self._entries[discord_user_id]
+        self.misses += 1
+        return False, None
+
+    def version(self) -> int:
+        """Return the stamp of a read about to start."""
+        return self._generation
+
+    def set(
+        self,
+        discord_user_id: str,
+        credential: Row,
+        version: int = None,
+    ) -> None:
+        """Cache a credential, or None for an unregistered user.
+
+        Nothing is cached if version predates the last invalidation.
+        """
+        if not self.enabled or (version is not None and version != self._generation):
+            return
+        ttl = self.ttl if credential is not None else self.negative_ttl
+        self._entries[discord_user_id] = (credential, time.monotonic() + ttl)
+        self._entries.move_to_end(discord_user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, discord_user_id: str = None) -> None:
+        """Forget one user, or everyone."""
+        self._generation += 1
+        if discord_user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(discord_user_id, None)
+
+    def stats(self) -> dict[str, int]:
+        """Return the hit and miss counters and the current size."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self)}
+
+
+# Disabled until main configures it from DB_CACHE_TTL
+credential_cache = CredentialCache()
+
+# Plain rows instead of ORM instances: lookups skip the identity map
+credentials = OpenStackCredential.__table__
+provisioning_states = ProvisioningState.__table__
+UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+@contextlib.asynccontextmanager
+async def transaction(
+    async_session: async_sessionmaker[AsyncSession],
+) -> AsyncIterator[AsyncSession]:
+    """Yield a session in a transaction, committed when the block exits."""
+    async with async_session() as session:
+        async with session.begin():
+            yield session
 
+
+def create_engine(
+    DB_URI: str,
+    pool_size: int = None,
+    max_overflow: int = None,
+    pool_recycle: int = None,
+) -> tuple[AsyncEngine, async_sessionmaker[AsyncSession]]:
+    """Create a pooled engine and session factory without touching the schema."""
+    options = {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_recycle": pool_recycle,
+    }
+    engine = create_async_engine(
+        DB_URI, **{key: value for key, value in options.items() if value is not None}
+    )
+    session = async_sessionmaker(engine, expire_on_commit=False)
+    return engine, session
+
+
+async def create_schema(engine: AsyncEngine) -> None:
+    """Create all tables. Run once at startup, not per request."""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
-    session = async_sessionmaker(engine, expire_on_commit=False)
+
+async def init_async_db(DB_URI: str) -> tuple[AsyncEngine, async_sessionmaker]:
+    """Initialise the database."""
+    engine, session = create_engine(DB_URI)
+    await create_schema(engine)
     return engine, session
 
 
 async def find_user(
     async_session: async_sessionmaker[AsyncSession], discord_user_id: str
-):
+) -> Row:
     """Find a user the Database"""
-    stmt = select(OpenStackCredential).where(
-        OpenStackCredential.username == discord_user_id
-    )
+    if credential_cache.enabled:
+        found, user = credential_cache.get(discord_user_id)
+        if found:
+            return user
+    version = credential_cache.version()
+    stmt = select(credentials).where(credentials.c.username == discord_user_id)
     async with async_session() as session:
-        result = (await session.execute(stmt)).first()
-        return result[0] if result is not None else None
+        user = (await session.execute(stmt)).first()
+    credential_cache.set(discord_user_id, user, version)
+    return user
+
+
+async def find_users(
+    async_session: async_sessionmaker[AsyncSession], discord_user_ids: list[str]
+) -> dict[str, Row]:
+    """Find many users in one query; unregistered users map to None"""
+    users = {}
+    missing = []
+    for discord_user_id in dict.fromkeys(discord_user_ids):
+        found, user = (
+            credential_cache.get(discord_user_id)
+            if credential_cache.enabled
+            else (False, None)
+        )
+        if found:
+            users[discord_user_id] = user
+        else:
+            missing.append(discord_user_id)
+    if missing:
+        version = credential_cache.version()
+        stmt = select(credentials).where(credentials.c.username.in_(missing))
+        async with async_session() as session:
+            rows = {row.username: row for row in await session.execute(stmt)}
+        for discord_user_id in missing:
+            users[discord_user_id] = rows.get(discord_user_id)
+            credential_cache.set(discord_user_id, users[discord_user_id], version)
+    return users
 
 
 async def create_user(
@@ -63,7 +244,92 @@ async def create_user(
 ) -> None:
     """Create a new user in the Database"""
     user = OpenStackCredential(username=discord_user_id, **kawrgs)
+    async with transaction(async_session) as session:
+        session.add(user)
+    credential_cache.invalidate(discord_user_id)
+
+
+async def upsert_users(
+    async_session: async_sessionmaker[AsyncSession], rows: list[dict]
+) -> None:
+    """Create or update many users in the Database in one statement
+
+    Each row holds username, password and project_name. Users that already
+    exist get the new password and project name.
+    """
+    if not rows:
+        return
+    async with transaction(async_session) as session:
+        insert = UPSERT_DIALECTS[session.bind.dialect.name]
+        stmt = insert(credentials).values(rows)
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[credentials.c.username],
+                set_={
+                    "password": stmt.excluded.password,
+                    "project_name": stmt.excluded.project_name,
+                    "updated_at": func.now(),
+                },
+            )
+        )
+    for row in rows:
+        credential_cache.invalidate(row["username"])
+
+
+async def insert_users(
+    async_session: async_sessionmaker[AsyncSession], rows: list[dict]
+) -> None:
+    """Create many users in the Database in one statement
+
+    Each row holds username, password and project_name. Users that already
+    exist are left as they are.
+    """
+    if not rows:
+        return
+    async with transaction(async_session) as session:
+        insert = UPSERT_DIALECTS[session.bind.dialect.name]
+        stmt = insert(credentials).values(rows)
+        await session.execute(
+            stmt.on_conflict_do_nothing(index_elements=[credentials.c.username])
+        )
+    for row in rows:
+        credential_cache.invalidate(row["username"])
+
+
+async def find_provisioning_state(
+    async_session: async_sessionmaker[AsyncSession], discord_user_id: str
+) -> dict[str, Optional[str]]:
+    """Return the completed provisioning steps of a user and their resource IDs"""
+    stmt = select(provisioning_states.c.step, provisioning_states.c.resource_id).where(
+        provisioning_states.c.username == discord_user_id
+    )
     async with async_session() as session:
-        async with session.begin():
-            session.add(user)
-    await session.commit()
+        return {row.step: row.resource_id for row in await session.execute(stmt)}
+
+
+async def record_provisioning_step(
+    async_session: async_sessionmaker[AsyncSession],
+    discord_user_id: str,
+    step: str,
+    resource_id: str = None,
+) -> None:
+    """Record a completed provisioning step of a user"""
+    row = {"username": discord_user_id, "step": step, "resource_id": resource_id}
+    async with transaction(async_session) as session:
+        insert = UPSERT_DIALECTS[session.bind.dialect.name]
+        stmt = insert(provisioning_states).values(row)
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[
+                    provisioning_states.c.username,
+                    provisioning_states.c.step,
+                ],
+                set_={
+                    "resource_id": stmt.excluded.resource_id,
+                    "completed_at": func.now(),
+                },
+            )
+        )
+
+
+tracing.instrument(globals())
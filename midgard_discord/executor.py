@@ -0,0 +1,156 @@
+# Sized thread pools for blocking client libraries
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import threading
+import time
+from typing import Any, Callable
+
+from midgard_discord import tracing
+
+DEFAULT_QUEUE_FACTOR = 4
+
+
+class ExecutorBusyError(Exception):
+    """Raised when a pool stays saturated for longer than its busy timeout."""
+
+
+class Executor:
+    """A named thread pool with a bounded queue and wait-time metrics.
+
+    At most max_workers calls run at once and max_queue more wait for a
+    thread. Callers beyond that wait on the event loop (backpressure) and,
+    if busy_timeout is set, give up with ExecutorBusyError instead of piling
+    more work onto a saturated pool.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_workers: int,
+        max_queue: int = None,
+        busy_timeout: float = None,
+    ):
+        """Initialise the pool; threads are started on first use."""
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = (
+            max_workers * DEFAULT_QUEUE_FACTOR if max_queue is None else max_queue
+        )
+        self.busy_timeout = busy_timeout
+        self._pool = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self.blocked = 0
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def __repr__(self) -> str:
+        """Return the representation of the pool."""
+        return (
+            f"<Executor {self.name} {self.running}/{self.max_workers} running, "
+            f"{self.queued} queued, {self.blocked} blocked>"
+        )
+
+    def stats(self) -> dict[str, Any]:
+        """Return queue depth and wait-time metrics."""
+        return {
+            "workers": self.max_workers,
+            "running": self.running,
+            "queued": self.queued,
+            "blocked": self.blocked,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_avg": self.wait_total / self.completed if self.completed else 0.0,
+            "wait_max": self.wait_max,
+        }
+
+    async def _acquire(self) -> asyncio.Semaphore:
+        """Wait for room in the pool's queue and return the slot semaphore."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers + self.max_queue)
+        slots = self._slots
+        if not slots.locked():
+            await slots.acquire()
+            return slots
+        self.blocked += 1
+        try:
+            await asyncio.wait_for(slots.acquire(), self.busy_timeout)
+            return slots
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ExecutorBusyError(f"The {self.name} pool is busy, try again later.")
+        finally:
+            self.blocked -= 1
+
+    def _call(self, submitted: float, func: Callable, *args, **kwargs) -> Any:
+        """Run func in a worker thread, recording how long it queued."""
+        waited = time.monotonic() - submitted
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        tracing.record_wait(self.name, waited)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+
+    def _done(
+        self,
+        future: concurrent.futures.Future,
+        slots: asyncio.Semaphore,
+        loop: asyncio.AbstractEventLoop,
+    ) -> None:
+        """Free the slot of a finished call, or of one cancelled in the queue."""
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+        try:
+            loop.call_soon_threadsafe(slots.release)
+        except RuntimeError:
+            # The event loop is closed, and the semaphore with it
+            pass
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a blocking call in the pool, like asyncio.to_thread.
+
+        The call keeps its slot until it finishes in its thread, even if the
+        caller is cancelled meanwhile; a call still queued is dropped.
+        """
+        slots = await self._acquire()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self.queued += 1
+        try:
+            if self._pool is None:
+                self._pool = concurrent.futures.ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix=f"midgard-{self.name}"
+                )
+            context = contextvars.copy_context()
+            call = functools.partial(
+                context.run, self._call, time.monotonic(), func, *args, **kwargs
+            )
+            future = self._pool.submit(call)
+        except BaseException:
+            with self._lock:
+                self.queued -= 1
+            slots.release()
+            raise
+        future.add_done_callback(lambda future: self._done(future, slots, loop))
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self) -> None:
+        """Stop the worker threads once their calls finish."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        self._slots = None
@@ -0,0 +1,119 @@
+# Background jobs for long-running server operations
+import asyncio
+import itertools
+from typing import Awaitable, Callable
+
+from midgard_discord import utils
+
+
+DEFAULT_MAX_CONCURRENT = 4
+DEFAULT_MAX_PER_USER = 1
+
+
+class JobLimitError(Exception):
+    """Raised when a user already has as many jobs as allowed."""
+
+
+class Job:
+    """A server operation running in the background."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, user_id: str, name: str):
+        """Initialise a queued job."""
+        self.id = next(self._ids)
+        self.user_id = user_id
+        self.name = name
+        self.status = "queued"
+        self.task = None
+
+    def __repr__(self) -> str:
+        """Return the representation of the job."""
+        return f"<Job {self.id} {self.name} <{self.user_id}> {self.status}>"
+
+    async def wait(self):
+        """Wait for the job to finish and return its result."""
+        return await asyncio.shield(self.task)
+
+
+class JobQueue:
+    """Runs jobs in the background with a global and a per-user cap.
+
+    Submitting returns at once. Jobs beyond max_concurrent wait their turn;
+    a user with max_per_user jobs queued or running is refused.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = DEFAULT_MAX_CONCURRENT,
+        max_per_user: int = DEFAULT_MAX_PER_USER,
+    ):
+        """Initialise an empty queue."""
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self._semaphore = None
+        self._jobs = {}
+
+    def jobs(self, user_id: str = None) -> list[Job]:
+        """Return the unfinished jobs, of one user or of everyone."""
+        return [
+            job
+            for job in self._jobs.values()
+            if user_id is None or job.user_id == user_id
+        ]
+
+    def submit(self, user_id: str, name: str, func: Callable[[Job], Awaitable]) -> Job:
+        """Start func(job) in the background and return the job."""
+        if len(self.jobs(user_id)) >= self.max_per_user:
+            raise JobLimitError(f"User {user_id} already has a job in progress.")
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        job = Job(user_id, name)
+        job.task = asyncio.create_task(self._run(job, func))
+        self._jobs[job.id] = job
+        return job
+
+    async def _run(self, job: Job, func: Callable[[Job], Awaitable]):
+        """Run a job once a slot is free."""
+        try:
+            async with self._semaphore:
+                job.status = "running"
+                result = await func(job)
+                job.status = "done"
+                return result
+        except BaseException:
+            job.status = "failed"
+            raise
+        finally:
+            self._jobs.pop(job.id, None)
+
+    async def close(self) -> None:
+        """Cancel every unfinished job."""
+        tasks = [job.task for job in self._jobs.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+_queue = None
+
+
+def get_queue() -> JobQueue:
+    """Get the shared job queue."""
+    global _queue
+    if _queue is None:
+        _queue = JobQueue(
+            max_concurrent=utils.getenv_int(
+                "JOBS_MAX_CONCURRENT", DEFAULT_MAX_CONCURRENT
+            ),
+            max_per_user=utils.getenv_int("JOBS_MAX_PER_USER", DEFAULT_MAX_PER_USER),
+        )
+    return _queue
+
+
+async def close_queue() -> None:
+    """Cancel the jobs of the shared queue, e.g. on bot shutdown."""
+    global _queue
+    if _queue is not None:
+        await _queue.close()
+        _queue = None
@@ -1,31 +1,159 @@
+import asyncio
 import os
 
 import interactions
+import sqlalchemy
 
 from dotenv import load_dotenv
 
+from midgard_discord import catalog
 from midgard_discord import cloud
 from midgard_discord import commands
+from midgard_discord import concurrency
 from midgard_discord import database
+from midgard_discord import jobs
+from midgard_discord import metrics
+from midgard_discord import networking
+from midgard_discord import openstack_api
 from midgard_discord import texts
+from midgard_discord import tracing
 from midgard_discord import utils
+from midgard_discord import warmup
 
 
 # Setup discord API
 load_dotenv()
 
-CACHE_TTL = os.getenv("DB_CACHE_TTL")
+CACHE_TTL = utils.getenv_float("DB_CACHE_TTL")
+database.credential_cache = database.CredentialCache(
+    ttl=CACHE_TTL,
+    max_size=utils.getenv_int("DB_CACHE_SIZE", database.DEFAULT_CACHE_SIZE),
+    negative_ttl=utils.getenv_float("DB_CACHE_NEGATIVE_TTL"),
+)
+# Process-wide connection pool, shared by every command handler
+db_engine, db_session = database.create_engine(
+    os.getenv("DB_URI"),
+    pool_size=utils.getenv_int("DB_POOL_SIZE"),
+    max_overflow=utils.getenv_int("DB_MAX_OVERFLOW"),
+    pool_recycle=utils.getenv_int("DB_POOL_RECYCLE"),
+)
+# Authenticated OpenStack sessions, reused across commands
+connections = cloud.ConnectionManager(
+    max_size=utils.getenv_int("OS_CONNECTION_POOL_SIZE", 64)
+)
+# Snapshot of each project's server, keypair and security group
+cloud.resource_cache = cloud.ResourceCache(
+    ttl=utils.getenv_float("OS_RESOURCE_CACHE_TTL", cloud.DEFAULT_RESOURCE_TTL)
+)
+# Flavor and image listings, indexed for autocomplete
+CATALOG_TTL = utils.getenv_int("CATALOG_TTL", catalog.DEFAULT_CATALOG_TTL)
+DEFAULT_AUTOCOMPLETE_RATE = 5
+DEFAULT_AUTOCOMPLETE_BURST = 10
+DEFAULT_AUTOCOMPLETE_WAIT = 1.0
+
+
+def flavor_choice(flavor) -> dict:
+    """Autocomplete choice payload of a flavor."""
+    return interactions.Choice(
+        name=f"{flavor.name} ({flavor.vcpus} vCPUs, {flavor.ram/1024}GB RAM, {flavor.disk}GB HDD)",
+        value=flavor.id,
+    )._json
+
+
+def image_choice(image) -> dict:
+    """Autocomplete choice payload of an image."""
+    return interactions.Choice(name=image.name, value=image.id)._json
+
+
+# Each catalog's cloud calls have their own rate limit, identical lookups
+# in flight share one result and a newer keystroke cancels the user's last.
+# Discord drops autocompletes answered after 3s, so a lookup waits at most
+# AUTOCOMPLETE_WAIT for the limit before answering with no suggestions.
+AUTOCOMPLETE_WAIT = utils.getenv_float("AUTOCOMPLETE_WAIT", DEFAULT_AUTOCOMPLETE_WAIT)
+
+
+def autocomplete_limiter() -> concurrency.TokenBucket:
+    """Return a new rate limit for the cloud calls of one catalog."""
+    return concurrency.TokenBucket(
+        rate=utils.getenv_float("AUTOCOMPLETE_RATE", DEFAULT_AUTOCOMPLETE_RATE),
+        burst=utils.getenv_int("AUTOCOMPLETE_BURST", DEFAULT_AUTOCOMPLETE_BURST),
+    )
+
+
+autocomplete_flights = concurrency.SingleFlight()
+autocomplete_latest = concurrency.LatestOnly()
+
+# Choice payloads are rendered once per catalog refresh, not on every
+# keystroke; ctx.populate sends them as they are
+flavor_catalog = catalog.Catalog(
+    cloud.list_flavors,
+    ttl=CATALOG_TTL,
+    predicates={"allowed": lambda flavor: flavor.vcpus <= 2},
+    stream=cloud.iter_flavors,
+    render=flavor_choice,
+    limiter=autocomplete_limiter(),
+    limit_wait=AUTOCOMPLETE_WAIT,
+)
+image_catalog = catalog.Catalog(
+    cloud.list_images,
+    ttl=CATALOG_TTL,
+    stream=cloud.iter_images,
+    render=image_choice,
+    limiter=autocomplete_limiter(),
+    limit_wait=AUTOCOMPLETE_WAIT,
+)
+# Deployment-wide lookups are resolved at startup and refreshed in the
+# background, so the first user after a restart does not pay for them
+startup = warmup.Warmup(
+    {
+        "role": lambda: cloud.find_role(connections.get(), refresh=True),
+        "external_network": lambda: cloud.find_external_network(
+            connections.get(), refresh=True
+        ),
+        "flavors": lambda: flavor_catalog.refresh(None, connections.get()),
+        # Recreates DNS records deleted outside the bot, every round
+        "dns": networking.reconcile_dns_records,
+    },
+    interval=utils.getenv_float("WARMUP_INTERVAL", warmup.DEFAULT_WARMUP_INTERVAL),
+)
+# Hit ratios exported by the metrics endpoint
+metrics.caches.update(
+    credentials=database.credential_cache,
+    resources=cloud.resource_cache,
+    flavors=flavor_catalog,
+    images=image_catalog,
+)
 bot = interactions.Client(
     token=os.getenv("DISCORD_TOKEN"),
     default_scope=os.getenv("DISCORD_DEFAULT_GUILD_ID").split(","),
 )
 
 
+def user_connection(user: sqlalchemy.Row):
+    """Borrow the OpenStack connection of a user, or the admin one if unregistered."""
+    if user is None:
+        return connections.get()
+    return connections.get(
+        auth_url=os.getenv("OS_AUTH_URL"),
+        region_name=os.getenv("OS_REGION_NAME"),
+        project_name=user.project_name,
+        username=user.username,
+        password=user.password,
+        user_domain=os.getenv("OS_USER_DOMAIN_NAME"),
+        project_domain=os.getenv("OS_PROJECT_DOMAIN_NAME"),
+    )
+
+
 @bot.event
 async def on_ready():
     """This event is called when the bot is ready to start accepting commands."""
     print(f"We're online! We've logged in as {bot.me.name}.")
     print(f"Our latency is {round(bot.latency)} ms.")
+    startup.start()
+    if await startup.wait_ready(timeout=30):
+        print("Warm-up done.")
+    else:
+        print(f"Warm-up incomplete: {startup.status}")
 
 
 @bot.command(name="midgard")
@@ -35,6 +163,7 @@ async def midgard(ctx: interactions.CommandContext):
 
 
 @midgard.subcommand(name="help", description="Get help with Midgard")
+@tracing.command("help")
 async def help(ctx: interactions.CommandContext):
     """Get help with Midgard"""
     utils.log(ctx.author.name, "/midgard help")
@@ -43,17 +172,62 @@ async def help(ctx: interactions.CommandContext):
 
 @midgard.subcommand(name="register", description="Register an account in Midgard")
 @interactions.autodefer(delay=2.5)
+@tracing.command("register")
 async def register(ctx: interactions.CommandContext):
     """Request enrolment to Midgard"""
     utils.log(ctx.author.name, "/midgard register")
-    db_engine, db_session = await database.init_async_db(os.getenv("DB_URI"))
-    os_client = cloud.connect()
+    os_client = connections.get()
 
     await commands.register(ctx, db_session, os_client)
 
-    # Close database connection
-    await db_engine.dispose()
-    os_client.close()
+
+@bot.command(
+    name="midgard-admin",
+    description="Administer Midgard",
+    default_member_permissions=interactions.Permissions.ADMINISTRATOR,
+)
+async def midgard_admin(ctx: interactions.CommandContext):
+    """Midgard administration group command"""
+    pass
+
+
+@midgard_admin.subcommand(
+    name="register",
+    description="Register many users in Midgard at once",
+    options=[
+        interactions.Option(
+            name="users",
+            description="Mentions or Discord IDs of the users",
+            type=interactions.OptionType.STRING,
+            required=True,
+        ),
+    ],
+)
+@interactions.autodefer(delay=2.5)
+@tracing.command("admin register")
+async def admin_register(ctx: interactions.CommandContext, users: str):
+    """Register a whole class in Midgard"""
+    utils.log(ctx.author.name, f"/midgard-admin register users:{users}")
+    os_client = connections.get()
+
+    await commands.register_cohort(ctx, db_session, os_client, users)
+
+
+@midgard_admin.subcommand(
+    name="stats", description="Show command latencies and pool saturation"
+)
+async def admin_stats(ctx: interactions.CommandContext):
+    """Show where Midgard spends its time"""
+    utils.log(ctx.author.name, "/midgard-admin stats")
+    await commands.stats(
+        ctx,
+        {
+            **tracing.snapshot(),
+            "pools": cloud.executor_stats(),
+            "credential_cache": database.credential_cache.stats(),
+            "warmup": startup.status,
+        },
+    )
 
 
 @midgard.group(name="add")
@@ -74,32 +248,16 @@ async def add(ctx: interactions.CommandContext):
         ),
     ],
 )
+@tracing.command("add keypair")
 async def add_keypair(ctx: interactions.CommandContext, public_key: str):
     """Set your SSH-public key in Midgard"""
     utils.log(ctx.author.name, f"/midgard add keypair public_key:{public_key}")
-    db_engine, db_session = await database.init_async_db(os.getenv("DB_URI"))
 
     user = await database.find_user(db_session, str(ctx.author.user.id))
-    os_client = (
-        cloud.connect()
-        if user is None
-        else cloud.connect(
-            auth_url=os.getenv("OS_AUTH_URL"),
-            region_name=os.getenv("OS_REGION_NAME"),
-            project_name=user.project_name,
-            username=user.username,
-            password=user.password,
-            user_domain=os.getenv("OS_USER_DOMAIN_NAME"),
-            project_domain=os.getenv("OS_PROJECT_DOMAIN_NAME"),
-        )
-    )
+    os_client = user_connection(user)
 
     await commands.add_keypair(ctx, user, os_client, public_key)
 
-    # Close database connection
-    await db_engine.dispose()
-    os_client.close()
-
 
 @add.subcommand(
     name="portforward",
@@ -124,6 +282,7 @@ async def add_keypair(ctx: interactions.CommandContext, public_key: str):
         ),
     ],
 )
+@tracing.command("add portforward")
 async def add_portforward(
     ctx: interactions.CommandContext, port: int, protocol: str = "http"
 ):
@@ -131,29 +290,12 @@ async def add_portforward(
     utils.log(
         ctx.author.name, f"/midgard add portforward port:{port} protocol:{protocol}"
     )
-    db_engine, db_session = await database.init_async_db(os.getenv("DB_URI"))
     user = await database.find_user(db_session, str(ctx.author.user.id))
 
-    os_client = (
-        cloud.connect()
-        if user is None
-        else cloud.connect(
-            auth_url=os.getenv("OS_AUTH_URL"),
-            region_name=os.getenv("OS_REGION_NAME"),
-            project_name=user.project_name,
-            username=user.username,
-            password=user.password,
-            user_domain=os.getenv("OS_USER_DOMAIN_NAME"),
-            project_domain=os.getenv("OS_PROJECT_DOMAIN_NAME"),
-        )
-    )
+    os_client = user_connection(user)
 
     await commands.add_portforward(ctx, user, os_client, port, protocol)
 
-    # Close database connection
-    await db_engine.dispose()
-    os_client.close()
-
 
 # @add.subcommand(
 #     name="dns",
@@ -213,32 +355,16 @@ async def server(ctx: interactions.CommandContext):
     ],
 )
 @interactions.autodefer()
+@tracing.command("server create")
 async def server_create(ctx: interactions.CommandContext, flavor: str, image: str):
     """Create a VM server"""
     utils.log(ctx.author.name, f"/midgard server create flavor:{flavor} image:{image}")
-    db_engine, db_session = await database.init_async_db(os.getenv("DB_URI"))
     user = await database.find_user(db_session, str(ctx.author.user.id))
 
-    os_client = (
-        cloud.connect()
-        if user is None
-        else cloud.connect(
-            auth_url=os.getenv("OS_AUTH_URL"),
-            region_name=os.getenv("OS_REGION_NAME"),
-            project_name=user.project_name,
-            username=user.username,
-            password=user.password,
-            user_domain=os.getenv("OS_USER_DOMAIN_NAME"),
-            project_domain=os.getenv("OS_PROJECT_DOMAIN_NAME"),
-        )
-    )
+    os_client = user_connection(user)
 
     await commands.create_server(ctx, user, os_client, flavor, image)
 
-    # Close database connection
-    await db_engine.dispose()
-    os_client.close()
-
 
 @server.subcommand(
     name="rebuild",
@@ -261,71 +387,68 @@ async def server_create(ctx: interactions.CommandContext, flavor: str, image: st
     ],
 )
 @interactions.autodefer()
+@tracing.command("server rebuild")
 async def server_rebuild(ctx: interactions.CommandContext, flavor: str, image: str):
     """Create a VM server"""
     utils.log(ctx.author.name, f"/midgard server create flavor:{flavor} image:{image}")
-    db_engine, db_session = await database.init_async_db(os.getenv("DB_URI"))
     user = await database.find_user(db_session, str(ctx.author.user.id))
 
-    os_client = (
-        None
-        if user is None
-        else cloud.connect(
-            auth_url=os.getenv("OS_AUTH_URL"),
-            region_name=os.getenv("OS_REGION_NAME"),
-            project_name=user.project_name,
-            username=user.username,
-            password=user.password,
-            user_domain=os.getenv("OS_USER_DOMAIN_NAME"),
-            project_domain=os.getenv("OS_PROJECT_DOMAIN_NAME"),
-        )
-    )
+    os_client = None if user is None else user_connection(user)
 
     await commands.rebuild_server(ctx, user, os_client, flavor, image)
 
-    # Close database connection
-    await db_engine.dispose()
-    os_client.close()
+
+async def flavor_choices(ctx: interactions.CommandContext, user_input: str):
+    """Look up the flavor choices of a user, or None if unregistered."""
+    user = await database.find_user(db_session, str(ctx.author.user.id))
+    if user is None:
+        return None
+
+    os_client = user_connection(user)
+
+    # Flavors are public, so every user shares one catalog scope
+    return await autocomplete_flights.run(
+        ("flavor", user_input),
+        lambda: flavor_catalog.choices(None, os_client, user_input, where="allowed"),
+    )
 
 
+async def image_choices(ctx: interactions.CommandContext, user_input: str):
+    """Look up the image choices of a user, or None if unregistered."""
+    user = await database.find_user(db_session, str(ctx.author.user.id))
+    if user is None:
+        return None
+
+    os_client = user_connection(user)
+
+    # Images include private snapshots, so they are scoped per project
+    return await autocomplete_flights.run(
+        ("image", user.project_name, user_input),
+        lambda: image_catalog.choices(user.project_name, os_client, user_input),
+    )
+
 
 @server_create.autocomplete("flavor")
 async def server_create_flavor_autocomplete(
     ctx: interactions.CommandContext, user_input: str = ""
 ):
     """Autocomplete for create server flavor"""
-    db_engine, db_session = await database.init_async_db(os.getenv("DB_URI"))
-    user = await database.find_user(db_session, str(ctx.author.user.id))
+    try:
+        choices = await autocomplete_latest.run(
+            (ctx.author.user.id, "flavor"), lambda: flavor_choices(ctx, user_input)
+        )
+    except concurrency.SupersededError:
+        metrics.autocompletes["flavor", "superseded"] += 1
+        return
 
-    if user is None:
+    if choices is None:
+        metrics.autocompletes["flavor", "unregistered"] += 1
         await ctx.send(
             texts.ERROR_NOT_REGISTERED.format(discord_user_id=ctx.author.user.id)
         )
         return
 
-    os_client = cloud.connect(
-        auth_url=os.getenv("OS_AUTH_URL"),
-        region_name=os.getenv("OS_REGION_NAME"),
-        project_name=user.project_name,
-        username=user.username,
-        password=user.password,
-        user_domain=os.getenv("OS_USER_DOMAIN_NAME"),
-        project_domain=os.getenv("OS_PROJECT_DOMAIN_NAME"),
-    )
-
-    flavors = await cloud.list_flavors(os_client)
-
-    choices = [
-        interactions.Choice(
-            name=f"{flavor.name} ({flavor.vcpus} vCPUs, {flavor.ram/1024}GB RAM, {flavor.disk}GB HDD)",
-            value=flavor.id,
-        )
-        for flavor in flavors
-        if user_input in flavor.name and flavor.vcpus <= 2
-    ]
-    # Close database connection
-    await db_engine.dispose()
-    os_client.close()
+    metrics.autocompletes["flavor", "ok"] += 1
     await ctx.populate(choices)
 
 
@@ -334,35 +457,43 @@ async def server_create_image_autocomplete(
     ctx: interactions.CommandContext, user_input: str = ""
 ):
     """Autocomplete for create server image"""
-    db_engine, db_session = await database.init_async_db(os.getenv("DB_URI"))
-    user = await database.find_user(db_session, str(ctx.author.user.id))
-
-    os_client = cloud.connect(
-        auth_url=os.getenv("OS_AUTH_URL"),
-        region_name=os.getenv("OS_REGION_NAME"),
-        project_name=user.project_name,
-        username=user.username,
-        password=user.password,
-        user_domain=os.getenv("OS_USER_DOMAIN_NAME"),
-        project_domain=os.getenv("OS_PROJECT_DOMAIN_NAME"),
-    )
-
-    images = await cloud.list_images(os_client)
+    try:
+        choices = await autocomplete_latest.run(
+            (ctx.author.user.id, "image"), lambda: image_choices(ctx, user_input)
+        )
+    except concurrency.SupersededError:
+        metrics.autocompletes["image", "superseded"] += 1
+        return
 
-    choices = [
-        interactions.Choice(name=image.name, value=image.id)
-        for image in images
-        if user_input in image.name
-    ]
-    # Close database connection
-    await db_engine.dispose()
-    os_client.close()
-    await ctx.populate(choices)
+    metrics.autocompletes["image", "ok" if choices is not None else "unregistered"] += 1
+    await ctx.populate(choices or [])
 
 
 def main():
     """Main function"""
-    bot.start()
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(database.create_schema(db_engine))
+    # Optional Prometheus endpoint, served on the bot's event loop
+    metrics_port = utils.getenv_int("METRICS_PORT")
+    metrics_server = None
+    if metrics_port:
+        metrics_server = loop.run_until_complete(
+            metrics.start_server(
+                metrics_port, os.getenv("METRICS_HOST") or metrics.DEFAULT_METRICS_HOST
+            )
+        )
+    try:
+        bot.start()
+    finally:
+        if metrics_server is not None:
+            loop.run_until_complete(metrics_server.cleanup())
+        loop.run_until_complete(startup.close())
+        loop.run_until_complete(jobs.close_queue())
+        connections.close()
+        cloud.close_executors()
+        loop.run_until_complete(networking.close_client())
+        loop.run_until_complete(openstack_api.close_session())
+        loop.run_until_complete(db_engine.dispose())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,150 @@
+# Prometheus metrics endpoint
+import collections
+import math
+
+from aiohttp import web
+
+from midgard_discord import cloud
+from midgard_discord import tracing
+
+
+DEFAULT_METRICS_HOST = "0.0.0.0"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Traced operations by module, e.g. cloud.find_server calls OpenStack
+BACKENDS = {"cloud": "openstack", "networking": "cloudflare", "database": "database"}
+
+# Autocomplete calls by (option, outcome), counted by the handlers
+autocompletes = collections.Counter()
+# Caches with hits and misses counters, registered by name
+caches = {}
+
+
+def format_labels(labels: dict[str, str]) -> str:
+    """Return labels in the exposition format, e.g. {pool="read"}."""
+    if not labels:
+        return ""
+    escaped = (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for value in labels.values()
+    )
+    pairs = ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped))
+    return "{" + pairs + "}"
+
+
+def format_value(value: float) -> str:
+    """Return a sample value in the exposition format."""
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Exposition:
+    """Lines of the Prometheus text format, grouped by metric family."""
+
+    def __init__(self):
+        """Start an empty exposition."""
+        self.lines = []
+
+    def family(self, name: str, kind: str, help: str) -> None:
+        """Start a metric family."""
+        self.lines.append(f"# HELP {name} {help}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value: float, **labels) -> None:
+        """Add one sample."""
+        self.lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+
+    def histogram(self, name: str, histogram: tracing.Histogram, **labels) -> None:
+        """Add the buckets, sum and count of a histogram."""
+        for bound, count in histogram.cumulative():
+            self.sample(f"{name}_bucket", count, **labels, le=format_value(bound))
+        self.sample(f"{name}_sum", histogram.total, **labels)
+        self.sample(f"{name}_count", histogram.count, **labels)
+
+    def render(self) -> str:
+        """Return the exposition text."""
+        return "\n".join(self.lines) + "\n"
+
+
+def render() -> str:
+    """Collect every metric in the Prometheus text format."""
+    out = Exposition()
+
+    out.family(
+        "midgard_command_duration_seconds", "histogram", "Slash command latency."
+    )
+    for command, histogram in sorted(tracing.commands.items()):
+        out.histogram("midgard_command_duration_seconds", histogram, command=command)
+    out.family("midgard_command_errors_total", "counter", "Slash commands that failed.")
+    for command, count in sorted(tracing.errors.items()):
+        out.sample("midgard_command_errors_total", count, command=command)
+
+    out.family("midgard_autocomplete_total", "counter", "Autocomplete calls.")
+    for (option, outcome), count in sorted(autocompletes.items()):
+        out.sample("midgard_autocomplete_total", count, option=option, outcome=outcome)
+
+    out.family(
+        "midgard_backend_duration_seconds",
+        "histogram",
+        "OpenStack, Cloudflare and database call latency by operation.",
+    )
+    for name, histogram in sorted(tracing.operations.items()):
+        module, _, operation = name.partition(".")
+        backend = BACKENDS.get(module, module)
+        out.histogram(
+            "midgard_backend_duration_seconds",
+            histogram,
+            backend=backend,
+            operation=operation,
+        )
+
+    out.family(
+        "midgard_pool_wait_seconds", "histogram", "Time calls queued for a thread."
+    )
+    for pool, histogram in sorted(tracing.waits.items()):
+        out.histogram("midgard_pool_wait_seconds", histogram, pool=pool)
+    pools = cloud.executor_stats()
+    for field, kind, help in (
+        ("workers", "gauge", "Threads of the pool."),
+        ("running", "gauge", "Calls running in a thread."),
+        ("queued", "gauge", "Calls waiting for a thread."),
+        ("blocked", "gauge", "Callers waiting for room in the queue."),
+        ("completed", "counter", "Calls completed."),
+        ("rejected", "counter", "Calls rejected as busy."),
+    ):
+        name = f"midgard_pool_{field}" + ("_total" if kind == "counter" else "")
+        out.family(name, kind, help)
+        for pool, stats in pools.items():
+            out.sample(name, stats[field], pool=pool)
+
+    out.family("midgard_cache_hits_total", "counter", "Cache lookups served.")
+    for cache, obj in sorted(caches.items()):
+        out.sample("midgard_cache_hits_total", obj.hits, cache=cache)
+    out.family("midgard_cache_misses_total", "counter", "Cache lookups missed.")
+    for cache, obj in sorted(caches.items()):
+        out.sample("midgard_cache_misses_total", obj.misses, cache=cache)
+    out.family("midgard_cache_hit_ratio", "gauge", "Share of cache lookups served.")
+    for cache, obj in sorted(caches.items()):
+        lookups = obj.hits + obj.misses
+        out.sample(
+            "midgard_cache_hit_ratio",
+            obj.hits / lookups if lookups else 0.0,
+            cache=cache,
+        )
+
+    return out.render()
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    """Serve the metrics to a scraper."""
+    return web.Response(body=render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def start_server(port: int, host: str = DEFAULT_METRICS_HOST) -> web.AppRunner:
+    """Serve /metrics on the running event loop, next to the bot."""
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -1,21 +1,49 @@
 # Networking component for Midgard Discord Bot
 
+import asyncio
 import os
+import time
+from typing import Callable, Iterable, Iterator
+
 import aiohttp
 
+from midgard_discord import tracing
+from midgard_discord import utils
+
 CF_API_URL = "https://api.cloudflare.com/client/v4"
 CF_ACCOUNT_ENDPOINT = "{CF_API_URL}/accounts/{CF_ACCOUNT_ID}"
 CF_TUNNEL_ENDPOINT = "{CF_ACCOUNT_ENDPOINT}/cfd_tunnel/{CF_TUNNEL_ID}"
 CF_DNS_ENDPOINT = "{CF_API_URL}/zones/{CF_ZONE_ID}/dns_records"
+DEFAULT_CONNECTION_LIMIT = 10
+DEFAULT_DNS_CACHE_TTL = 300
+DEFAULT_CATCH_ALL_SERVICE = "http_status:404"
+DEFAULT_BATCH_WINDOW = 0.2
+DEFAULT_SYNC_INTERVAL = 0
+DEFAULT_DNS_CONCURRENCY = 8
+DEFAULT_DNS_RECORDS_TTL = 300
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF = 0.5
+DNS_PAGE_SIZE = 100
+# "A record with the same settings already exists" and friends
+RECORD_EXISTS_CODES = {81053, 81057, 81058}
 
 
 class Ingress:
     """A CloudFlare tunnel ingress rule."""
 
-    def __init__(self, service: str, hostname: str = None, originRequest: dict = None):
+    __slots__ = ("service", "hostname", "path", "originRequest")
+
+    def __init__(
+        self,
+        service: str,
+        hostname: str = None,
+        originRequest: dict = None,
+        path: str = None,
+    ):
         """Initialize the ingress rule."""
         self.service = service
         self.hostname = hostname
+        self.path = path
         self.originRequest = originRequest
 
     def __repr__(self) -> str:
@@ -25,83 +53,588 @@ class Ingress:
         else:
             return f"<Ingress {self.service}>"
 
+    @property
+    def key(self) -> tuple[str, str]:
+        """Return the (hostname, path) the rule matches on."""
+        return self.hostname, self.path
+
+    @classmethod
+    def from_json(cls, rule: dict) -> "Ingress":
+        """Build a rule from its CloudFlare JSON shape."""
+        return cls(
+            rule["service"],
+            hostname=rule.get("hostname"),
+            originRequest=rule.get("originRequest"),
+            path=rule.get("path"),
+        )
+
+    def to_json(self) -> dict:
+        """Return the CloudFlare JSON shape of the rule."""
+        rule = {"service": self.service}
+        if self.hostname is not None:
+            rule["hostname"] = self.hostname
+        if self.path is not None:
+            rule["path"] = self.path
+        if self.originRequest is not None:
+            rule["originRequest"] = self.originRequest
+        return rule
+
+
+class IngressTable:
+    """The ingress rules of a tunnel, indexed by exact hostname.
+
+    Rules are kept in a dict keyed by (hostname, path), so add, remove and
+    lookup are O(1). CloudFlare evaluates rules in order and the newest rule
+    must come first, so the dict holds rules oldest first and is read back
+    in reverse. The catch-all rule (no hostname) is kept apart and always
+    serialised last.
+    """
+
+    def __init__(self, rules: Iterable[Ingress] = (), catch_all: Ingress = None):
+        """Build a table from rules listed in CloudFlare (newest first) order."""
+        self.rules = {}
+        for rule in reversed(list(rules)):
+            self.rules[rule.key] = rule
+        self.catch_all = catch_all or Ingress(DEFAULT_CATCH_ALL_SERVICE)
+
+    @classmethod
+    def from_json(cls, ingress: list[dict]) -> "IngressTable":
+        """Build a table from the CloudFlare ingress list."""
+        rules = [Ingress.from_json(rule) for rule in ingress]
+        catch_all = None
+        if rules and rules[-1].hostname is None and rules[-1].path is None:
+            catch_all = rules.pop()
+        return cls(rules, catch_all)
+
+    def __len__(self) -> int:
+        """Return the number of rules, including the catch-all."""
+        return len(self.rules) + 1
+
+    def __contains__(self, hostname: str) -> bool:
+        """Return whether a rule matches exactly this hostname."""
+        return (hostname, None) in self.rules
+
+    def __iter__(self) -> Iterator[Ingress]:
+        """Iterate over the rules in CloudFlare evaluation order."""
+        yield from reversed(self.rules.values())
+        yield self.catch_all
+
+    def get(self, hostname: str, path: str = None) -> Ingress:
+        """Return the rule of a hostname, or None."""
+        return self.rules.get((hostname, path))
+
+    def add(self, rule: Ingress) -> None:
+        """Add a rule in front of the existing ones."""
+        if rule.key in self.rules:
+            raise IndexError(f"Hostname {rule.hostname} already exists.")
+        self.rules[rule.key] = rule
+
+    def remove(self, hostname: str, path: str = None) -> Ingress:
+        """Remove and return the rule of a hostname."""
+        try:
+            return self.rules.pop((hostname, path))
+        except KeyError:
+            raise IndexError(f"Hostname {hostname} does not exist.")
+
+    def to_json(self) -> list[dict]:
+        """Return the CloudFlare ingress list."""
+        return [rule.to_json() for rule in self]
+
+
+class CloudflareClient:
+    """A long-lived CloudFlare API client.
+
+    All calls share one keep-alive connection pool with cached DNS lookups,
+    so only the first request pays for the TLS handshake.
+    """
+
+    def __init__(
+        self,
+        api_key: str = None,
+        account_id: str = None,
+        tunnel_id: str = None,
+        zone_id: str = None,
+        api_url: str = CF_API_URL,
+        limit_per_host: int = DEFAULT_CONNECTION_LIMIT,
+        ttl_dns_cache: int = DEFAULT_DNS_CACHE_TTL,
+    ):
+        """Initialise the client. The HTTP session is opened on first use."""
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        }
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.CF_ACCOUNT_ENDPOINT = CF_ACCOUNT_ENDPOINT.format(
+            CF_API_URL=api_url, CF_ACCOUNT_ID=account_id
+        )
+        self.CF_TUNNEL_ENDPOINT = CF_TUNNEL_ENDPOINT.format(
+            CF_ACCOUNT_ENDPOINT=self.CF_ACCOUNT_ENDPOINT, CF_TUNNEL_ID=tunnel_id
+        )
+        self.CF_DNS_ENDPOINT = CF_DNS_ENDPOINT.format(
+            CF_API_URL=api_url, CF_ZONE_ID=zone_id
+        )
+        self.CF_TUNNEL_DNS = f"{tunnel_id}.cfargotunnel.com"
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Return the shared HTTP session, opening it if needed."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.ttl_dns_cache,
+            )
+            self._session = aiohttp.ClientSession(
+                headers=self.headers, connector=connector
+            )
+        return self._session
+
+    def get(self, url: str, **kwargs):
+        """Send a GET request."""
+        return self.session.get(url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        """Send a POST request."""
+        return self.session.post(url, **kwargs)
+
+    def put(self, url: str, **kwargs):
+        """Send a PUT request."""
+        return self.session.put(url, **kwargs)
+
+    def delete(self, url: str, **kwargs):
+        """Send a DELETE request."""
+        return self.session.delete(url, **kwargs)
+
+    async def close(self) -> None:
+        """Close the HTTP session and its pooled connections."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+_client = None
+
+
+def get_client() -> CloudflareClient:
+    """Get the shared CloudFlare client."""
+    global _client
+    if _client is None:
+        _client = CloudflareClient(
+            api_key=os.getenv("CF_API_KEY"),
+            account_id=os.getenv("CF_ACCOUNT_ID"),
+            tunnel_id=os.getenv("CF_TUNNEL_ID"),
+            zone_id=os.getenv("CF_ZONE_ID"),
+            api_url=os.getenv("CF_API_URL") or CF_API_URL,
+            limit_per_host=utils.getenv_int(
+                "CF_CONNECTION_LIMIT", DEFAULT_CONNECTION_LIMIT
+            ),
+            ttl_dns_cache=utils.getenv_int("CF_DNS_CACHE_TTL", DEFAULT_DNS_CACHE_TTL),
+        )
+    return _client
 
-def get_client() -> aiohttp.ClientSession:
-    """Get a CloudFlare client."""
-    headers = {
-        "Authorization": f"Bearer {os.getenv('CF_API_KEY')}",
-        "Content-Type": "application/json",
-    }
-    client = aiohttp.ClientSession(headers=headers)
-    client.CF_ACCOUNT_ENDPOINT = CF_ACCOUNT_ENDPOINT.format(
-        CF_API_URL=CF_API_URL, CF_ACCOUNT_ID=os.getenv("CF_ACCOUNT_ID")
-    )
-    client.CF_TUNNEL_ENDPOINT = CF_TUNNEL_ENDPOINT.format(
-        CF_ACCOUNT_ENDPOINT=client.CF_ACCOUNT_ENDPOINT,
-        CF_TUNNEL_ID=os.getenv("CF_TUNNEL_ID"),
-    )
-    client.CF_DNS_ENDPOINT = CF_DNS_ENDPOINT.format(
-        CF_API_URL=CF_API_URL, CF_ZONE_ID=os.getenv("CF_ZONE_ID")
-    )
-    client.CF_TUNNEL_DNS = f"{os.getenv('CF_TUNNEL_ID')}.cfargotunnel.com"
-    return client
+
+async def close_client() -> None:
+    """Close the shared CloudFlare client, e.g. on bot shutdown."""
+    global _client, _writer, _reconciler
+    _reconciler = None
+    if _writer is not None:
+        await _writer.close()
+        _writer = None
+    if _client is not None:
+        await _client.close()
+        _client = None
 
 
 async def create_dns_record(hostname: str) -> None:
-    """Create a DNS record."""
-    async with get_client() as client:
-        domain = os.getenv("CF_DOMAIN")
-        if hostname.endswith("."):
-            hostname = hostname[:-1]
-        if not hostname.endswith(domain):
-            hostname = f"{hostname}.{domain}"
-        async with client.post(
-            client.CF_DNS_ENDPOINT,
-            json={
-                "type": "CNAME",
-                "name": hostname,
-                "content": client.CF_TUNNEL_DNS,
-                "ttl": 1,
-                "proxied": True,
-            },
-        ) as resp:
+    """Create a DNS record, unless it already exists."""
+    await get_reconciler().ensure(hostname)
+
+
+class CloudflareError(Exception):
+    """An error reported in the body of a CloudFlare API response."""
+
+    def __init__(self, errors: list[dict], status: int = None):
+        """Initialise the error from the response's errors list."""
+        super().__init__(", ".join(error.get("message", "") for error in errors))
+        self.codes = {error.get("code") for error in errors}
+        self.status = status
+
+
+class DNSReconciler:
+    """Keep the zone's tunnel CNAME records in line with the desired hostnames.
+
+    Existing records are paged in and cached as hostname -> record id for
+    ttl seconds, after which they are paged in again, so records deleted
+    outside the bot are noticed and recreated. Only records pointing at
+    our tunnel are ever considered, so other
+    records in the zone are never deleted. Creates and deletes run
+    concurrently, at most concurrency at a time, and requests rejected
+    with 429 or 5xx are retried with exponential backoff (honouring
+    Retry-After).
+    """
+
+    def __init__(
+        self,
+        concurrency: int = DEFAULT_DNS_CONCURRENCY,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff: float = DEFAULT_BACKOFF,
+        ttl: float = DEFAULT_DNS_RECORDS_TTL,
+    ):
+        """Initialise the reconciler. Records are loaded on first use."""
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.ttl = ttl
+        self.records = None
+        self.expires_at = 0.0
+        self._semaphore = None
+        self._loading = None
+
+    async def request(self, method: str, url: str, **kwargs) -> dict:
+        """Send a CloudFlare request, retrying when rate limited."""
+        client = get_client()
+        for attempt in range(self.max_retries + 1):
+            async with client.session.request(method, url, **kwargs) as resp:
+                if resp.status != 429 and resp.status < 500:
+                    body = await resp.json()
+                    if not body.get("success", True):
+                        raise CloudflareError(body.get("errors", []), resp.status)
+                    return body
+                retry_after = resp.headers.get("Retry-After")
+            if attempt == self.max_retries:
+                break
+            delay = float(retry_after) if retry_after else self.backoff * 2**attempt
+            await asyncio.sleep(delay)
+        raise Exception(f"DNS {method} {url} still rate limited after retries.")
+
+    async def load(self) -> dict[str, str]:
+        """Page through the tunnel CNAME records of the zone."""
+        client = get_client()
+        records = {}
+        page, total_pages = 1, 1
+        while page <= total_pages:
+            body = await self.request(
+                "GET",
+                client.CF_DNS_ENDPOINT,
+                params={
+                    "type": "CNAME",
+                    "content": client.CF_TUNNEL_DNS,
+                    "per_page": DNS_PAGE_SIZE,
+                    "page": page,
+                },
+            )
+            for record in body["result"]:
+                if record.get("content") == client.CF_TUNNEL_DNS:
+                    records[record["name"]] = record["id"]
+            total_pages = body.get("result_info", {}).get("total_pages", 1)
+            page += 1
+        self.records = records
+        self.expires_at = time.monotonic() + self.ttl
+        return records
+
+    async def _records(self, refresh: bool = False) -> dict[str, str]:
+        """Return the cached records, loading them when expired or refreshed.
+
+        A refresh swaps in a new dict, so creates and deletes in flight
+        keep writing to a valid one.
+        """
+        if self.records is None or refresh or time.monotonic() >= self.expires_at:
+            if self._loading is None:
+                self._loading = asyncio.ensure_future(self.load())
+            try:
+                await asyncio.shield(self._loading)
+            finally:
+                self._loading = None
+        return self.records
+
+    async def _limit(self, coro):
+        """Run coro under the concurrency limit."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            return await coro
+
+    async def create(self, hostname: str) -> None:
+        """Create the tunnel CNAME record of a hostname."""
+        client = get_client()
+        body = await self._limit(
+            self.request(
+                "POST",
+                client.CF_DNS_ENDPOINT,
+                json={
+                    "type": "CNAME",
+                    "name": hostname,
+                    "content": client.CF_TUNNEL_DNS,
+                    "ttl": 1,
+                    "proxied": True,
+                },
+            )
+        )
+        self.records[hostname] = body["result"]["id"]
+
+    async def delete(self, hostname: str) -> None:
+        """Delete the tunnel CNAME record of a hostname."""
+        client = get_client()
+        record_id = self.records[hostname]
+        try:
+            await self._limit(
+                self.request("DELETE", f"{client.CF_DNS_ENDPOINT}/{record_id}")
+            )
+        except CloudflareError as e:
+            # Already deleted behind our back
+            if e.status != 404:
+                raise
+        self.records.pop(hostname, None)
+
+    async def ensure(self, hostname: str) -> None:
+        """Create the record of a hostname if it does not exist yet."""
+        hostname = qualify_hostname(hostname)
+        if hostname in await self._records():
             return
+        try:
+            await self.create(hostname)
+        except CloudflareError as e:
+            if not e.codes & RECORD_EXISTS_CODES:
+                raise
+            # Created behind our back, refresh the cache
+            if hostname not in await self._records(refresh=True):
+                raise
+
+    async def reconcile(
+        self, hostnames: Iterable[str], delete: bool = True, refresh: bool = False
+    ) -> tuple[set[str], set[str]]:
+        """Create missing and delete stale records, return both sets.
+
+        refresh pages the records in again instead of trusting the cache.
+        """
+        desired = {qualify_hostname(hostname) for hostname in hostnames}
+        existing = set(await self._records(refresh=refresh))
+        created = desired - existing
+        deleted = existing - desired if delete else set()
+        await asyncio.gather(
+            *(self.create(hostname) for hostname in created),
+            *(self.delete(hostname) for hostname in deleted),
+        )
+        return created, deleted
+
+
+_reconciler = None
+
+
+def get_reconciler() -> DNSReconciler:
+    """Get the shared DNS reconciler."""
+    global _reconciler
+    if _reconciler is None:
+        _reconciler = DNSReconciler(
+            concurrency=utils.getenv_int("CF_DNS_CONCURRENCY", DEFAULT_DNS_CONCURRENCY),
+            ttl=utils.getenv_float("CF_DNS_RECORDS_TTL", DEFAULT_DNS_RECORDS_TTL),
+        )
+    return _reconciler
+
+
+async def reconcile_dns_records(delete: bool = True) -> tuple[set[str], set[str]]:
+    """Bring the DNS records in line with the hostnames of the tunnel ingress.
+
+    The records are paged in afresh, so changes made outside the bot count.
+    """
+    tunnels = IngressTable.from_json(await get_tunnel_config())
+    return await get_reconciler().reconcile(
+        {rule.hostname for rule in tunnels if rule.hostname},
+        delete=delete,
+        refresh=True,
+    )
+
+
+async def fetch_tunnel_config() -> dict:
+    """Get the tunnel configuration and its version."""
+    client = get_client()
+    async with client.get(f"{client.CF_TUNNEL_ENDPOINT}/configurations") as resp:
+        return (await resp.json())["result"]
 
 
 async def get_tunnel_config() -> list[dict]:
     """Get the tunnel configuration."""
-    async with get_client() as client:
-        async with client.get(f"{client.CF_TUNNEL_ENDPOINT}/configurations") as resp:
-            tunnels = await resp.json()
-            return tunnels["result"]["config"]["ingress"]
+    return (await fetch_tunnel_config())["config"]["ingress"]
+
+
+def qualify_hostname(hostname: str) -> str:
+    """Return hostname as a fully qualified name under CF_DOMAIN."""
+    domain = os.getenv("CF_DOMAIN")
+    if hostname.endswith("."):
+        hostname = hostname[:-1]
+    if not hostname.endswith(domain):
+        hostname = f"{hostname}.{domain}"
+    return hostname
 
 
 def add_tunnel_config(
-    tunnels: list[dict], service: str, hostname: str, originRequest: dict = None
+    tunnels: IngressTable, service: str, hostname: str, originRequest: dict = None
 ) -> None:
     """Add a tunnel configuration."""
-    for tunnel in tunnels:
-        if "hostname" in tunnel and hostname in tunnel["hostname"]:
-            raise IndexError(f"Hostname {hostname} already exists.")
-    else:
-        domain = os.getenv("CF_DOMAIN")
-        if hostname.endswith("."):
-            hostname = hostname[:-1]
-        if not hostname.endswith(domain):
-            hostname = f"{hostname}.{domain}"
-        ingress = {
-            "service": service,
-            "hostname": hostname,
-            "originRequest": originRequest if originRequest else {},
-        }
-        tunnels.insert(0, ingress)
+    tunnels.add(
+        Ingress(
+            service,
+            hostname=qualify_hostname(hostname),
+            originRequest=originRequest if originRequest else {},
+        )
+    )
+
+
+def remove_tunnel_config(tunnels: IngressTable, hostname: str) -> None:
+    """Remove a tunnel configuration."""
+    tunnels.remove(qualify_hostname(hostname))
+
+
+async def update_tunnel_config(tunnels: IngressTable) -> dict:
+    """Update the tunnel configuration and return the new version."""
+    client = get_client()
+    async with client.put(
+        f"{client.CF_TUNNEL_ENDPOINT}/configurations",
+        json={"config": {"ingress": tunnels.to_json()}},
+    ) as resp:
+        body = await resp.json()
+        if not body.get("success", True):
+            raise Exception(f"Tunnel update failed: {body.get('errors')}")
+        return body["result"]
+
+
+class TunnelConfigWriter:
+    """The single writer of the tunnel ingress list.
+
+    Commands submit add/remove operations instead of doing their own
+    GET-modify-PUT. The writer keeps an in-memory copy of the ingress list,
+    waits batch_window seconds to collect concurrent operations and applies
+    them with one PUT. The copy is re-read from CloudFlare once it is older
+    than sync_interval seconds, after a failed PUT, or when the version
+    returned by a PUT shows that someone else changed the configuration.
+
+    The default sync_interval of 0 re-reads before every batch, which keeps
+    edits made outside the bot. Raise it only if the bot is the sole writer.
+    """
+
+    def __init__(
+        self,
+        batch_window: float = DEFAULT_BATCH_WINDOW,
+        sync_interval: float = DEFAULT_SYNC_INTERVAL,
+    ):
+        """Initialise the writer. Its task starts with the first operation."""
+        self.batch_window = batch_window
+        self.sync_interval = sync_interval
+        self._queue = asyncio.Queue()
+        self._task = None
+        self._tunnels = None
+        self._version = None
+        self._synced_at = 0.0
+
+    def submit(self, operation: Callable[[IngressTable], None]) -> asyncio.Future:
+        """Queue an operation on the ingress table and return its future."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((operation, future))
+        return future
+
+    async def add(
+        self, service: str, hostname: str, originRequest: dict = None
+    ) -> None:
+        """Add an ingress rule and wait until CloudFlare has it."""
+        await self.submit(
+            lambda tunnels: add_tunnel_config(tunnels, service, hostname, originRequest)
+        )
+
+    async def remove(self, hostname: str) -> None:
+        """Remove an ingress rule and wait until CloudFlare has applied it."""
+        await self.submit(lambda tunnels: remove_tunnel_config(tunnels, hostname))
+
+    async def sync(self) -> None:
+        """Re-read the ingress list from CloudFlare."""
+        result = await fetch_tunnel_config()
+        self._tunnels = IngressTable.from_json(result["config"]["ingress"])
+        self._version = result.get("version")
+        self._synced_at = time.monotonic()
+
+    async def _run(self) -> None:
+        """Apply queued operations in batches, forever."""
+        while True:
+            batch = [await self._queue.get()]
+            await asyncio.sleep(self.batch_window)
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._apply(batch)
+
+    async def _apply(self, batch: list[tuple[Callable, asyncio.Future]]) -> None:
+        """Apply one batch of operations with a single PUT."""
+        applied = []
+        try:
+            if (
+                self._tunnels is None
+                or time.monotonic() - self._synced_at >= self.sync_interval
+            ):
+                await self.sync()
+            # A failed PUT drops the table, so it is safe to edit in place
+            tunnels = self._tunnels
+            for operation, future in batch:
+                if future.done():
+                    continue
+                try:
+                    operation(tunnels)
+                    applied.append(future)
+                except Exception as e:
+                    future.set_exception(e)
+            if not applied:
+                return
+
+            result = await update_tunnel_config(tunnels)
+            version = result.get("version")
+            if self._version is not None and version != self._version + 1:
+                # Someone else wrote in between, re-read before the next batch
+                print(f"Tunnel version jumped {self._version} -> {version}, re-syncing")
+                self._tunnels = None
+            self._version = version
+            for future in applied:
+                if not future.done():
+                    future.set_result(None)
+        except Exception as e:
+            self._tunnels = None
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    async def close(self) -> None:
+        """Stop the writer task."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+_writer = None
+
+
+def get_writer() -> TunnelConfigWriter:
+    """Get the shared tunnel configuration writer."""
+    global _writer
+    if _writer is None:
+        _writer = TunnelConfigWriter(
+            batch_window=utils.getenv_float(
+                "CF_TUNNEL_BATCH_WINDOW", DEFAULT_BATCH_WINDOW
+            ),
+            sync_interval=utils.getenv_float(
+                "CF_TUNNEL_SYNC_INTERVAL", DEFAULT_SYNC_INTERVAL
+            ),
+        )
+    return _writer
+
+
+async def add_ingress(service: str, hostname: str, originRequest: dict = None) -> None:
+    """Add a tunnel ingress rule through the shared writer."""
+    await get_writer().add(service, hostname, originRequest)
+
+
+async def remove_ingress(hostname: str) -> None:
+    """Remove a tunnel ingress rule through the shared writer."""
+    await get_writer().remove(hostname)
 
 
-async def update_tunnel_config(tunnels: dict[Ingress]) -> None:
-    """Update the tunnel configuration."""
-    async with get_client() as client:
-        async with client.put(
-            f"{client.CF_TUNNEL_ENDPOINT}/configurations",
-            json={"config": {"ingress": tunnels}},
-        ) as resp:
-            print(await resp.json())
+tracing.instrument(globals())
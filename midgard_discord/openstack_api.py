@@ -0,0 +1,278 @@
+# Async REST client for the hot OpenStack read endpoints
+import asyncio
+import datetime
+import re
+import time
+import urllib.parse
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+import aiohttp
+import openstack
+from openstack.compute.v2.flavor import Flavor
+from openstack.compute.v2.keypair import Keypair
+from openstack.compute.v2.server import Server
+from openstack.identity.v3.project import Project
+from openstack.identity.v3.user import User
+from openstack.image.v2.image import Image
+from openstack.network.v2.security_group import SecurityGroup
+
+from midgard_discord import utils
+
+
+# API version appended to catalog endpoints that are not versioned
+API_VERSIONS = {
+    "compute": "v2.1",
+    "identity": "v3",
+    "image": "v2",
+    "network": "v2.0",
+}
+VERSIONED_ENDPOINT = re.compile(r"/v\d+(\.\d+)?(/|$)")
+DEFAULT_CONNECTION_LIMIT = 20
+DEFAULT_PAGE_SIZE = 100
+# Re-authenticate this many seconds before the token expires
+TOKEN_EXPIRY_MARGIN = 60
+
+
+class OpenStackError(Exception):
+    """Raised when an OpenStack API answers with an error."""
+
+    def __init__(self, status: int, message: str):
+        """Initialise the error with the HTTP status and response body."""
+        super().__init__(f"OpenStack API error {status}: {message}")
+        self.status = status
+
+
+_session = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Get the HTTP session shared by every AsyncOpenStackClient."""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit_per_host=utils.getenv_int(
+                    "OS_CONNECTION_LIMIT", DEFAULT_CONNECTION_LIMIT
+                )
+            ),
+            headers={"Accept": "application/json"},
+        )
+    return _session
+
+
+async def close_session() -> None:
+    """Close the shared HTTP session, e.g. on bot shutdown."""
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+def versioned(endpoint: str, service_type: str) -> str:
+    """Return a catalog endpoint with its API version."""
+    endpoint = endpoint.rstrip("/")
+    if VERSIONED_ENDPOINT.search(urllib.parse.urlparse(endpoint).path):
+        return endpoint
+    return f"{endpoint}/{API_VERSIONS[service_type]}"
+
+
+class AsyncOpenStackClient:
+    """Read Nova, Neutron, Keystone and Glance over aiohttp.
+
+    The Keystone token and service catalog come from an authenticated
+    openstacksdk connection, so the SDK stays in charge of authentication.
+    Only fetching them touches the blocking SDK (through run_blocking); the
+    requests themselves run on the event loop. Results are returned as SDK
+    resources, so callers cannot tell the two paths apart.
+    """
+
+    def __init__(
+        self,
+        connection: openstack.connection.Connection,
+        run_blocking: Callable[..., Awaitable] = asyncio.to_thread,
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ):
+        """Initialise the client around an openstacksdk connection."""
+        self.connection = connection
+        self.run_blocking = run_blocking
+        self.page_size = page_size
+        self._token = None
+        self._expires_at = 0.0
+        self._endpoints = {}
+        self._lock = None
+
+    def _authenticate(self) -> tuple[str, float, dict[str, str]]:
+        """Read the token, its lifetime and the endpoints from the SDK session."""
+        session = self.connection.session
+        token = session.get_token()
+        expires = session.auth.get_access(session).expires
+        lifetime = (expires - datetime.datetime.now(expires.tzinfo)).total_seconds()
+        endpoints = {}
+        for service_type in API_VERSIONS:
+            try:
+                endpoint = session.get_endpoint(
+                    service_type=service_type,
+                    interface=self.connection.config.get_interface(service_type),
+                    region_name=self.connection.config.get_region_name(service_type),
+                )
+            except Exception:
+                endpoint = None
+            if endpoint:
+                endpoints[service_type] = versioned(endpoint, service_type)
+        return token, time.monotonic() + lifetime - TOKEN_EXPIRY_MARGIN, endpoints
+
+    async def token(self) -> str:
+        """Return a valid token, fetching a new one when it is about to expire."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._token is None or time.monotonic() >= self._expires_at:
+                auth = await self.run_blocking(self._authenticate)
+                self._token, self._expires_at, self._endpoints = auth
+        return self._token
+
+    def url(self, service_type: str, path: str) -> str:
+        """Return the absolute URL of an API path or pagination link."""
+        if path.startswith(("http://", "https://")):
+            return path
+        endpoint = self._endpoints.get(service_type)
+        if endpoint is None:
+            raise OpenStackError(404, f"No {service_type} endpoint in the catalog.")
+        version = f"/{API_VERSIONS[service_type]}/"
+        if path.startswith(version):
+            # Glance links are relative to the unversioned endpoint
+            endpoint = endpoint[: endpoint.rindex(version.rstrip("/"))]
+        return endpoint + path
+
+    async def get(
+        self, service_type: str, path: str, params: dict = None
+    ) -> dict[str, Any]:
+        """GET an API path, returning None if it does not exist."""
+        for attempt in range(2):
+            token = await self.token()
+            async with get_session().get(
+                self.url(service_type, path),
+                params=params,
+                headers={"X-Auth-Token": token},
+            ) as response:
+                if response.status == 401 and attempt == 0:
+                    # Token revoked early, fetch a new one and retry once
+                    self._expires_at = 0.0
+                    continue
+                if response.status == 404:
+                    return None
+                if response.status >= 400:
+                    raise OpenStackError(response.status, await response.text())
+                return await response.json()
+
+    @staticmethod
+    def next_link(body: dict[str, Any], key: str) -> str:
+        """Return the link to the next page of a listing, if any."""
+        # Nova and Neutron
+        for link in body.get(f"{key}_links") or []:
+            if link.get("rel") == "next":
+                return link["href"]
+        # Keystone
+        links = body.get("links")
+        if isinstance(links, dict):
+            return links.get("next")
+        # Glance
+        return body.get("next")
+
+    async def paginate(
+        self, service_type: str, path: str, key: str, params: dict = None
+    ) -> AsyncIterator[dict[str, Any]]:
+        """Yield the items of a listing, fetching pages as they are consumed."""
+        params = {name: value for name, value in (params or {}).items() if value}
+        while path:
+            body = await self.get(service_type, path, params)
+            if body is None:
+                return
+            for item in body[key]:
+                yield item
+            # The next link carries the query, including the marker
+            path, params = self.next_link(body, key), None
+
+    async def _find(
+        self,
+        resource: type,
+        service_type: str,
+        path: str,
+        key: str,
+        name_or_id: str,
+        item_path: str = None,
+        **query,
+    ):
+        """Find a resource by exact name, then by ID, like the SDK's find_*."""
+        items = self.paginate(service_type, path, key, {"name": name_or_id, **query})
+        async for item in items:
+            if item.get("name") == name_or_id:
+                return resource.existing(connection=self.connection, **item)
+        body = await self.get(
+            service_type,
+            f"{item_path or path}/{urllib.parse.quote(name_or_id, safe='')}",
+        )
+        if body is None:
+            return None
+        return resource.existing(connection=self.connection, **body[key[:-1]])
+
+    async def find_server(self, name_or_id: str, **query) -> Server:
+        """Find a server in the project."""
+        return await self._find(
+            Server,
+            "compute",
+            "/servers/detail",
+            "servers",
+            name_or_id,
+            item_path="/servers",
+            **query,
+        )
+
+    async def find_keypair(self, name: str) -> Keypair:
+        """Find a keypair of the user."""
+        body = await self.get(
+            "compute", f"/os-keypairs/{urllib.parse.quote(name, safe='')}"
+        )
+        if body is None:
+            return None
+        return Keypair.existing(connection=self.connection, **body["keypair"])
+
+    async def find_user(self, name_or_id: str) -> User:
+        """Find a user in Keystone."""
+        return await self._find(User, "identity", "/users", "users", name_or_id)
+
+    async def find_project(self, name_or_id: str) -> Project:
+        """Find a project in Keystone."""
+        return await self._find(
+            Project, "identity", "/projects", "projects", name_or_id
+        )
+
+    async def find_security_group(self, name_or_id: str, **query) -> SecurityGroup:
+        """Find a security group in Neutron."""
+        return await self._find(
+            SecurityGroup,
+            "network",
+            "/security-groups",
+            "security_groups",
+            name_or_id,
+            **query,
+        )
+
+    async def flavors(self, **query) -> AsyncIterator[Flavor]:
+        """Yield every flavor with its details."""
+        items = self.paginate(
+            "compute",
+            "/flavors/detail",
+            "flavors",
+            {"limit": self.page_size, **query},
+        )
+        async for item in items:
+            yield Flavor.existing(connection=self.connection, **item)
+
+    async def images(self, **query) -> AsyncIterator[Image]:
+        """Yield every image visible to the project."""
+        items = self.paginate(
+            "image", "/images", "images", {"limit": self.page_size, **query}
+        )
+        async for item in items:
+            yield Image.existing(connection=self.connection, **item)
@@ -0,0 +1,69 @@
+# Dependency-graph runner for multi-step provisioning
+import asyncio
+from typing import Any, Awaitable, Callable
+
+
+class Step:
+    """A provisioning step and the names of the steps it depends on."""
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[dict[str, Any]], Awaitable[Any]],
+        requires: tuple[str, ...] = (),
+    ):
+        """Initialise the step. func receives the results of earlier steps."""
+        self.name = name
+        self.func = func
+        self.requires = requires
+
+    def __repr__(self) -> str:
+        """Return the representation of the step."""
+        return f"<Step {self.name} <-- {', '.join(self.requires) or '-'}>"
+
+
+async def run(
+    steps: list[Step],
+    results: dict[str, Any] = None,
+    on_done: Callable[[str, Any], Awaitable[None]] = None,
+) -> dict[str, Any]:
+    """Run steps as soon as their dependencies finish and return every result.
+
+    Steps must be listed after the steps they require. Steps already present
+    in results are treated as done: they are not run again and may be required
+    without being listed. on_done, if given, is awaited with the name and
+    result of each step as it finishes, e.g. to record progress. If a step
+    fails, the steps still running are cancelled and the error is raised once
+    every finished step has been passed to on_done.
+    """
+    results = dict(results or {})
+    tasks = {}
+    callbacks = []
+
+    async def execute(step: Step) -> None:
+        await asyncio.gather(*(tasks[name] for name in step.requires if name in tasks))
+        results[step.name] = await step.func(results)
+        if on_done is not None:
+            # A finished step is reported even if a sibling fails meanwhile
+            callback = asyncio.ensure_future(on_done(step.name, results[step.name]))
+            callbacks.append(callback)
+            await asyncio.shield(callback)
+
+    for step in steps:
+        missing = [
+            name for name in step.requires if name not in tasks and name not in results
+        ]
+        if missing:
+            raise ValueError(f"{step} requires unknown steps {missing}.")
+        if step.name not in results:
+            tasks[step.name] = asyncio.ensure_future(execute(step))
+
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        await asyncio.gather(*callbacks, return_exceptions=True)
+        raise
+    return results
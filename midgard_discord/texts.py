@@ -59,6 +59,18 @@ Then you can access your server by running `ssh {server_name}`.
     + INFO_MORE
 )
 
+SERVER_CREATING = """
+<@{discord_user_id}> Your server is being created. This message will be updated as it builds, and you will be mentioned when it is ready.
+"""
+
+SERVER_REBUILDING = """
+<@{discord_user_id}> Your server `{server_name}` is being rebuilt. This message will be updated as it builds, and you will be mentioned when it is ready.
+"""
+
+SERVER_PROGRESS = """
+<@{discord_user_id}> Server `{server_name}`: {status} ({task_state})
+"""
+
 SERVER_REBUILT = (
     """
 <@{discord_user_id}> Your server has been successfully rebuilt. To access your server, update your instance ssh config in `~/.ssh/config`:
@@ -93,6 +105,21 @@ https://{hostname}
     + INFO_MORE
 )
 
+COHORT_REGISTERED = """
+<@{discord_user_id}> Bulk registration finished: {registered} registered, {existing} already registered, {failed} failed.
+"""
+
+COHORT_FAILED = """
+`{failed_user_id}`: {error}
+"""
+
+STATS = """
+<@{discord_user_id}> Midgard stats:
+```
+{stats}
+```
+"""
+
 # Error texts
 ERROR_REGISTERED = (
     """
@@ -130,6 +157,24 @@ Then you can access your server by running `ssh {server_name}`.
     + INFO_MORE
 )
 
+ERROR_SERVER_BUILDING = (
+    """
+<@{discord_user_id}> Your server `{server_name}` is still being built ({status}). Please wait for it to finish.
+"""
+    + INFO_MORE
+)
+
+ERROR_JOB_IN_PROGRESS = (
+    """
+<@{discord_user_id}> Your server is already being created or rebuilt. Please wait for it to finish.
+"""
+    + INFO_MORE
+)
+
+ERROR_NO_DISCORD_IDS = """
+<@{discord_user_id}> No Discord user IDs found. Mention the users or paste their IDs.
+"""
+
 ERROR_KEYPAIR_NOT_FOUND = (
     """
 <@{discord_user_id}> You do not have any SSH keypair. Please add an SSH keypair by running `/midgard add keypair`.
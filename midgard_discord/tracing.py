@@ -0,0 +1,227 @@
+# Per-command spans and latency histograms
+import bisect
+import collections
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import time
+from typing import Any, Awaitable, Callable
+
+from midgard_discord import utils
+
+
+DEFAULT_MAX_SAMPLES = 1024
+DEFAULT_RECENT_TRACES = 20
+PERCENTILES = (50, 95, 99)
+# Upper bounds in seconds of the cumulative buckets exported to Prometheus
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    """Count, sum and buckets of latencies, with percentiles over recent samples."""
+
+    def __init__(self, max_samples: int = DEFAULT_MAX_SAMPLES):
+        """Initialise an empty histogram."""
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.samples = collections.deque(maxlen=max_samples)
+
+    def observe(self, value: float) -> None:
+        """Record one latency in seconds."""
+        self.count += 1
+        self.total += value
+        self.buckets[bisect.bisect_left(BUCKETS, value)] += 1
+        self.samples.append(value)
+
+    def cumulative(self) -> list[tuple[float, int]]:
+        """Return (upper bound, count at or below it) of every bucket."""
+        counts = itertools.accumulate(self.buckets)
+        return list(zip(BUCKETS + (float("inf"),), counts))
+
+    def percentile(self, q: float) -> float:
+        """Return the q-th percentile of the recent samples."""
+        if not self.samples:
+            return 0.0
+        samples = sorted(self.samples)
+        return samples[min(len(samples) - 1, int(len(samples) * q / 100))]
+
+    def snapshot(self) -> dict[str, float]:
+        """Return the count, mean and percentiles."""
+        snapshot = {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+        }
+        for q in PERCENTILES:
+            snapshot[f"p{q}"] = self.percentile(q)
+        return snapshot
+
+
+class Span:
+    """A timed call inside a trace, and how long it queued for a thread."""
+
+    __slots__ = ("name", "depth", "start", "duration", "wait", "error")
+
+    def __init__(self, name: str, depth: int, start: float):
+        """Initialise a span that started at start, relative to its trace."""
+        self.name = name
+        self.depth = depth
+        self.start = start
+        self.duration = 0.0
+        self.wait = 0.0
+        self.error = None
+
+    def to_dict(self) -> dict[str, Any]:
+        """Return the span as plain data, with the backend time apart."""
+        return {
+            "name": self.name,
+            "depth": self.depth,
+            "start": round(self.start, 6),
+            "duration": round(self.duration, 6),
+            "wait": round(self.wait, 6),
+            "backend": round(self.duration - self.wait, 6),
+            "error": self.error,
+        }
+
+
+class Trace:
+    """The spans of one Discord interaction."""
+
+    def __init__(self, command: str, interaction_id: str = None):
+        """Start the trace now."""
+        self.command = command
+        self.interaction_id = interaction_id
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.spans = []
+        self.error = None
+
+    def to_dict(self) -> dict[str, Any]:
+        """Return the trace as plain data, e.g. for the structured log."""
+        return {
+            "command": self.command,
+            "interaction_id": self.interaction_id,
+            "duration": round(self.duration, 6),
+            "wait": round(sum(span.wait for span in self.spans), 6),
+            "error": self.error,
+            "spans": [span.to_dict() for span in self.spans],
+        }
+
+
+# Latencies by command, by traced operation and by thread pool queue
+commands = collections.defaultdict(Histogram)
+errors = collections.Counter()
+operations = collections.defaultdict(Histogram)
+waits = collections.defaultdict(Histogram)
+recent = collections.deque(maxlen=DEFAULT_RECENT_TRACES)
+
+_trace = contextvars.ContextVar("trace", default=None)
+_span = contextvars.ContextVar("span", default=None)
+
+
+def record_wait(pool: str, waited: float) -> None:
+    """Record how long a call queued for a pool thread.
+
+    Called from the worker thread, which runs in a copy of the caller's
+    context, so the wait is added to the span that made the call.
+    """
+    waits[pool].observe(waited)
+    span = _span.get()
+    if span is not None:
+        span.wait += waited
+
+
+def traced(name: str, func: Callable[..., Awaitable[Any]]) -> Callable:
+    """Wrap a coroutine function so that every call is timed as a span."""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        trace = _trace.get()
+        started = time.perf_counter()
+        span = None
+        if trace is not None:
+            parent = _span.get()
+            depth = parent.depth + 1 if parent is not None else 0
+            span = Span(name, depth, started - trace.started)
+            trace.spans.append(span)
+        token = _span.set(span)
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            if span is not None:
+                span.error = type(e).__name__
+            raise
+        finally:
+            _span.reset(token)
+            duration = time.perf_counter() - started
+            operations[name].observe(duration)
+            if span is not None:
+                span.duration = duration
+
+    return wrapper
+
+
+def instrument(namespace: dict[str, Any], exclude: tuple[str, ...] = ()) -> None:
+    """Trace every public coroutine function defined in a module.
+
+    Call it at the bottom of the module with globals(), so that calls
+    between the module's own functions are traced too.
+    """
+    module = namespace["__name__"]
+    prefix = module.rsplit(".", 1)[-1]
+    for name, func in list(namespace.items()):
+        if (
+            inspect.iscoroutinefunction(func)
+            and func.__module__ == module
+            and not name.startswith("_")
+            and name not in exclude
+        ):
+            namespace[name] = traced(f"{prefix}.{name}", func)
+
+
+def command(name: str) -> Callable:
+    """Trace a slash command handler, tied to the interaction id of its ctx."""
+
+    def decorator(handler: Callable[..., Awaitable[Any]]) -> Callable:
+        @functools.wraps(handler)
+        async def wrapper(ctx, *args, **kwargs):
+            trace = Trace(name, str(getattr(ctx, "id", None)))
+            token = _trace.set(trace)
+            try:
+                return await handler(ctx, *args, **kwargs)
+            except Exception as e:
+                trace.error = type(e).__name__
+                errors[name] += 1
+                raise
+            finally:
+                _trace.reset(token)
+                trace.duration = time.perf_counter() - trace.started
+                commands[name].observe(trace.duration)
+                recent.append(trace)
+                if utils.getenv_bool("TRACE_LOG", True):
+                    print(json.dumps({"trace": trace.to_dict()}))
+
+        return wrapper
+
+    return decorator
+
+
+def snapshot(limit: int = 10) -> dict[str, Any]:
+    """Return the command, slowest operation and pool wait histograms."""
+    slowest = sorted(operations.items(), key=lambda item: -item[1].percentile(95))
+    return {
+        "commands": {name: h.snapshot() for name, h in sorted(commands.items())},
+        "operations": {name: h.snapshot() for name, h in slowest[:limit]},
+        "waits": {name: h.snapshot() for name, h in sorted(waits.items())},
+    }
+
+
+def reset() -> None:
+    """Forget every histogram and recent trace."""
+    commands.clear()
+    errors.clear()
+    operations.clear()
+    waits.clear()
+    recent.clear()
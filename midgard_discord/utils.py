@@ -1,6 +1,7 @@
 # Collections of utility functions
 
 import datetime
+import os
 import string
 import secrets
 
@@ -25,3 +26,21 @@ def log(who: str, event: str) -> None:
     now = datetime.datetime.now()
     timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
     print(f"[{timestamp}] <{who}> {event}")
+
+
+def getenv_int(name: str, default: int = None) -> int:
+    """Read an integer from the environment, ignoring unset or empty values."""
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def getenv_float(name: str, default: float = None) -> float:
+    """Read a float from the environment, ignoring unset or empty values."""
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def getenv_bool(name: str, default: bool = False) -> bool:
+    """Read a boolean flag such as "true" or "1" from the environment."""
+    value = os.getenv(name)
+    return value.lower() in ("1", "true", "yes", "on") if value else default
@@ -0,0 +1,94 @@
+# Startup warm-up and background refresh of deployment-wide lookups
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+
+
+DEFAULT_WARMUP_INTERVAL = 600
+
+
+class Warmup:
+    """Resolve lookups that rarely change before users need them.
+
+    Every task runs concurrently at start, then again every interval seconds
+    in the background. A task failing, or finding nothing, does not stop the
+    others; it is retried at the next round. The bot is ready once every task succeeded
+    at least once.
+    """
+
+    def __init__(
+        self,
+        tasks: dict[str, Callable[[], Awaitable[Any]]],
+        interval: float = DEFAULT_WARMUP_INTERVAL,
+    ):
+        """Initialise the warm-up; nothing runs until start."""
+        self.tasks = tasks
+        self.interval = interval
+        self.status = {name: "pending" for name in tasks}
+        self.refreshed_at = {}
+        self._ready = None
+        self._task = None
+
+    @property
+    def ready(self) -> bool:
+        """Return whether every task succeeded at least once."""
+        return all(name in self.refreshed_at for name in self.tasks)
+
+    async def _run_task(self, name: str) -> None:
+        """Run one task and record how it went."""
+        try:
+            result = await self.tasks[name]()
+        except Exception as e:
+            self.status[name] = "failed"
+            print(f"Warm-up of {name} failed: {e}")
+        else:
+            if result is None:
+                self.status[name] = "failed"
+                print(f"Warm-up of {name} found nothing")
+                return
+            self.status[name] = "ready"
+            self.refreshed_at[name] = time.time()
+
+    async def run_once(self) -> bool:
+        """Run every task concurrently and return whether the bot is ready."""
+        await asyncio.gather(*(self._run_task(name) for name in self.tasks))
+        if self.ready:
+            self._event().set()
+        return self.ready
+
+    async def _run(self) -> None:
+        """Warm up, then refresh every interval seconds."""
+        await self.run_once()
+        while self.interval:
+            await asyncio.sleep(self.interval)
+            await self.run_once()
+
+    def _event(self) -> asyncio.Event:
+        """Return the event set once the bot is ready."""
+        if self._ready is None:
+            self._ready = asyncio.Event()
+        return self._ready
+
+    def start(self) -> asyncio.Task:
+        """Start warming up in the background, unless already started.
+
+        Safe to call from on_ready, which fires again on every reconnect.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return self._task
+
+    async def wait_ready(self, timeout: float = None) -> bool:
+        """Wait until the bot is ready, or timeout, and return readiness."""
+        try:
+            await asyncio.wait_for(self._event().wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.ready
+
+    async def close(self) -> None:
+        """Stop refreshing."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,211 @@
+import asyncio
+import time
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from midgard_discord import catalog
+from midgard_discord import concurrency
+
+# Discord drops autocompletes answered later than this
+AUTOCOMPLETE_DEADLINE = 3.0
+
+
+@pytest.fixture
+def flavors():
+    """A handful of flavors."""
+    return [
+        SimpleNamespace(id="1", name="m1.small", vcpus=1),
+        SimpleNamespace(id="2", name="m1.medium", vcpus=2),
+        SimpleNamespace(id="3", name="m1.large", vcpus=4),
+        SimpleNamespace(id="4", name="small.gpu", vcpus=8),
+    ]
+
+
+def test_name_index_prefix_first(flavors):
+    """Prefix matches should rank before other substring matches."""
+    index = catalog.NameIndex(flavors)
+
+    assert [f.name for f in index.search("small")] == ["small.gpu", "m1.small"]
+    assert [f.name for f in index.search("M1.")] == [
+        "m1.large",
+        "m1.medium",
+        "m1.small",
+    ]
+    assert index.search("xlarge") == []
+
+
+def test_name_index_predicate(flavors):
+    """Predicates should filter results without rescanning the items."""
+    index = catalog.NameIndex(
+        flavors, predicates={"allowed": lambda flavor: flavor.vcpus <= 2}
+    )
+
+    assert [f.name for f in index.search("", where="allowed")] == [
+        "m1.medium",
+        "m1.small",
+    ]
+    assert [f.name for f in index.search("small", where="allowed")] == ["m1.small"]
+
+
+def test_name_index_limit():
+    """The index should return at most limit results."""
+    items = [SimpleNamespace(name=f"ubuntu-{i:04}") for i in range(1000)]
+    index = catalog.NameIndex(items)
+
+    assert len(index.search("ubuntu", limit=25)) == 25
+    assert [i.name for i in index.search("0999")] == ["ubuntu-0999"]
+
+
+@pytest.mark.asyncio
+async def test_catalog_cached(flavors):
+    """A scope should be loaded once while its entry is fresh."""
+    loader = AsyncMock(return_value=flavors)
+    cache = catalog.Catalog(loader, ttl=60)
+
+    await cache.search("project", "client", "m1")
+    result = await cache.search("project", "client", "large")
+
+    loader.assert_awaited_once_with("client")
+    assert [f.name for f in result] == ["m1.large"]
+
+
+@pytest.mark.asyncio
+async def test_catalog_stale_while_refresh(flavors):
+    """An expired scope should be served stale and reloaded in the background."""
+    loader = AsyncMock(side_effect=[flavors[:1], flavors])
+    cache = catalog.Catalog(loader, ttl=0)
+
+    assert len(await cache.search("project", "client")) == 1
+    # Expired: still the old index, reload scheduled
+    assert len(await cache.search("project", "client")) == 1
+    await cache.refresh("project", "client")
+    assert len(await cache.search("project", "client")) == 4
+    assert loader.await_count >= 2
+
+
+@pytest.mark.asyncio
+async def test_catalog_invalidate(flavors):
+    """Invalidating a scope should force a reload."""
+    loader = AsyncMock(return_value=flavors)
+    cache = catalog.Catalog(loader)
+
+    await cache.search("project", "client")
+    cache.invalidate("project")
+    await cache.search("project", "client")
+
+    assert loader.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_catalog_first_lookup_streams(flavors):
+    """The first lookup of a scope should stream while the index is built."""
+    streamed = []
+
+    async def stream(client, query=None, limit=None):
+        for flavor in flavors:
+            streamed.append(flavor)
+            yield flavor
+
+    loader = AsyncMock(return_value=flavors)
+    cache = catalog.Catalog(
+        loader,
+        predicates={"allowed": lambda flavor: flavor.vcpus <= 2},
+        stream=stream,
+    )
+
+    result = await cache.search("project", None, "", limit=1, where="allowed")
+    assert [f.name for f in result] == ["m1.small"]
+    # The stream stopped at the first allowed flavor
+    assert streamed == flavors[:1]
+
+    await cache.refresh("project", None)
+    assert [f.name for f in await cache.search("project", None, "m1.", limit=5)] == [
+        "m1.large",
+        "m1.medium",
+        "m1.small",
+    ]
+    assert len(streamed) == 1
+
+
+@pytest.mark.asyncio
+async def test_catalog_choices_rendered_once(flavors):
+    """Choices should be rendered when the index is built and reused after."""
+    rendered = []
+
+    def render(flavor):
+        rendered.append(flavor.name)
+        return {"name": flavor.name, "value": flavor.id}
+
+    cache = catalog.Catalog(AsyncMock(return_value=flavors), render=render)
+
+    first = await cache.choices("project", None, "m1.")
+    second = await cache.choices("project", None, "m1.")
+
+    assert first == [
+        {"name": "m1.large", "value": "3"},
+        {"name": "m1.medium", "value": "2"},
+        {"name": "m1.small", "value": "1"},
+    ]
+    assert all(a is b for a, b in zip(first, second))
+    assert len(rendered) == len(flavors)
+
+    # A refresh renders the new index
+    await cache.refresh("project", None)
+    assert len(rendered) == 2 * len(flavors)
+
+
+@pytest.mark.asyncio
+async def test_catalog_one_token_per_cold_scope(flavors):
+    """A cold scope should stream and load its index on a single token."""
+
+    async def stream(client, query=None, limit=None):
+        for flavor in flavors:
+            if query in flavor.name:
+                yield flavor
+
+    bucket = concurrency.TokenBucket(rate=0.01, burst=1)
+    cache = catalog.Catalog(
+        AsyncMock(return_value=flavors), stream=stream, limiter=bucket, limit_wait=0
+    )
+
+    assert len(await cache.search("project", None, "m1.")) == 3
+    index = await cache.index("project", None)
+    assert len(index.items) == len(flavors)
+
+    # The bucket is empty: another cold scope gets no matches at once
+    started = time.monotonic()
+    assert await cache.search("other", None, "m1.") == []
+    assert time.monotonic() - started < 0.1
+
+
+@pytest.mark.asyncio
+async def test_catalog_cold_scopes_within_deadline(flavors):
+    """A class opening the image autocomplete at once should not time out."""
+
+    async def stream(client, query=None, limit=None):
+        for flavor in flavors:
+            await asyncio.sleep(0.01)
+            yield flavor
+
+    async def loader(client):
+        await asyncio.sleep(0.05)
+        return flavors
+
+    cache = catalog.Catalog(
+        loader,
+        stream=stream,
+        limiter=concurrency.TokenBucket(rate=5, burst=10),
+        limit_wait=1.0,
+    )
+
+    async def lookup(scope):
+        started = time.monotonic()
+        await cache.choices(scope, None, "")
+        return time.monotonic() - started
+
+    latencies = sorted(
+        await asyncio.gather(*(lookup(f"project-{i}") for i in range(40)))
+    )
+
+    assert latencies[int(len(latencies) * 0.95)] < AUTOCOMPLETE_DEADLINE
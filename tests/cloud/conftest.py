@@ -0,0 +1,11 @@
+import pytest
+from unittest.mock import MagicMock
+
+import openstack
+
+
+@pytest.fixture
+def openstackclient():
+    """Return a mock openstackclient."""
+    mock_openstackclient = MagicMock(openstack.connection.Connection)
+    return mock_openstackclient
@@ -0,0 +1,78 @@
+import asyncio
+import pytest
+from unittest.mock import MagicMock, patch
+
+from midgard_discord import cloud
+from tests.fakes.openstack import FakeCloud
+
+
+@pytest.fixture
+def connect_patch():
+    with patch(
+        "midgard_discord.cloud.connect", side_effect=lambda **kwargs: MagicMock()
+    ) as mock:
+        yield mock
+
+
+def test_connection_reused(connect_patch):
+    """The same credential should borrow the same connection."""
+    manager = cloud.ConnectionManager()
+    first = manager.get(username="alice", project_name="p_alice", password="pw")
+    second = manager.get(username="alice", project_name="p_alice", password="pw")
+
+    assert first is second
+    connect_patch.assert_called_once()
+
+
+def test_connection_lru_eviction(connect_patch):
+    """The least recently used connection should be dropped when the pool is full."""
+    manager = cloud.ConnectionManager(max_size=2)
+    alice = manager.get(username="alice", project_name="p_alice", password="pw")
+    bob = manager.get(username="bob", project_name="p_bob", password="pw")
+    # Touch alice so bob becomes the least recently used
+    manager.get(username="alice", project_name="p_alice", password="pw")
+    manager.get(username="carol", project_name="p_carol", password="pw")
+
+    assert len(manager) == 2
+    assert manager.get(username="bob", project_name="p_bob", password="pw") is not bob
+    # Its borrowers may still be using it
+    bob.close.assert_not_called()
+    alice.close.assert_not_called()
+
+
+def test_connection_password_changed(connect_patch):
+    """A new password should replace the cached connection."""
+    manager = cloud.ConnectionManager()
+    old = manager.get(username="alice", project_name="p_alice", password="old")
+    new = manager.get(username="alice", project_name="p_alice", password="new")
+
+    assert old is not new
+    old.close.assert_not_called()
+    assert len(manager) == 1
+
+
+def test_connection_close(connect_patch):
+    """Closing the manager should close every connection."""
+    manager = cloud.ConnectionManager()
+    admin = manager.get()
+    alice = manager.get(username="alice", project_name="p_alice", password="pw")
+    manager.close()
+
+    admin.close.assert_called_once()
+    alice.close.assert_called_once()
+    assert len(manager) == 0
+
+
+@pytest.mark.asyncio
+async def test_connection_evicted_while_in_use():
+    """A call in flight should finish on a connection evicted meanwhile."""
+    fake_cloud = FakeCloud(latencies={"compute.flavors": 0.05})
+    manager = cloud.ConnectionManager(max_size=1)
+    with patch("midgard_discord.cloud.connect", fake_cloud.connect):
+        alice = manager.get(username="alice", project_name="p_alice", password="pw")
+        listing = asyncio.ensure_future(cloud.list_flavors(alice))
+        await asyncio.sleep(0.01)
+        manager.get(username="bob", project_name="p_bob", password="pw")
+
+        assert len(await listing) == len(fake_cloud.flavors)
+    assert not alice.closed
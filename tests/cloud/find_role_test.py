@@ -0,0 +1,31 @@
+import pytest
+
+from midgard_discord import cloud
+
+
+@pytest.fixture(autouse=True)
+def clear_roles():
+    cloud._roles.clear()
+    yield
+    cloud._roles.clear()
+
+
+@pytest.mark.asyncio
+async def test_find_role_cached(openstackclient):
+    """The role should be looked up once, unless refreshed."""
+    role = await cloud.find_role(openstackclient)
+    assert await cloud.find_role(openstackclient) is role
+    openstackclient.identity.find_role.assert_called_once_with(cloud.DEFAULT_ROLE_NAME)
+
+    await cloud.find_role(openstackclient, refresh=True)
+    assert openstackclient.identity.find_role.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_find_role_refresh_keeps_cached(openstackclient):
+    """A refresh finding nothing should keep the cached role."""
+    role = await cloud.find_role(openstackclient)
+    openstackclient.identity.find_role.return_value = None
+
+    assert await cloud.find_role(openstackclient, refresh=True) is role
+    assert await cloud.find_role(openstackclient) is role
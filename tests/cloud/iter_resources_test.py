@@ -0,0 +1,51 @@
+import pytest
+from types import SimpleNamespace
+
+from midgard_discord import cloud
+
+
+def listing(names, pages):
+    """An SDK-style generator that records every page it fetches."""
+
+    def list_resources(limit=None, **query):
+        for start in range(0, len(names), limit):
+            pages.append((start, query))
+            for name in names[start : start + limit]:
+                yield SimpleNamespace(name=name)
+
+    return list_resources
+
+
+@pytest.mark.asyncio
+async def test_iter_images_stops_early(openstackclient):
+    """Matching should stop fetching pages once limit images are found."""
+    pages = []
+    names = [f"ubuntu-{i:03d}" for i in range(250)]
+    openstackclient.image.images = listing(names, pages)
+
+    images = [image async for image in cloud.iter_images(openstackclient, "UBUNTU", 3)]
+
+    assert [image.name for image in images] == names[:3]
+    assert pages == [(0, {"status": "active", "sort_key": "name", "sort_dir": "asc"})]
+
+
+@pytest.mark.asyncio
+async def test_iter_flavors_pages(openstackclient):
+    """Every page should be read when fewer than limit flavors match."""
+    pages = []
+    names = [f"m1.flavor{i:03d}" for i in range(250)] + ["gpu.large"]
+    openstackclient.compute.flavors = listing(names, pages)
+
+    flavors = [flavor async for flavor in cloud.iter_flavors(openstackclient, "gpu")]
+
+    assert [flavor.name for flavor in flavors] == ["gpu.large"]
+    assert [start for start, _ in pages] == [0, 100, 200]
+
+
+@pytest.mark.asyncio
+async def test_list_flavors(openstackclient):
+    """list_flavors should still return every flavor."""
+    names = [f"m1.flavor{i:03d}" for i in range(101)]
+    openstackclient.compute.flavors = listing(names, [])
+
+    assert len(await cloud.list_flavors(openstackclient)) == 101
@@ -0,0 +1,124 @@
+import asyncio
+import openstack
+import pytest
+import pytest_asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+from midgard_discord import cloud
+from midgard_discord import database
+from midgard_discord import provisioning
+from tests.fakes.openstack import FakeCloud
+
+ALICE = "123456789012345678"
+
+
+@pytest_asyncio.fixture
+async def db_session(tmp_path):
+    # A file rather than :memory:, so that concurrent transactions each get
+    # a connection of their own, as with the production database
+    engine, async_session = await database.init_async_db(
+        f"sqlite+aiosqlite:///{tmp_path / 'midgard.db'}"
+    )
+    yield async_session
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_provision_user_finds_unrecorded_resources(db_session, monkeypatch):
+    """Resources created before steps were recorded are found and reused."""
+    project, os_user = MagicMock(id="project-id"), MagicMock()
+    monkeypatch.setattr(cloud, "find_project", AsyncMock(return_value=project))
+    monkeypatch.setattr(cloud, "find_user", AsyncMock(return_value=os_user))
+    monkeypatch.setattr(cloud, "find_default_network", AsyncMock(return_value=None))
+    monkeypatch.setattr(
+        cloud, "find_default_security_group", AsyncMock(return_value="sg")
+    )
+    monkeypatch.setattr(cloud, "update_user", AsyncMock())
+    run = AsyncMock()
+    monkeypatch.setattr(provisioning, "run", run)
+
+    row = await cloud.provision_user(db_session, MagicMock(), ALICE)
+
+    assert cloud.update_user.call_args.args[1] is os_user
+    assert cloud.update_user.call_args.kwargs == {"password": row["password"]}
+    steps, results, on_done = run.call_args.args
+    assert results == {"project": project, "user": os_user, "security_group": "sg"}
+    assert row["username"] == ALICE
+    assert row["project_name"] == cloud.project_name(ALICE)
+
+
+@pytest.mark.asyncio
+async def test_provision_user_resumes_recorded_steps(db_session, monkeypatch):
+    """An interrupted attempt resumes after its last recorded step."""
+    for name in ("find_project", "find_user", "update_user"):
+        monkeypatch.setattr(cloud, name, AsyncMock(return_value=None))
+
+    async def setup_default_network(*args):
+        # Fail once the steps running alongside have finished
+        await asyncio.sleep(0.05)
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(
+        cloud, "setup_default_network", AsyncMock(side_effect=setup_default_network)
+    )
+    monkeypatch.setattr(
+        cloud, "create_project", AsyncMock(return_value=MagicMock(id="project-id"))
+    )
+    monkeypatch.setattr(
+        cloud, "create_user", AsyncMock(return_value=MagicMock(id="user-id"))
+    )
+    monkeypatch.setattr(cloud, "set_default_roles", AsyncMock())
+    monkeypatch.setattr(
+        cloud, "create_security_group", AsyncMock(return_value=MagicMock(id="sg-id"))
+    )
+
+    with pytest.raises(RuntimeError):
+        await cloud.provision_user(db_session, MagicMock(), ALICE)
+    state = await database.find_provisioning_state(db_session, ALICE)
+    # Every step that finished before the failure is recorded
+    assert state == {
+        "project": "project-id",
+        "user": "user-id",
+        "roles": None,
+        "security_group": "sg-id",
+    }
+
+    # The second attempt only runs what did not complete
+    cloud.find_project.reset_mock()
+    cloud.create_project.reset_mock()
+    cloud.create_user.reset_mock()
+    cloud.create_security_group.reset_mock()
+    cloud.setup_default_network.side_effect = None
+    await cloud.provision_user(db_session, MagicMock(), ALICE)
+
+    cloud.find_project.assert_not_called()
+    cloud.create_project.assert_not_called()
+    cloud.create_user.assert_not_called()
+    cloud.create_security_group.assert_not_called()
+    assert cloud.update_user.call_args.args[1].id == "user-id"
+    assert cloud.setup_default_network.call_args.args[1].id == "project-id"
+    state = await database.find_provisioning_state(db_session, ALICE)
+    assert "default_network" in state
+
+
+@pytest.mark.asyncio
+async def test_provision_user_retry_against_fake_cloud(db_session, monkeypatch):
+    """A retry after a failed OpenStack call creates no duplicate resources."""
+    monkeypatch.setattr(cloud, "_roles", {})
+    monkeypatch.setattr(cloud, "_external_networks", {})
+    fake_cloud = FakeCloud()
+    fake_cloud.fail("network.create_subnet")
+    client = fake_cloud.connect()
+
+    with pytest.raises(openstack.exceptions.HttpException):
+        await cloud.provision_user(db_session, client, ALICE)
+    row = await cloud.provision_user(db_session, client, ALICE)
+
+    assert len(fake_cloud.projects) == 1
+    assert len(fake_cloud.users) == 1
+    assert len(fake_cloud.routers) == 1
+    assert len(fake_cloud.subnets) == 1
+    # The external network and the project's own
+    assert len(fake_cloud.networks) == 2
+    (user,) = fake_cloud.users.values()
+    assert user.password == row["password"]
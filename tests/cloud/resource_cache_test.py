@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+
+from midgard_discord import cloud
+
+
+@pytest.mark.asyncio
+async def test_resources_fetched_concurrently(openstackclient):
+    """Every resource should be looked up in one concurrent fan-out."""
+    cache = cloud.ResourceCache()
+    running = 0
+    peak = 0
+
+    async def lookup(client):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return "resource"
+
+    with patch.dict(
+        cloud.RESOURCE_LOOKUPS, {name: lookup for name in cloud.RESOURCE_LOOKUPS}
+    ):
+        resources = await cache.get(openstackclient)
+
+    assert peak == 3
+    assert resources.server == resources.keypair == resources.security_group
+
+
+@pytest.mark.asyncio
+async def test_resources_cached(openstackclient):
+    """A snapshot should be reused until it expires."""
+    cache = cloud.ResourceCache(ttl=60)
+
+    first = await cache.get(openstackclient)
+    second = await cache.get(openstackclient)
+
+    assert first.server is second.server
+    openstackclient.compute.find_server.assert_called_once()
+    openstackclient.compute.find_keypair.assert_called_once()
+    openstackclient.network.find_security_group.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_resources_ttl_zero(openstackclient):
+    """A ttl of 0 should look resources up every time."""
+    cache = cloud.ResourceCache(ttl=0)
+
+    await cache.get(openstackclient, ("server",))
+    await cache.get(openstackclient, ("server",))
+
+    assert openstackclient.compute.find_server.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_resources_write_through(openstackclient):
+    """The bot's own changes should update the snapshot."""
+    cache = cloud.ResourceCache(ttl=60)
+    with patch.object(cloud, "resource_cache", cache):
+        await cache.get(openstackclient)
+
+        await cloud.delete_keypair(openstackclient, "keypair")
+        assert (await cache.get(openstackclient)).keypair is None
+
+        await cloud.create_keypair(openstackclient, "ssh-ed25519 AAAA")
+        keypair = openstackclient.compute.create_keypair.return_value
+        assert (await cache.get(openstackclient)).keypair is keypair
+
+        server = await cloud.create_server(openstackclient, wait=False)
+        assert (await cache.get(openstackclient)).server is server
+
+        cache.invalidate(openstackclient, "server")
+        await cache.get(openstackclient)
+        assert openstackclient.compute.find_server.call_count == 2
+    openstackclient.compute.find_keypair.assert_called_once()
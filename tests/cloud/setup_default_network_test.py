@@ -0,0 +1,49 @@
+import pytest
+from unittest.mock import MagicMock
+
+import openstack
+
+from midgard_discord import cloud
+
+
+@pytest.fixture
+def project():
+    project = MagicMock(openstack.identity.v3.project.Project)
+    project.id = "000"
+    return project
+
+
+@pytest.mark.asyncio
+async def test_setup_default_network(openstackclient, project):
+    """The default network should be wired to the router and the NAT network."""
+    cloud._external_networks.clear()
+    await cloud.setup_default_network(openstackclient, project)
+
+    network = openstackclient.network
+    network.find_network.assert_called_once_with(cloud.DEFAULT_EXTERNAL_NETWORK)
+    network.create_router.assert_called_once_with(
+        name=cloud.DEFAULT_ROUTER_NAME,
+        project_id=project.id,
+        external_gateway_info={"network_id": network.find_network.return_value.id},
+    )
+    network.create_network.assert_called_once_with(
+        project_id=project.id, name=cloud.DEFAULT_NETWORK_NAME
+    )
+    assert (
+        network.create_subnet.call_args.kwargs["network_id"]
+        == network.create_network.return_value.id
+    )
+    network.add_interface_to_router.assert_called_once_with(
+        network.create_router.return_value,
+        subnet_id=network.create_subnet.return_value.id,
+    )
+
+
+@pytest.mark.asyncio
+async def test_external_network_cached(openstackclient, project):
+    """The external network should be looked up once per process."""
+    cloud._external_networks.clear()
+    await cloud.setup_default_network(openstackclient, project)
+    await cloud.setup_default_network(openstackclient, project)
+
+    openstackclient.network.find_network.assert_called_once()
@@ -0,0 +1,51 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from midgard_discord import cloud
+
+
+def server(status, task_state=None):
+    return SimpleNamespace(name="midgard-server", status=status, task_state=task_state)
+
+
+@pytest.mark.asyncio
+async def test_wait_for_server(openstackclient):
+    """Polling should stop at ACTIVE and report each state change once."""
+    openstackclient.compute.get_server.side_effect = [
+        server("BUILD", "scheduling"),
+        server("BUILD", "spawning"),
+        server("BUILD", "spawning"),
+        server("ACTIVE"),
+    ]
+    progress = AsyncMock()
+
+    result = await cloud.wait_for_server(
+        openstackclient, server("BUILD"), progress=progress, interval=0
+    )
+
+    assert result.status == "ACTIVE"
+    assert openstackclient.compute.get_server.call_count == 4
+    assert progress.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_wait_for_server_error(openstackclient):
+    """A server in ERROR should raise its fault."""
+    failed = server("ERROR")
+    failed.fault = {"message": "No valid host was found."}
+    openstackclient.compute.get_server.return_value = failed
+
+    with pytest.raises(Exception, match="No valid host was found."):
+        await cloud.wait_for_server(openstackclient, server("BUILD"), interval=0)
+
+
+@pytest.mark.asyncio
+async def test_wait_for_server_timeout(openstackclient):
+    """A server that never becomes ACTIVE should time out."""
+    openstackclient.compute.get_server.return_value = server("BUILD")
+
+    with pytest.raises(Exception, match="still BUILD"):
+        await cloud.wait_for_server(
+            openstackclient, server("BUILD"), interval=0.01, timeout=0.05
+        )
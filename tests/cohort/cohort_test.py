@@ -0,0 +1,110 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import interactions
+
+from midgard_discord import cloud
+from midgard_discord import cohort
+from midgard_discord import commands
+from midgard_discord.database import init_async_db, create_user, find_user
+from tests.fakes.openstack import FakeCloud
+
+ALICE = "123456789012345678"
+BOB = "223456789012345678"
+CAROL = "323456789012345678"
+
+
+def test_parse_discord_ids():
+    """Mentions and pasted IDs are found once each, in order."""
+    text = f"<@{ALICE}> <@!{BOB}>\n{ALICE}, {CAROL} not-an-id 42"
+    assert cohort.parse_discord_ids(text) == [ALICE, BOB, CAROL]
+
+
+@pytest_asyncio.fixture
+async def db_session(tmp_path):
+    engine, async_session = await init_async_db(
+        f"sqlite+aiosqlite:///{tmp_path / 'midgard.db'}"
+    )
+    yield async_session
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_register_cohort_bounds_concurrency(db_session, monkeypatch):
+    running, peak = 0, 0
+
+    async def provision_user(db_session, client, discord_user_id):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return {"username": discord_user_id, "password": "pw", "project_name": "p"}
+
+    monkeypatch.setattr(cloud, "provision_user", provision_user)
+    ids = [str(10**17 + i) for i in range(10)]
+    report = await cohort.register_cohort(db_session, MagicMock(), ids, concurrency=3)
+
+    assert peak == 3
+    assert sorted(report.registered) == ids
+    assert all([await find_user(db_session, i) for i in ids])
+
+
+@pytest.mark.asyncio
+async def test_register_cohort_skips_existing_and_isolates_failures(
+    db_session, monkeypatch
+):
+    await create_user(db_session, ALICE, password="pw", project_name="p")
+
+    async def provision_user(db_session, client, discord_user_id):
+        if discord_user_id == BOB:
+            raise RuntimeError("quota exceeded")
+        return {"username": discord_user_id, "password": "pw", "project_name": "p"}
+
+    monkeypatch.setattr(cloud, "provision_user", provision_user)
+    report = await cohort.register_cohort(db_session, MagicMock(), [ALICE, BOB, CAROL])
+
+    assert report.existing == [ALICE]
+    assert report.failed == {BOB: "quota exceeded"}
+    assert report.registered == [CAROL]
+    assert await find_user(db_session, BOB) is None
+    assert await find_user(db_session, CAROL) is not None
+
+
+@pytest.mark.asyncio
+async def test_register_cohort_keeps_self_registration(db_session, monkeypatch):
+    """A user registering themselves mid-cohort keeps a working password."""
+    monkeypatch.setattr(cloud, "_roles", {})
+    monkeypatch.setattr(cloud, "_external_networks", {})
+    fake_cloud = FakeCloud()
+    client = fake_cloud.connect()
+    provision = cloud.provision_user
+    alice_provisioned, alice_registered = asyncio.Event(), asyncio.Event()
+
+    async def provision_user(db_session, client, discord_user_id):
+        # Hold the cohort's batch write until Alice registered herself
+        if discord_user_id == BOB:
+            await alice_registered.wait()
+        row = await provision(db_session, client, discord_user_id)
+        if discord_user_id == ALICE:
+            alice_provisioned.set()
+        return row
+
+    monkeypatch.setattr(cloud, "provision_user", provision_user)
+    registration = asyncio.ensure_future(
+        cohort.register_cohort(db_session, client, [ALICE, BOB])
+    )
+    await alice_provisioned.wait()
+    ctx = AsyncMock(interactions.CommandContext)
+    ctx.author.user.id = int(ALICE)
+    await commands.register(ctx, db_session, client)
+    alice_registered.set()
+    report = await registration
+
+    assert sorted(report.registered) == [ALICE, BOB]
+    (keystone_user,) = [
+        user for user in fake_cloud.users.values() if user.name == ALICE
+    ]
+    assert (await find_user(db_session, ALICE)).password == keystone_user.password
@@ -4,9 +4,12 @@ import pytest
 from unittest.mock import MagicMock, AsyncMock, patch
 
 import interactions
-import openstack
+import sqlalchemy
 
+from midgard_discord import cloud
 from midgard_discord import database
+from midgard_discord import jobs
+from tests.fakes.openstack import FakeCloud
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -14,10 +17,29 @@ def set_env():
     os.environ["CF_DOMAIN"] = "midgard.io"
 
 
+@pytest.fixture(autouse=True)
+def job_queue():
+    """Give every test its own job queue."""
+    jobs._queue = jobs.JobQueue()
+    yield jobs._queue
+    jobs._queue = None
+
+
+@pytest.fixture(autouse=True)
+def deployment_cache():
+    """Forget the role and external network of other tests' clouds."""
+    cloud._roles.clear()
+    cloud._external_networks.clear()
+    yield
+    cloud._roles.clear()
+    cloud._external_networks.clear()
+
+
 @pytest.fixture
 def ctx():
     """Return a mock context."""
     mock_ctx = AsyncMock(interactions.CommandContext)
+    mock_ctx.author.user.id = 123456789012345678
     yield mock_ctx
     mock_ctx.reset_mock()
 
@@ -30,10 +52,28 @@ def session():
 
 
 @pytest.fixture
-def openstackclient():
-    """Return a mock openstackclient."""
-    mock_openstackclient = MagicMock(openstack.connection.Connection)
-    return mock_openstackclient
+def fake_cloud():
+    """Return a fake OpenStack deployment where test_user has a project."""
+    fake = FakeCloud()
+    admin = fake.connect()
+    project = admin.identity.create_project(name="test_project")
+    admin.identity.create_user(
+        name="test_user", default_project=project, password="test_password"
+    )
+    fake.calls.clear()
+    return fake
+
+
+@pytest.fixture
+def admin_openstackclient(fake_cloud):
+    """Return the admin connection to the fake deployment."""
+    return fake_cloud.connect()
+
+
+@pytest.fixture
+def openstackclient(fake_cloud):
+    """Return the connection of test_user to the fake deployment."""
+    return fake_cloud.connect(project_name="test_project", username="test_user")
 
 
 @pytest.fixture
@@ -67,248 +107,123 @@ def http_protocol():
 
 
 @pytest.fixture
-def flavor_id():
+def flavor_id(openstackclient):
     """Flavor ID."""
-    return "1234"
+    return openstackclient.compute.find_flavor("m1.small").id
 
 
 @pytest.fixture
-def image_id():
+def image_id(openstackclient):
     """Image ID."""
-    return "5678"
+    return openstackclient.image.find_image("Ubuntu 22.04").id
 
 
 @pytest.fixture
-def find_user_db_patch_none():
-    with patch("midgard_discord.database.find_user", return_value=None) as mock:
-        yield mock
-
-
-@pytest.fixture
-def find_user_db_patch_some_user():
-    user = database.OpenStackCredential(
-        username="test_user",
-        password="test_password",
-        project_name="test_project",
-        created_at=datetime.datetime.now(),
-        updated_at=datetime.datetime.now(),
+def keystone_user(fake_cloud, ctx):
+    """A Keystone user of the Discord user, e.g. from an earlier registration."""
+    os_user = fake_cloud.connect().identity.create_user(
+        name=str(ctx.author.user.id), password="old_password"
     )
-    with patch("midgard_discord.database.find_user", return_value=user) as mock:
-        yield mock
-
-
-@pytest.fixture
-def create_user_db_patch():
-    with patch("midgard_discord.database.create_user") as mock:
-        yield mock
-
-
-@pytest.fixture
-def find_project_cloud_patch_none():
-    with patch("midgard_discord.cloud.find_project", return_value=None) as mock:
-        yield mock
-
-
-@pytest.fixture
-def find_project_cloud_patch_some_project():
-    project = MagicMock(openstack.identity.v3.project)
-    project.id = "000"
-    project.name = "test_project"
-
-    with patch("midgard_discord.cloud.find_project", return_value=project) as mock:
-        yield mock
-
-
-@pytest.fixture
-def find_user_cloud_patch_none():
-    with patch("midgard_discord.cloud.find_user", return_value=None) as mock:
-        yield mock
-
-
-@pytest.fixture
-def find_user_cloud_patch_some_user():
-    user = MagicMock(openstack.identity.v3.user)
-    user.id = "111"
-    user.name = "test_user"
-    user.password = "test_password"
-    user.default_project_id = "000"
-
-    with patch("midgard_discord.cloud.find_user", return_value=user) as mock:
-        yield mock
-
-
-@pytest.fixture
-def create_project_cloud_patch():
-    project = MagicMock(openstack.identity.v3.project)
-    project.id = "000"
-    project.name = "test_project"
-
-    with patch("midgard_discord.cloud.create_project", return_value=project) as mock:
-        yield mock
-
-
-@pytest.fixture
-def create_user_cloud_patch():
-    user = MagicMock(openstack.identity.v3.user)
-    user.id = "111"
-    user.name = "test_user"
-    user.password = "test_password"
-    user.default_project_id = "000"
-
-    with patch("midgard_discord.cloud.create_user", return_value=user) as mock:
-        yield mock
-
-
-@pytest.fixture
-def update_user_cloud_patch():
-    user = MagicMock(openstack.identity.v3.user)
-    user.id = "111"
-    user.name = "test_user"
-    user.password = "test_password"
-    user.default_project_id = "000"
-
-    with patch("midgard_discord.cloud.update_user", return_value=user) as mock:
-        yield mock
-
-
-@pytest.fixture
-def find_default_network_cloud_patch_none():
-    with patch("midgard_discord.cloud.find_default_network", return_value=None) as mock:
-        yield mock
-
-
-@pytest.fixture
-def find_default_network_cloud_patch_some_network():
-    network = MagicMock(openstack.network.v2.network.Network)
-    network.id = "222"
-    network.name = "test_network"
-
-    with patch(
-        "midgard_discord.cloud.find_default_network", return_value=network
-    ) as mock:
-        yield mock
+    fake_cloud.calls.clear()
+    return os_user
 
 
 @pytest.fixture
-def setup_default_network_patch():
-    with patch("midgard_discord.cloud.setup_default_network") as mock:
-        yield mock
-
-
-@pytest.fixture
-def find_keypair_cloud_patch_none():
-    with patch("midgard_discord.cloud.find_keypair", return_value=None) as mock:
-        yield mock
+def keypair(fake_cloud, openstackclient):
+    """An SSH keypair of test_user."""
+    keypair = openstackclient.compute.create_keypair(
+        name=cloud.DEFAULT_KEYPAIR_NAME, public_key="ssh-rsa AAAAB3NzaC1yc2E old"
+    )
+    fake_cloud.calls.clear()
+    return keypair
 
 
 @pytest.fixture
-def find_keypair_cloud_patch_some_keypair():
-    keypair = MagicMock(openstack.compute.v2.keypair.Keypair)
-    keypair.id = "333"
-    keypair.name = "test_keypair"
-
-    with patch("midgard_discord.cloud.find_keypair", return_value=keypair) as mock:
-        yield mock
+def security_group(fake_cloud, openstackclient):
+    """The default security group of test_project."""
+    security_group = openstackclient.network.create_security_group(
+        name=cloud.DEFAULT_SG_NAME
+    )
+    fake_cloud.calls.clear()
+    return security_group
 
 
 @pytest.fixture
-def create_keypair_cloud_patch():
-    keypair = MagicMock(openstack.compute.v2.keypair.Keypair)
-    keypair.id = "333"
-    keypair.name = "test_keypair"
-
-    with patch("midgard_discord.cloud.create_keypair", return_value=keypair) as mock:
-        yield mock
+def server(fake_cloud, openstackclient, keypair, flavor_id, image_id):
+    """A server of test_project with a floating IP."""
+    server = openstackclient.create_server(
+        name=cloud.DEFAULT_SERVER_NAME,
+        key_name=keypair.name,
+        flavor=flavor_id,
+        image=image_id,
+    )
+    server = openstackclient.add_ips_to_server(server)
+    fake_cloud.calls.clear()
+    return server
 
 
 @pytest.fixture
-def delete_keypair_cloud_patch():
-    with patch("midgard_discord.cloud.delete_keypair") as mock:
-        yield mock
+def public_ip(server):
+    """The floating IP of the server."""
+    return [
+        ip["addr"]
+        for ip in server.addresses["default"]
+        if ip["OS-EXT-IPS:type"] == "floating"
+    ][0]
 
 
 @pytest.fixture
-def find_server_cloud_patch_none():
-    with patch("midgard_discord.cloud.find_server", return_value=None) as mock:
+def find_user_db_patch_none():
+    with patch("midgard_discord.database.find_user", return_value=None) as mock:
         yield mock
 
 
 @pytest.fixture
-def find_server_cloud_patch_some_server():
-    server = MagicMock(openstack.compute.v2.server.Server)
-    server.id = "444"
-    server.name = "test_server"
-    server.addresses = {
-        "default": [
-            {
-                "addr": "192.168.0.8",
-                "OS-EXT-IPS:type": "floating",
-            },
-            {
-                "addr": "10.0.0.8",
-                "OS-EXT-IPS:type": "fixed",
-            },
-        ]
+def find_user_db_patch_some_user():
+    # A Row of the credentials table, as database.find_user returns
+    now = datetime.datetime.now()
+    values = {
+        "username": "test_user",
+        "password": "test_password",
+        "project_name": "test_project",
+        "created_at": now,
+        "updated_at": now,
     }
-    with patch("midgard_discord.cloud.find_server", return_value=server) as mock:
-        yield mock
-
-
-@pytest.fixture
-def create_server_cloud_patch():
-    server = MagicMock(openstack.compute.v2.server.Server)
-    server.id = "444"
-    server.name = "test_server"
-
-    with patch("midgard_discord.cloud.create_server", return_value=server) as mock:
-        yield mock
-
-
-@pytest.fixture
-def create_security_group_cloud_patch():
-    security_group = MagicMock(openstack.network.v2.security_group.SecurityGroup)
-    security_group.id = "555"
-    security_group.name = "test_security_group"
-
-    with patch(
-        "midgard_discord.cloud.create_security_group", return_value=security_group
-    ) as mock:
+    stmt = sqlalchemy.select(
+        *(
+            sqlalchemy.literal(values[column.name], column.type).label(column.name)
+            for column in database.credentials.columns
+        )
+    )
+    with sqlalchemy.create_engine("sqlite://").connect() as conn:
+        user = conn.execute(stmt).first()
+    with patch("midgard_discord.database.find_user", return_value=user) as mock:
         yield mock
 
 
 @pytest.fixture
-def add_security_group_rule_cloud_patch():
-    with patch("midgard_discord.cloud.add_security_group_rule") as mock:
+def upsert_users_db_patch():
+    with patch("midgard_discord.database.upsert_users") as mock:
         yield mock
 
 
 @pytest.fixture
-def find_default_security_group_cloud_patch():
-    security_group = MagicMock(openstack.network.v2.security_group.SecurityGroup)
-    security_group.id = "555"
-    security_group.name = "test_security_group"
-
+def provisioning_state_db_patch_none():
     with patch(
-        "midgard_discord.cloud.find_default_security_group", return_value=security_group
+        "midgard_discord.database.find_provisioning_state", return_value={}
     ) as mock:
         yield mock
 
 
 @pytest.fixture
-def get_tunnel_config_networking_patch():
-    with patch("midgard_discord.networking.get_tunnel_config") as mock:
-        yield mock
-
-
-@pytest.fixture
-def add_tunnel_config_networking_patch():
-    with patch("midgard_discord.networking.add_tunnel_config") as mock:
+def record_provisioning_step_db_patch():
+    with patch("midgard_discord.database.record_provisioning_step") as mock:
         yield mock
 
 
 @pytest.fixture
-def update_tunnel_config_networking_patch():
-    with patch("midgard_discord.networking.update_tunnel_config") as mock:
+def add_ingress_networking_patch():
+    with patch("midgard_discord.networking.add_ingress") as mock:
         yield mock
 
 
@@ -316,25 +231,3 @@ def update_tunnel_config_networking_patch():
 def create_dns_record_networking_patch():
     with patch("midgard_discord.networking.create_dns_record") as mock:
         yield mock
-
-
-@pytest.fixture
-def create_server_cloud_patch():
-    server = MagicMock(openstack.compute.v2.server.Server)
-    server.id = "444"
-    server.name = "test_server"
-    server.addresses = {
-        "default": [
-            {
-                "addr": "192.168.0.8",
-                "OS-EXT-IPS:type": "floating",
-            },
-            {
-                "addr": "10.0.0.8",
-                "OS-EXT-IPS:type": "fixed",
-            },
-        ]
-    }
-
-    with patch("midgard_discord.cloud.create_server", return_value=server) as mock:
-        yield mock
@@ -1,5 +1,6 @@
 import pytest
 
+from midgard_discord import cloud
 from midgard_discord import commands
 from midgard_discord import texts
 
@@ -26,16 +27,15 @@ async def test_add_keypair_user_not_existed(
 @pytest.mark.asyncio
 async def test_add_keypair_user_existed(
     ctx,
+    fake_cloud,
     openstackclient,
     public_key,
     find_user_db_patch_some_user,
-    find_keypair_cloud_patch_none,
-    create_keypair_cloud_patch,
 ):
     """
     Test the add_keypair command with user existed.
 
-    The command should not find a keypair in the database.
+    The command should not find a keypair in Nova.
     The command should set a keypair for the user in Nova.
     The command should send a message that the keypair is updated.
     """
@@ -43,9 +43,13 @@ async def test_add_keypair_user_existed(
 
     await commands.add_keypair(ctx, user, openstackclient, public_key)
 
-    find_keypair_cloud_patch_none.assert_called_once_with(openstackclient)
+    assert fake_cloud.calls["compute.find_keypair"] == 1
+    # Only the keypair is looked up, not the rest of the project's resources
+    assert fake_cloud.calls["compute.find_server"] == 0
+    assert fake_cloud.calls["network.find_security_group"] == 0
 
-    create_keypair_cloud_patch.assert_called_once_with(openstackclient, public_key)
+    keypair = openstackclient.compute.find_keypair(cloud.DEFAULT_KEYPAIR_NAME)
+    assert keypair.public_key == public_key
 
     ctx.send.assert_called_once_with(
         texts.KEYPAIR_UPDATED.format(discord_user_id=ctx.author.user.id),
@@ -56,18 +60,17 @@ async def test_add_keypair_user_existed(
 @pytest.mark.asyncio
 async def test_add_keypair_keypair_existed(
     ctx,
+    fake_cloud,
     openstackclient,
     public_key,
+    keypair,
     find_user_db_patch_some_user,
-    find_keypair_cloud_patch_some_keypair,
-    delete_keypair_cloud_patch,
-    create_keypair_cloud_patch,
 ):
     """
     Test the add_keypair command with keypair existed.
 
-    The command should find a keypair in the database.
-    The command should delete the keypair in the database.
+    The command should find a keypair in Nova.
+    The command should delete the keypair in Nova.
     The command should set a keypair for the user in Nova.
     The command should send a message that the keypair is updated.
     """
@@ -75,14 +78,36 @@ async def test_add_keypair_keypair_existed(
     user = find_user_db_patch_some_user.return_value
     await commands.add_keypair(ctx, user, openstackclient, public_key)
 
-    find_keypair_cloud_patch_some_keypair.assert_called_once_with(openstackclient)
+    assert fake_cloud.calls["compute.find_keypair"] == 1
+    assert fake_cloud.calls["compute.delete_keypair"] == 1
+    assert fake_cloud.calls["compute.create_keypair"] == 1
 
-    keypair = find_keypair_cloud_patch_some_keypair.return_value
-
-    delete_keypair_cloud_patch.assert_called_once_with(openstackclient, keypair)
-    create_keypair_cloud_patch.assert_called_once_with(openstackclient, public_key)
+    replaced = openstackclient.compute.find_keypair(cloud.DEFAULT_KEYPAIR_NAME)
+    assert replaced.public_key == public_key
 
     ctx.send.assert_called_once_with(
         texts.KEYPAIR_UPDATED.format(discord_user_id=ctx.author.user.id),
         suppress_embeds=True,
     )
+
+
+@pytest.mark.asyncio
+async def test_add_keypair_invalid_key(
+    ctx,
+    openstackclient,
+    find_user_db_patch_some_user,
+):
+    """
+    Test the add_keypair command with a malformed public key.
+
+    The command should send Nova's error to the user.
+    """
+    user = find_user_db_patch_some_user.return_value
+
+    await commands.add_keypair(ctx, user, openstackclient, "not a key")
+
+    assert openstackclient.compute.find_keypair(cloud.DEFAULT_KEYPAIR_NAME) is None
+    ctx.send.assert_called_once_with(
+        f"<@{ctx.author.user.id}> "
+        "Keypair data is invalid: failed to generate fingerprint"
+    )
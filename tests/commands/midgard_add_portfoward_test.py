@@ -30,8 +30,8 @@ async def test_add_portforward_server_not_existed(
     openstackclient,
     http_protocol,
     http_port,
+    fake_cloud,
     find_user_db_patch_some_user,
-    find_server_cloud_patch_none,
 ):
     """
     Test the add_portforward command with user existed but server not existed.
@@ -44,7 +44,7 @@ async def test_add_portforward_server_not_existed(
 
     await commands.add_portforward(ctx, user, openstackclient, http_port, http_protocol)
 
-    find_server_cloud_patch_none.assert_called_once_with(openstackclient)
+    assert fake_cloud.calls["compute.find_server"] == 1
 
     ctx.send.assert_called_once_with(
         texts.ERROR_SERVER_NOT_FOUND.format(discord_user_id=ctx.author.user.id),
@@ -58,12 +58,11 @@ async def test_add_portforward(
     openstackclient,
     http_protocol,
     http_port,
+    fake_cloud,
+    security_group,
+    public_ip,
     find_user_db_patch_some_user,
-    find_server_cloud_patch_some_server,
-    add_security_group_rule_cloud_patch,
-    get_tunnel_config_networking_patch,
-    add_tunnel_config_networking_patch,
-    update_tunnel_config_networking_patch,
+    add_ingress_networking_patch,
     create_dns_record_networking_patch,
 ):
     """
@@ -72,34 +71,35 @@ async def test_add_portforward(
     The command should find a user in the database.
     The command should find a server in the cloud.
     The command should add a security group rule in the cloud.
-    The command should get the tunnel config in networking.
     The command should create a DNS record in networking.
-    The command should create a Cloudflare tunnel in networking.
+    The command should queue a Cloudflare tunnel ingress rule in networking.
     The command should send a message that the portforward is created.
     """
     user = find_user_db_patch_some_user.return_value
 
     await commands.add_portforward(ctx, user, openstackclient, http_port, http_protocol)
 
-    find_server_cloud_patch_some_server.assert_called_once_with(openstackclient)
+    assert fake_cloud.calls["compute.find_server"] == 1
+    # The security group comes from the same snapshot as the server
+    assert fake_cloud.calls["network.find_security_group"] == 1
 
-    add_security_group_rule_cloud_patch.assert_called_once_with(
-        openstackclient, http_port
-    )
+    rules = list(fake_cloud.security_group_rules.values())
+    assert [(rule.security_group_id, rule.port_range_min) for rule in rules] == [
+        (security_group.id, http_port)
+    ]
 
     create_dns_record_networking_patch.assert_called_once()
-    get_tunnel_config_networking_patch.assert_called_once()
-    add_tunnel_config_networking_patch.assert_called_once()
-    update_tunnel_config_networking_patch.assert_called_once()
+    add_ingress_networking_patch.assert_called_once_with(
+        f"{http_protocol}://{public_ip}:{http_port}",
+        f"{user.username}-{http_protocol}-{http_port}.{os.getenv('CF_DOMAIN')}",
+    )
 
     ctx.send.assert_called_once_with(
         texts.PORT_FORWARDED.format(
             discord_user_id=ctx.author.user.id,
             port=http_port,
             protocol=http_protocol,
-            server_ip=find_server_cloud_patch_some_server.return_value.addresses[
-                "default"
-            ][0]["addr"],
+            server_ip=public_ip,
             hostname=f"{user.username}-{http_protocol}-{http_port}.{os.getenv('CF_DOMAIN')}",
         ),
         emphemeral=True,
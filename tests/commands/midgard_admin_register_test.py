@@ -0,0 +1,30 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from midgard_discord import cohort
+from midgard_discord import commands
+from midgard_discord import texts
+
+BOB = "223456789012345678"
+
+
+@pytest.mark.asyncio
+async def test_admin_register_reports_failures_without_mentions(ctx, session):
+    """
+    Test the admin register command when some users failed.
+
+    The report should list the failed users without pinging them.
+    """
+    report = cohort.CohortReport()
+    report.failed[BOB] = "Quota exceeded"
+
+    with patch(
+        "midgard_discord.cohort.register_cohort", AsyncMock(return_value=report)
+    ):
+        await commands.register_cohort(ctx, session, None, f"<@{BOB}>")
+
+    message = ctx.send.call_args.args[0]
+    assert texts.COHORT_FAILED.format(failed_user_id=BOB, error="Quota exceeded") in (
+        message
+    )
+    assert f"<@{BOB}>" not in message
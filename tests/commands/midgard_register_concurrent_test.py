@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from unittest.mock import AsyncMock
+
+import interactions
+
+from midgard_discord import cloud
+from midgard_discord import commands
+from midgard_discord import database
+from midgard_discord import texts
+from tests.fakes.openstack import FakeCloud
+
+
+@pytest_asyncio.fixture
+async def db_session(tmp_path):
+    engine, async_session = await database.init_async_db(
+        f"sqlite+aiosqlite:///{tmp_path / 'midgard.db'}"
+    )
+    yield async_session
+    await engine.dispose()
+
+
+def make_ctx(user_id: int):
+    """Return a mock context of a user."""
+    ctx = AsyncMock(interactions.CommandContext)
+    ctx.author.user.id = user_id
+    return ctx
+
+
+@pytest.mark.asyncio
+async def test_register_double_click(db_session):
+    """
+    Test two register commands of one user at the same time.
+
+    The user should be provisioned once.
+    Both commands should share the registration and its reply.
+    """
+    fake_cloud = FakeCloud(latency=0.005)
+    client = fake_cloud.connect()
+    first, second = make_ctx(123456789012345678), make_ctx(123456789012345678)
+
+    await asyncio.gather(
+        commands.register(first, db_session, client),
+        commands.register(second, db_session, client),
+    )
+
+    # The user should be provisioned once.
+    assert len(fake_cloud.projects) == 1
+    assert len(fake_cloud.users) == 1
+    assert len(fake_cloud.routers) == 1
+    assert len(fake_cloud.security_groups) == 1
+
+    # Both commands should share the registration and its reply.
+    for ctx in (first, second):
+        ctx.send.assert_called_once_with(
+            texts.REGISTERED.format(discord_user_id=ctx.author.user.id),
+            suppress_embeds=True,
+        )
+    assert len(cloud.user_locks) == 0
+
+    # A later click finds the user registered
+    third = make_ctx(123456789012345678)
+    await commands.register(third, db_session, client)
+    third.send.assert_called_once_with(
+        texts.ERROR_REGISTERED.format(discord_user_id=third.author.user.id),
+        suppress_embeds=True,
+    )
+
+
+@pytest.mark.asyncio
+async def test_provision_user_shared_in_flight(db_session):
+    """Provisioning a user twice at once should share one attempt."""
+    fake_cloud = FakeCloud(latency=0.005)
+    client = fake_cloud.connect()
+
+    rows = await asyncio.gather(
+        cloud.provision_user(db_session, client, "123456789012345678"),
+        cloud.provision_user(db_session, client, "123456789012345678"),
+    )
+
+    assert rows[0] == rows[1]
+    assert fake_cloud.calls["identity.create_project"] == 1
+    assert len(cloud.provisions) == 0
@@ -1,5 +1,6 @@
 import pytest
 
+from midgard_discord import cloud
 from midgard_discord import commands
 from midgard_discord import texts
 
@@ -8,21 +9,22 @@ from midgard_discord import texts
 async def test_register_existing_user(
     ctx,
     session,
-    openstackclient,
+    fake_cloud,
+    admin_openstackclient,
     find_user_db_patch_some_user,
-    find_user_cloud_patch_some_user,
 ):
     """
     Test the register command with existing user.
 
     The register command should find the user in database.
+    The register command should not call OpenStack.
     The register command should send an already registered message.
     """
-    await commands.register(ctx, session, openstackclient)
+    await commands.register(ctx, session, admin_openstackclient)
 
     find_user_db_patch_some_user.assert_called_once()
 
-    find_user_cloud_patch_some_user.assert_not_called()
+    assert sum(fake_cloud.calls.values()) == 0
 
     # The register command should send an already registered message.
     ctx.send.assert_called_once_with(
@@ -35,11 +37,13 @@ async def test_register_existing_user(
 async def test_register_existing_user_no_cache(
     ctx,
     session,
-    openstackclient,
+    fake_cloud,
+    admin_openstackclient,
+    keystone_user,
     find_user_db_patch_none,
-    find_user_cloud_patch_some_user,
-    update_user_cloud_patch,
-    create_user_db_patch,
+    upsert_users_db_patch,
+    provisioning_state_db_patch_none,
+    record_provisioning_step_db_patch,
 ):
     """
     Test the register command with existing user in Keystone but not in cache.
@@ -50,19 +54,21 @@ async def test_register_existing_user_no_cache(
     The register command should create a new user in the database.
     The register command should send a registered message.
     """
-    await commands.register(ctx, session, openstackclient)
+    await commands.register(ctx, session, admin_openstackclient)
 
     # The register command should not find the user in database.
     find_user_db_patch_none.assert_called_once()
 
     # The register command should find the user in the Keystone.
-    find_user_cloud_patch_some_user.assert_called_once()
+    assert fake_cloud.calls["identity.find_user"] == 1
+    assert fake_cloud.calls["identity.create_user"] == 0
 
     # The register command should update the user password in Keystone.
-    update_user_cloud_patch.assert_called_once()
+    password = upsert_users_db_patch.call_args.args[1][0]["password"]
+    assert fake_cloud.users[keystone_user.id].password == password
 
     # The register command should create a new user in the database.
-    create_user_db_patch.assert_called_once()
+    upsert_users_db_patch.assert_called_once()
 
     # The register command should send a registered message
     ctx.send.assert_called_once_with(
@@ -75,14 +81,12 @@ async def test_register_existing_user_no_cache(
 async def test_register_new_user(
     ctx,
     session,
-    openstackclient,
+    fake_cloud,
+    admin_openstackclient,
     find_user_db_patch_none,
-    create_user_db_patch,
-    find_user_cloud_patch_none,
-    create_project_cloud_patch,
-    create_user_cloud_patch,
-    setup_default_network_patch,
-    create_security_group_cloud_patch,
+    upsert_users_db_patch,
+    provisioning_state_db_patch_none,
+    record_provisioning_step_db_patch,
 ):
     """
     Test the register command with new user.
@@ -96,28 +100,55 @@ async def test_register_new_user(
     The register command should create a new user in the database.
     The register command should send a registered message.
     """
-    await commands.register(ctx, session, openstackclient)
+    await commands.register(ctx, session, admin_openstackclient)
 
     # The register command should not find the user in the database.
     find_user_db_patch_none.assert_called_once()
 
     # The register command should not find the user in Keystone.
-    find_user_cloud_patch_none.assert_called_once()
+    assert fake_cloud.calls["identity.find_user"] == 1
 
     # The register command should create a new project in Keystone.
-    create_project_cloud_patch.assert_called_once()
+    project = admin_openstackclient.identity.find_project(
+        cloud.project_name(str(ctx.author.user.id))
+    )
+    assert project is not None
 
     # The register command should create a new user in Keystone.
-    create_user_cloud_patch.assert_called_once()
+    os_user = admin_openstackclient.identity.find_user(str(ctx.author.user.id))
+    assert os_user.default_project_id == project.id
+    assert os_user.password == upsert_users_db_patch.call_args.args[1][0]["password"]
+    assert len(fake_cloud.role_assignments) == 1
 
     # The register command should create setup the default network in Neutron.
-    setup_default_network_patch.assert_called_once()
+    network = admin_openstackclient.network.find_network(
+        cloud.DEFAULT_NETWORK_NAME, project_id=project.id
+    )
+    assert network is not None
+    assert [subnet.network_id for subnet in fake_cloud.subnets.values()] == [network.id]
+    assert [router.project_id for router in fake_cloud.routers.values()] == [project.id]
 
     # The register command should create a security group in Neutron.
-    create_security_group_cloud_patch.assert_called_once()
+    assert admin_openstackclient.network.find_security_group(
+        cloud.DEFAULT_SG_NAME, project_id=project.id
+    )
+
+    # The register command should record every step it completed.
+    recorded = [c.args[2] for c in record_provisioning_step_db_patch.call_args_list]
+    assert sorted(recorded) == [
+        "default_network",
+        "network",
+        "project",
+        "roles",
+        "router",
+        "router_interface",
+        "security_group",
+        "subnet",
+        "user",
+    ]
 
     # The register command should create a new user in the database.
-    create_user_db_patch.assert_called_once()
+    upsert_users_db_patch.assert_called_once()
 
     # The register command should send a registered message.
     ctx.send.assert_called_once_with(
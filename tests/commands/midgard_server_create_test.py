@@ -1,6 +1,8 @@
+import asyncio
 import os
 import pytest
 
+from midgard_discord import cloud
 from midgard_discord import commands
 from midgard_discord import texts
 
@@ -11,8 +13,10 @@ async def test_create_server_existing_server(
     openstackclient,
     flavor_id,
     image_id,
+    fake_cloud,
+    server,
+    public_ip,
     find_user_db_patch_some_user,
-    find_server_cloud_patch_some_server,
 ):
     """
     Test the create command with existing server.
@@ -26,16 +30,15 @@ async def test_create_server_existing_server(
 
     await commands.create_server(ctx, user, openstackclient, flavor_id, image_id)
 
-    find_server_cloud_patch_some_server.assert_called_once()
+    assert fake_cloud.calls["compute.find_server"] == 1
+    assert fake_cloud.calls["create_server"] == 0
 
     # The create command should send an already created message.
     ctx.send.assert_called_once_with(
         texts.ERROR_SERVER_ALREADY_EXISTS.format(
             discord_user_id=ctx.author.user.id,
-            server_name=find_server_cloud_patch_some_server.return_value.name,
-            server_ip=find_server_cloud_patch_some_server.return_value.addresses[
-                "default"
-            ][0]["addr"],
+            server_name=server.name,
+            server_ip=public_ip,
             hostname=f"{ctx.author.user.id}-ssh.{os.getenv('CF_DOMAIN')}",
         ),
         suppress_embeds=True,
@@ -72,13 +75,11 @@ async def test_create_server(
     openstackclient,
     flavor_id,
     image_id,
+    fake_cloud,
+    keypair,
+    security_group,
     find_user_db_patch_some_user,
-    find_server_cloud_patch_none,
-    create_server_cloud_patch,
-    add_security_group_rule_cloud_patch,
-    get_tunnel_config_networking_patch,
-    add_tunnel_config_networking_patch,
-    update_tunnel_config_networking_patch,
+    add_ingress_networking_patch,
     create_dns_record_networking_patch,
 ):
     """
@@ -86,35 +87,218 @@ async def test_create_server(
 
     The create command should find the user in database.
     The create command should not find the server in the cloud.
-    The create command should create a new server in the cloud.
-    The create command should add ssh to the security group.
-    The create command should set the portforwarding rules for SSH at Cloudflare.
-    The create command should send a created message.
+    The create command should send a creating message and return a job.
+    The job should create a new server in the cloud without blocking on it.
+    The job should wait for the server and attach a floating IP.
+    The job should add ssh to the security group.
+    The job should set the portforwarding rules for SSH at Cloudflare.
+    The job should send a created message.
     """
 
     user = find_user_db_patch_some_user.return_value
 
-    await commands.create_server(ctx, user, openstackclient, flavor_id, image_id)
+    job = await commands.create_server(ctx, user, openstackclient, flavor_id, image_id)
+
+    # The create command should send a creating message and return a job.
+    ctx.send.assert_called_once_with(
+        texts.SERVER_CREATING.format(discord_user_id=ctx.author.user.id),
+        suppress_embeds=True,
+    )
+    await job.wait()
 
     # Create a new server
-    find_server_cloud_patch_none.assert_called_once()
-    create_server_cloud_patch.assert_called_once()
-    add_security_group_rule_cloud_patch.assert_called_once_with(openstackclient, 22)
+    assert fake_cloud.calls["compute.find_server"] == 1
+    assert fake_cloud.calls["create_server"] == 1
+    server = openstackclient.compute.find_server(cloud.DEFAULT_SERVER_NAME)
+    assert server.status == "ACTIVE"
+    assert server.key_name == keypair.name
+    assert server.flavor.id == flavor_id
+    assert [ip["OS-EXT-IPS:type"] for ip in server.addresses["default"]] == [
+        "fixed",
+        "floating",
+    ]
+    rules = list(fake_cloud.security_group_rules.values())
+    assert [(rule.security_group_id, rule.port_range_min) for rule in rules] == [
+        (security_group.id, 22)
+    ]
     # Add portforwarding rules for SSH at Cloudflare.
     create_dns_record_networking_patch.assert_called_once()
-    get_tunnel_config_networking_patch.assert_called_once()
-    add_tunnel_config_networking_patch.assert_called_once()
-    update_tunnel_config_networking_patch.assert_called_once()
+    add_ingress_networking_patch.assert_called_once()
+
+    # The job should send a created message.
+    ctx.send.assert_called_with(
+        texts.SERVER_CREATED.format(
+            discord_user_id=ctx.author.user.id,
+            server_name=server.name,
+            image_user="ubuntu",
+            hostname=f"{user.username}-ssh.{os.getenv('CF_DOMAIN')}",
+        ),
+        suppress_embeds=True,
+    )
+
+
+@pytest.mark.asyncio
+async def test_create_server_token_expired(
+    ctx,
+    openstackclient,
+    flavor_id,
+    image_id,
+    fake_cloud,
+    keypair,
+    security_group,
+    find_user_db_patch_some_user,
+    add_ingress_networking_patch,
+    create_dns_record_networking_patch,
+    monkeypatch,
+):
+    """
+    Test the create command when the build outlasts the interaction token.
+
+    The job should stop editing the response once the token has expired.
+    The job should send the created message through the channel instead.
+    """
+    user = find_user_db_patch_some_user.return_value
+    monkeypatch.setattr(commands, "INTERACTION_TTL", 0)
+
+    job = await commands.create_server(ctx, user, openstackclient, flavor_id, image_id)
+    await job.wait()
 
-    # The create command should send a created message.
     ctx.send.assert_called_once_with(
+        texts.SERVER_CREATING.format(discord_user_id=ctx.author.user.id),
+        suppress_embeds=True,
+    )
+    ctx.edit.assert_not_called()
+    channel = ctx.get_channel.return_value
+    channel.send.assert_called_once_with(
         texts.SERVER_CREATED.format(
             discord_user_id=ctx.author.user.id,
-            server_name=create_server_cloud_patch.return_value.name,
-            server_ip=create_server_cloud_patch.return_value.addresses["default"][0][
-                "addr"
-            ],
+            server_name=cloud.DEFAULT_SERVER_NAME,
+            image_user="ubuntu",
             hostname=f"{user.username}-ssh.{os.getenv('CF_DOMAIN')}",
+        )
+    )
+
+
+@pytest.mark.asyncio
+async def test_create_server_job_in_progress(
+    ctx,
+    openstackclient,
+    flavor_id,
+    image_id,
+    job_queue,
+    keypair,
+    find_user_db_patch_some_user,
+):
+    """
+    Test the create command while another job of the user is running.
+
+    The create command should refuse to start a second job.
+    """
+    user = find_user_db_patch_some_user.return_value
+    job_queue.max_per_user = 0
+
+    job = await commands.create_server(ctx, user, openstackclient, flavor_id, image_id)
+
+    assert job is ctx.send.return_value
+    ctx.send.assert_called_once_with(
+        texts.ERROR_JOB_IN_PROGRESS.format(discord_user_id=ctx.author.user.id),
+        suppress_embeds=True,
+    )
+
+
+@pytest.mark.asyncio
+async def test_create_server_build_in_flight(
+    ctx,
+    openstackclient,
+    flavor_id,
+    image_id,
+    job_queue,
+    keypair,
+    find_user_db_patch_some_user,
+):
+    """
+    Test the create command while the user's server is being created.
+
+    The create command should refuse a second build, whatever the job limits.
+    """
+    user = find_user_db_patch_some_user.return_value
+    job_queue.max_per_user = 2
+    building = asyncio.Event()
+    job_queue.submit(
+        str(ctx.author.user.id), "server create", lambda job: building.wait()
+    )
+
+    await commands.create_server(ctx, user, openstackclient, flavor_id, image_id)
+
+    assert len(job_queue.jobs()) == 1
+    ctx.send.assert_called_once_with(
+        texts.ERROR_JOB_IN_PROGRESS.format(discord_user_id=ctx.author.user.id),
+        suppress_embeds=True,
+    )
+    building.set()
+
+
+@pytest.mark.asyncio
+async def test_create_server_still_building(
+    ctx,
+    fake_cloud,
+    openstackclient,
+    flavor_id,
+    image_id,
+    keypair,
+    find_user_db_patch_some_user,
+):
+    """
+    Test the create command while the user's server has no address yet.
+
+    The create command should answer that the server is still building.
+    """
+    user = find_user_db_patch_some_user.return_value
+    fake_cloud.build_time = 60
+    server = openstackclient.create_server(
+        name=cloud.DEFAULT_SERVER_NAME,
+        key_name=keypair.name,
+        flavor=flavor_id,
+        image=image_id,
+    )
+    fake_cloud.calls.clear()
+
+    await commands.create_server(ctx, user, openstackclient, flavor_id, image_id)
+
+    assert fake_cloud.calls["create_server"] == 0
+    ctx.send.assert_called_once_with(
+        texts.ERROR_SERVER_BUILDING.format(
+            discord_user_id=ctx.author.user.id,
+            server_name=server.name,
+            status="BUILD",
         ),
         suppress_embeds=True,
     )
+
+
+@pytest.mark.asyncio
+async def test_create_server_over_quota(
+    ctx,
+    fake_cloud,
+    openstackclient,
+    flavor_id,
+    image_id,
+    keypair,
+    security_group,
+    find_user_db_patch_some_user,
+):
+    """
+    Test the create command in a project without room for another server.
+
+    The job should send Nova's quota error to the user.
+    """
+    user = find_user_db_patch_some_user.return_value
+    fake_cloud.quotas["instances"] = 0
+
+    job = await commands.create_server(ctx, user, openstackclient, flavor_id, image_id)
+    await job.wait()
+
+    assert fake_cloud.servers == {}
+    message = ctx.send.call_args.args[0]
+    assert message.startswith(f"<@{ctx.author.user.id}> ")
+    assert "Quota exceeded for instances" in message
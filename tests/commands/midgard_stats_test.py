@@ -0,0 +1,35 @@
+import pytest
+
+from midgard_discord import commands
+
+
+@pytest.mark.asyncio
+async def test_stats(ctx):
+    """The stats command should render latencies, pools and caches."""
+    histogram = {"count": 3, "mean": 0.2, "p50": 0.1, "p95": 0.25, "p99": 0.3}
+    await commands.stats(
+        ctx,
+        {
+            "commands": {"server create": histogram},
+            "operations": {"cloud.create_server": histogram},
+            "waits": {"mutate": histogram},
+            "pools": {
+                "mutate": {
+                    "workers": 4,
+                    "running": 1,
+                    "queued": 2,
+                    "blocked": 0,
+                    "rejected": 0,
+                }
+            },
+            "credential_cache": {"hits": 5, "misses": 1, "size": 1},
+            "warmup": {"role": "ready", "flavors": "failed"},
+        },
+    )
+
+    message = ctx.send.call_args.args[0]
+    assert "server create" in message and "100/250/300" in message
+    assert "mutate" in message and "1/4 2 0 0" in message
+    assert "5 hits, 1 misses" in message
+    assert "role ready, flavors failed" in message
+    assert ctx.send.call_args.kwargs["ephemeral"] is True
@@ -0,0 +1,151 @@
+import asyncio
+import time
+import pytest
+
+from midgard_discord import concurrency
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_call():
+    """Identical lookups in flight should share one call."""
+    flights = concurrency.SingleFlight()
+    calls = 0
+
+    async def lookup():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return ["m1.small"]
+
+    results = await asyncio.gather(
+        *(flights.run(("flavor", "m1"), lookup) for _ in range(40))
+    )
+
+    assert calls == 1
+    assert all(result == ["m1.small"] for result in results)
+    assert len(flights) == 0
+    # A finished call is not reused
+    await flights.run(("flavor", "m1"), lookup)
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_single_flight_survives_one_cancelled_caller():
+    """Cancelling one caller should not cancel the call for the others."""
+    flights = concurrency.SingleFlight()
+
+    async def lookup():
+        await asyncio.sleep(0.01)
+        return "ubuntu"
+
+    first = asyncio.ensure_future(flights.run("image", lookup))
+    second = asyncio.ensure_future(flights.run("image", lookup))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == "ubuntu"
+    assert first.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_single_flight_cancels_abandoned_call():
+    """A call should be cancelled once every caller has gone."""
+    flights = concurrency.SingleFlight()
+    started = asyncio.Event()
+    cancelled = False
+
+    async def lookup():
+        nonlocal cancelled
+        started.set()
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+
+    caller = asyncio.ensure_future(flights.run("image", lookup))
+    await started.wait()
+    caller.cancel()
+    await asyncio.sleep(0.01)
+
+    assert cancelled
+    assert len(flights) == 0
+
+
+@pytest.mark.asyncio
+async def test_latest_only_supersedes():
+    """A newer keystroke should cancel the older lookup of the same user."""
+    latest = concurrency.LatestOnly()
+
+    async def lookup(query):
+        await asyncio.sleep(0.01)
+        return query
+
+    older = asyncio.ensure_future(latest.run(("alice", "image"), lambda: lookup("u")))
+    await asyncio.sleep(0)
+    other = asyncio.ensure_future(latest.run(("bob", "image"), lambda: lookup("d")))
+    newer = await latest.run(("alice", "image"), lambda: lookup("ub"))
+
+    assert newer == "ub"
+    with pytest.raises(concurrency.SupersededError):
+        await older
+    assert await other == "d"
+
+
+@pytest.mark.asyncio
+async def test_latest_only_propagates_own_cancellation():
+    """Cancelling the caller itself should not look like a superseded call."""
+    latest = concurrency.LatestOnly()
+
+    caller = asyncio.ensure_future(latest.run("alice", lambda: asyncio.sleep(1)))
+    await asyncio.sleep(0)
+    caller.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+
+
+@pytest.mark.asyncio
+async def test_token_bucket():
+    """Calls beyond the burst should be spread at rate per second."""
+    bucket = concurrency.TokenBucket(rate=100, burst=5)
+
+    start = time.monotonic()
+    await asyncio.gather(*(bucket.acquire() for _ in range(10)))
+    elapsed = time.monotonic() - start
+
+    # 5 calls pass at once, the next 5 wait 10ms each
+    assert 0.04 <= elapsed < 0.5
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_timeout():
+    """Calls that would wait longer than their timeout should give up at once."""
+    bucket = concurrency.TokenBucket(rate=10, burst=2)
+
+    results = await asyncio.gather(*(bucket.acquire(timeout=0.15) for _ in range(5)))
+
+    # 2 pass at once and 1 more is earned within 0.15s
+    assert results == [True, True, True, False, False]
+
+
+@pytest.mark.asyncio
+async def test_keyed_lock_serialises_each_key():
+    """Callers of one key should take turns, other keys should not wait."""
+    locks = concurrency.KeyedLock()
+    running = {"alice": 0, "bob": 0}
+    overlaps = []
+
+    async def command(key):
+        async with locks(key):
+            running[key] += 1
+            overlaps.append(dict(running))
+            await asyncio.sleep(0.01)
+            running[key] -= 1
+
+    await asyncio.gather(*(command(key) for key in ("alice", "alice", "bob")))
+
+    assert all(counts["alice"] <= 1 for counts in overlaps)
+    assert {"alice": 1, "bob": 1} in overlaps
+    # Unused locks are dropped from the table
+    assert len(locks) == 0
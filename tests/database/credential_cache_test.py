@@ -0,0 +1,97 @@
+import pytest
+import pytest_asyncio
+from unittest.mock import patch
+
+from midgard_discord import database
+
+TEST_DB_URI = "sqlite+aiosqlite:///:memory:"
+
+
+@pytest.fixture
+def cache():
+    """Enable the credential cache for one test."""
+    cache = database.CredentialCache(ttl=60, max_size=2)
+    with patch("midgard_discord.database.credential_cache", cache):
+        yield cache
+
+
+@pytest_asyncio.fixture
+async def async_session():
+    engine, async_session = await database.init_async_db(TEST_DB_URI)
+    yield async_session
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_cache_hit(cache, async_session):
+    """A second lookup should be served from the cache."""
+    await database.create_user(
+        async_session, "test_user", password="test_password", project_name="test"
+    )
+    first = await database.find_user(async_session, "test_user")
+    second = await database.find_user(async_session, "test_user")
+
+    assert first is second
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+@pytest.mark.asyncio
+async def test_cache_negative_and_invalidate(cache, async_session):
+    """Unregistered users are cached until they register."""
+    assert await database.find_user(async_session, "test_user") is None
+    assert await database.find_user(async_session, "test_user") is None
+    assert cache.hits == 1
+
+    await database.create_user(
+        async_session, "test_user", password="test_password", project_name="test"
+    )
+    user = await database.find_user(async_session, "test_user")
+
+    assert user is not None
+    assert user.username == "test_user"
+
+
+@pytest.mark.asyncio
+async def test_cache_skips_read_raced_by_invalidation(cache, async_session):
+    """A lookup that started before a registration should not cache None."""
+    version = cache.version()
+    # The registration lands while the lookup is in flight
+    await database.create_user(
+        async_session, "test_user", password="test_password", project_name="test"
+    )
+    cache.set("test_user", None, version)
+
+    assert cache.get("test_user") == (False, None)
+    assert await database.find_user(async_session, "test_user") is not None
+
+
+def test_cache_expiry():
+    """Expired entries should be misses."""
+    cache = database.CredentialCache(ttl=60, negative_ttl=0)
+    cache.set("unregistered", None)
+    cache.set("registered", "credential")
+
+    assert cache.get("unregistered") == (False, None)
+    assert cache.get("registered") == (True, "credential")
+
+
+def test_cache_lru_eviction():
+    """The least recently used user should be evicted first."""
+    cache = database.CredentialCache(ttl=60, max_size=2)
+    cache.set("alice", "a")
+    cache.set("bob", "b")
+    cache.get("alice")
+    cache.set("carol", "c")
+
+    assert len(cache) == 2
+    assert cache.get("bob") == (False, None)
+    assert cache.get("alice") == (True, "a")
+
+
+def test_cache_disabled():
+    """Without a TTL nothing should be cached."""
+    cache = database.CredentialCache()
+    cache.set("alice", "a")
+
+    assert not cache.enabled
+    assert len(cache) == 0
@@ -1,6 +1,15 @@
 import datetime
 import pytest
-from midgard_discord.database import init_async_db, find_user, create_user
+from midgard_discord.database import (
+    init_async_db,
+    create_engine,
+    create_schema,
+    find_user,
+    find_users,
+    create_user,
+    insert_users,
+    upsert_users,
+)
 
 TEST_DB_URI = "sqlite+aiosqlite:///:memory:"
 
@@ -46,3 +55,67 @@ async def test_create_and_find_user():
     assert now > result.created_at
     assert now > result.updated_at
     await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_create_engine_shared_pool(tmp_path):
+    engine, async_session = create_engine(
+        f"sqlite+aiosqlite:///{tmp_path}/midgard.db", pool_size=2, max_overflow=1
+    )
+    assert engine.pool.size() == 2
+    await create_schema(engine)
+    # Sessions from the same factory share one engine and its connection pool
+    await create_user(
+        async_session, "test_user", password="test_password", project_name="test"
+    )
+    result = await find_user(async_session, "test_user")
+    assert result.username == "test_user"
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_find_users():
+    engine, async_session = await init_async_db(TEST_DB_URI)
+    await create_user(async_session, "alice", password="a", project_name="p_alice")
+    result = await find_users(async_session, ["alice", "bob", "alice"])
+    assert list(result) == ["alice", "bob"]
+    assert result["alice"].project_name == "p_alice"
+    assert result["bob"] is None
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_upsert_users():
+    engine, async_session = await init_async_db(TEST_DB_URI)
+    await create_user(async_session, "alice", password="old", project_name="p")
+    await upsert_users(
+        async_session,
+        [
+            {"username": "alice", "password": "new", "project_name": "p_alice"},
+            {"username": "bob", "password": "b", "project_name": "p_bob"},
+        ],
+    )
+    result = await find_users(async_session, ["alice", "bob"])
+    assert result["alice"].password == "new"
+    assert result["alice"].project_name == "p_alice"
+    assert result["bob"].password == "b"
+    # Nothing to write is not an error
+    await upsert_users(async_session, [])
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_insert_users_keeps_existing():
+    engine, async_session = await init_async_db(TEST_DB_URI)
+    await create_user(async_session, "alice", password="newer", project_name="p")
+    await insert_users(
+        async_session,
+        [
+            {"username": "alice", "password": "older", "project_name": "p"},
+            {"username": "bob", "password": "b", "project_name": "p_bob"},
+        ],
+    )
+    result = await find_users(async_session, ["alice", "bob"])
+    assert result["alice"].password == "newer"
+    assert result["bob"].password == "b"
+    await engine.dispose()
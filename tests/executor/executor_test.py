@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import pytest
+
+from midgard_discord import executor
+
+
+@pytest.mark.asyncio
+async def test_run_in_pool():
+    """Calls should run in the pool's threads and be counted."""
+    pool = executor.Executor("read", max_workers=2)
+
+    name = await pool.run(lambda: threading.current_thread().name)
+
+    assert name.startswith("midgard-read")
+    stats = pool.stats()
+    assert stats["completed"] == 1
+    assert stats["queued"] == 0 and stats["running"] == 0
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_pools_are_isolated():
+    """A saturated pool should not delay calls in another pool."""
+    wait = executor.Executor("wait", max_workers=1)
+    read = executor.Executor("read", max_workers=1)
+    release = threading.Event()
+
+    slow = asyncio.ensure_future(wait.run(release.wait))
+    await asyncio.sleep(0.01)
+    assert await asyncio.wait_for(read.run(lambda: "flavor"), 1) == "flavor"
+    assert wait.stats()["running"] == 1
+
+    release.set()
+    await slow
+    wait.shutdown()
+    read.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_backpressure():
+    """Callers beyond workers + queue should wait, then time out if busy."""
+    pool = executor.Executor("mutate", max_workers=1, max_queue=1, busy_timeout=0.05)
+    release = threading.Event()
+
+    running = [asyncio.ensure_future(pool.run(release.wait)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    assert pool.stats()["queued"] == 1
+
+    with pytest.raises(executor.ExecutorBusyError):
+        await pool.run(lambda: None)
+    assert pool.stats()["rejected"] == 1
+    assert pool.stats()["blocked"] == 0
+
+    release.set()
+    await asyncio.gather(*running)
+    assert pool.stats()["completed"] == 2
+    assert pool.stats()["wait_max"] > 0
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_keeps_slot_until_call_finishes():
+    """A running call should hold its slot even if its caller gives up."""
+    pool = executor.Executor("wait", max_workers=1, max_queue=0, busy_timeout=0.05)
+    release = threading.Event()
+
+    caller = asyncio.ensure_future(pool.run(release.wait))
+    await asyncio.sleep(0.01)
+    caller.cancel()
+    await asyncio.gather(caller, return_exceptions=True)
+    assert pool.stats()["running"] == 1
+
+    with pytest.raises(executor.ExecutorBusyError):
+        await pool.run(lambda: None)
+
+    release.set()
+    await asyncio.sleep(0.05)
+    assert await pool.run(lambda: "free") == "free"
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_shutdown_drops_queued_calls():
+    """Calls still queued at shutdown should no longer count as queued."""
+    pool = executor.Executor("read", max_workers=1, max_queue=2)
+    release = threading.Event()
+
+    callers = [asyncio.ensure_future(pool.run(release.wait)) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    assert pool.stats()["queued"] == 2
+
+    pool.shutdown()
+    release.set()
+    results = await asyncio.gather(*callers, return_exceptions=True)
+
+    assert results[0] is True
+    assert all(isinstance(r, asyncio.CancelledError) for r in results[1:])
+    assert pool.stats()["queued"] == 0
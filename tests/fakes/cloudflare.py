@@ -0,0 +1,138 @@
+# Local CloudFlare API for tests and benchmarks
+import asyncio
+
+from aiohttp import web
+
+
+class FakeCloudflare:
+    """A local stand-in for the CloudFlare tunnel and DNS API.
+
+    latency seconds are added to every request, like a round-trip to the
+    real API.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.runner = None
+        self.ingress = [{"service": "http_status:404"}]
+        self.version = 1
+        self.dns_records = []
+        self.record_ids = 0
+        self.rate_limited = 0
+        self.peers = set()
+        self.requests = []
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get(
+            "/accounts/{account}/cfd_tunnel/{tunnel}/configurations", self.get_config
+        )
+        app.router.add_put(
+            "/accounts/{account}/cfd_tunnel/{tunnel}/configurations", self.put_config
+        )
+        app.router.add_get("/zones/{zone}/dns_records", self.list_records)
+        app.router.add_post("/zones/{zone}/dns_records", self.create_record)
+        app.router.add_delete("/zones/{zone}/dns_records/{id}", self.delete_record)
+        return app
+
+    def throttled(self) -> web.Response:
+        if self.rate_limited:
+            self.rate_limited -= 1
+            return web.json_response(
+                {"success": False}, status=429, headers={"Retry-After": "0"}
+            )
+
+    async def track(self, request: web.Request) -> None:
+        self.peers.add(request.transport.get_extra_info("peername"))
+        self.requests.append((request.method, request.path))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def config(self) -> web.Response:
+        return web.json_response(
+            {
+                "success": True,
+                "result": {
+                    "config": {"ingress": self.ingress},
+                    "version": self.version,
+                },
+            }
+        )
+
+    async def get_config(self, request: web.Request) -> web.Response:
+        await self.track(request)
+        return self.config()
+
+    async def put_config(self, request: web.Request) -> web.Response:
+        await self.track(request)
+        self.ingress = (await request.json())["config"]["ingress"]
+        self.version += 1
+        return self.config()
+
+    async def list_records(self, request: web.Request) -> web.Response:
+        await self.track(request)
+        per_page = int(request.query["per_page"])
+        page = int(request.query["page"])
+        records = [
+            record
+            for record in self.dns_records
+            if record["content"] == request.query["content"]
+        ]
+        return web.json_response(
+            {
+                "success": True,
+                "result": records[(page - 1) * per_page : page * per_page],
+                "result_info": {
+                    "page": page,
+                    "total_pages": max(1, -(-len(records) // per_page)),
+                },
+            }
+        )
+
+    async def create_record(self, request: web.Request) -> web.Response:
+        await self.track(request)
+        throttled = self.throttled()
+        if throttled is not None:
+            return throttled
+        record = await request.json()
+        if any(r["name"] == record["name"] for r in self.dns_records):
+            return web.json_response(
+                {
+                    "success": False,
+                    "errors": [{"code": 81053, "message": "Record already exists."}],
+                },
+                status=400,
+            )
+        self.record_ids += 1
+        record["id"] = str(self.record_ids)
+        self.dns_records.append(record)
+        return web.json_response({"success": True, "result": record})
+
+    async def delete_record(self, request: web.Request) -> web.Response:
+        await self.track(request)
+        record_id = request.match_info["id"]
+        if not any(r["id"] == record_id for r in self.dns_records):
+            return web.json_response(
+                {
+                    "success": False,
+                    "errors": [{"code": 81044, "message": "Record does not exist."}],
+                },
+                status=404,
+            )
+        self.dns_records = [r for r in self.dns_records if r["id"] != record_id]
+        return web.json_response({"success": True, "result": {"id": record_id}})
+
+    async def start(self, host: str = "127.0.0.1") -> str:
+        """Serve the API on a free port and return its base URL."""
+        self.runner = web.AppRunner(self.app(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def close(self) -> None:
+        """Stop serving."""
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
@@ -0,0 +1,54 @@
+# Synthetic Discord interactions for tests and benchmarks
+import asyncio
+import itertools
+import time
+from types import SimpleNamespace
+
+
+class FakeContext:
+    """A CommandContext stand-in that keeps what the bot answers.
+
+    latency seconds are added to every response, like a round-trip to the
+    Discord API. responded_at is when the first response went out.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, user_id: int, name: str = None, latency: float = 0.0):
+        """Initialise the interaction of a user."""
+        self.id = next(self._ids)
+        self.author = SimpleNamespace(
+            name=name or f"user-{user_id}", user=SimpleNamespace(id=user_id)
+        )
+        self.latency = latency
+        self.deferred = False
+        self.responded = False
+        self.created_at = time.perf_counter()
+        self.responded_at = None
+        self.messages = []
+        self.choices = None
+
+    async def _respond(self) -> None:
+        """Wait out the API round-trip and note the first response."""
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.responded_at is None:
+            self.responded_at = time.perf_counter()
+
+    async def defer(self, ephemeral: bool = False, **kwargs) -> None:
+        await self._respond()
+        self.deferred = True
+
+    async def send(self, content: str = None, **kwargs) -> None:
+        await self._respond()
+        self.responded = True
+        self.messages.append(content)
+
+    async def edit(self, content: str = None, **kwargs) -> None:
+        await self._respond()
+        self.messages.append(content)
+
+    async def populate(self, choices: list) -> None:
+        await self._respond()
+        self.responded = True
+        self.choices = choices
@@ -0,0 +1,718 @@
+# In-process OpenStack for tests and benchmarks
+import collections
+import itertools
+import math
+import random
+import threading
+import time
+import uuid
+from typing import Callable, Union
+
+from openstack import exceptions
+from openstack.compute.v2.flavor import Flavor
+from openstack.compute.v2.keypair import Keypair
+from openstack.compute.v2.server import Server
+from openstack.identity.v3.project import Project
+from openstack.identity.v3.role import Role
+from openstack.identity.v3.user import User
+from openstack.image.v2.image import Image
+from openstack.network.v2.floating_ip import FloatingIP
+from openstack.network.v2.network import Network
+from openstack.network.v2.router import Router
+from openstack.network.v2.security_group import SecurityGroup
+from openstack.network.v2.security_group_rule import SecurityGroupRule
+from openstack.network.v2.subnet import Subnet
+
+from midgard_discord import cloud
+
+
+DEFAULT_FLAVORS = [
+    ("m1.tiny", 1, 512, 1),
+    ("m1.small", 1, 2048, 20),
+    ("m1.medium", 2, 4096, 40),
+    ("m1.large", 4, 8192, 80),
+]
+DEFAULT_IMAGES = [
+    ("Ubuntu 22.04", {"os_distro": "ubuntu"}),
+    ("Debian 12", {"os_distro": "debian"}),
+    ("Rocky Linux 9", {"os_admin_user": "rocky"}),
+]
+# Default project quotas of Nova and Neutron
+DEFAULT_QUOTAS = {
+    "instances": 10,
+    "keypairs": 100,
+    "networks": 100,
+    "subnets": 100,
+    "routers": 10,
+    "security_groups": 10,
+    "security_group_rules": 100,
+    "floatingip": 50,
+}
+# Quotas enforced by Nova, which answers 403 instead of Neutron's 409
+COMPUTE_QUOTAS = {"instances", "keypairs"}
+
+# A latency in seconds, or a distribution to draw it from
+Latency = Union[float, Callable[[random.Random], float]]
+
+
+def uniform(low: float, high: float) -> Callable[[random.Random], float]:
+    """Latencies spread evenly between low and high seconds."""
+    return lambda rng: rng.uniform(low, high)
+
+
+def lognormal(median: float, sigma: float = 0.5) -> Callable[[random.Random], float]:
+    """Latencies around median seconds with a long tail, like most APIs."""
+    return lambda rng: rng.lognormvariate(math.log(median), sigma)
+
+
+def api_error(cls: type, details: str) -> exceptions.HttpException:
+    """Return an SDK error with the explanation the API would answer."""
+    return cls(message=details, details=details)
+
+
+def unavailable() -> exceptions.HttpException:
+    """Return the error of an overloaded service."""
+    return exceptions.HttpException(message="Service Unavailable", http_status=503)
+
+
+def new_id() -> str:
+    """Return a random resource ID."""
+    return uuid.uuid4().hex
+
+
+def by_name_or_id(resources, name_or_id: str, ignore_missing: bool = True):
+    """Return the resource with an ID or name, like the SDK find_* calls."""
+    for resource in resources:
+        if name_or_id in (resource.id, resource.name):
+            return resource
+    if ignore_missing:
+        return None
+    raise exceptions.ResourceNotFound(f"No resource {name_or_id} found.")
+
+
+class FakeCloud:
+    """The shared state of a fake OpenStack deployment.
+
+    Every API call sleeps for its latency, blocking the calling thread like
+    the SDK does; latencies overrides it by call name, e.g.
+    "compute.create_server". A share failure_rate of calls fails with a
+    503, and fail() makes the next calls of a name fail. Project quotas
+    are enforced on creation. Servers stay in BUILD for build_time seconds.
+    Pass seed to draw the same latencies and failures on every run.
+    """
+
+    def __init__(
+        self,
+        latency: Latency = 0.0,
+        latencies: dict[str, Latency] = None,
+        build_time: float = 0.0,
+        quotas: dict[str, int] = None,
+        failure_rate: float = 0.0,
+        seed: int = None,
+    ):
+        """Initialise a deployment with a member role, a public network,
+        flavors and images."""
+        self.latency = latency
+        self.latencies = latencies or {}
+        self.build_time = build_time
+        self.quotas = {**DEFAULT_QUOTAS, **(quotas or {})}
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.failures = {}
+        self.lock = threading.RLock()
+        self.calls = collections.Counter()
+        self.projects = {}
+        self.users = {}
+        self.roles = {}
+        self.role_assignments = set()
+        self.networks = {}
+        self.routers = {}
+        self.subnets = {}
+        self.security_groups = {}
+        self.security_group_rules = {}
+        self.keypairs = {}
+        # Servers are kept as attributes and settle into their next status
+        self.servers = {}
+        self.settling = {}
+        self.floating_ips = {}
+        self.flavors = {}
+        self.images = {}
+        self._addresses = itertools.count(10)
+
+        role = Role(id=new_id(), name=cloud.DEFAULT_ROLE_NAME)
+        self.roles[role.id] = role
+        network = Network(
+            id=new_id(), name=cloud.DEFAULT_EXTERNAL_NETWORK, is_router_external=True
+        )
+        self.networks[network.id] = network
+        for name, vcpus, ram, disk in DEFAULT_FLAVORS:
+            flavor = Flavor(id=new_id(), name=name, vcpus=vcpus, ram=ram, disk=disk)
+            self.flavors[flavor.id] = flavor
+        for name, properties in DEFAULT_IMAGES:
+            image = Image(
+                id=new_id(),
+                name=name,
+                status="active",
+                properties=properties,
+                os_distro=properties.get("os_distro"),
+            )
+            self.images[image.id] = image
+
+    def call(self, name: str) -> None:
+        """Count an API call, wait out its latency and fail it if planned."""
+        with self.lock:
+            self.calls[name] += 1
+            latency = self.latencies.get(name, self.latency)
+            if callable(latency):
+                latency = latency(self.random)
+            error = self._failure(name)
+        if latency:
+            time.sleep(latency)
+        if error is not None:
+            raise error
+
+    def _failure(self, name: str) -> Exception:
+        """Return the error a call should fail with, if any."""
+        failure = self.failures.get(name)
+        if failure is not None:
+            error, times = failure
+            if times is not None:
+                if times <= 1:
+                    del self.failures[name]
+                else:
+                    self.failures[name] = (error, times - 1)
+            return error
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            return unavailable()
+        return None
+
+    def fail(self, name: str, error: Exception = None, times: int = 1) -> None:
+        """Make the next calls of a name fail, every one if times is None.
+
+        The error defaults to a 503, as from an overloaded service.
+        """
+        with self.lock:
+            self.failures[name] = (error or unavailable(), times)
+
+    def check_quota(self, resource: str, owner: str, used: int) -> None:
+        """Refuse to create a resource beyond the quota of its owner."""
+        limit = self.quotas.get(resource)
+        if owner is None or limit is None or used < limit:
+            return
+        if resource in COMPUTE_QUOTAS:
+            raise api_error(
+                exceptions.ForbiddenException,
+                f"Quota exceeded for {resource}: Requested 1, but "
+                f"already used {used} of {limit} {resource}",
+            )
+        raise api_error(
+            exceptions.ConflictException,
+            f"Quota exceeded for resources: ['{resource}'].",
+        )
+
+    def used(self, resources: dict, project_id: str) -> int:
+        """Return how many resources a project owns."""
+        return sum(
+            1
+            for resource in resources.values()
+            if (
+                resource["project_id"]
+                if isinstance(resource, dict)
+                else resource.project_id
+            )
+            == project_id
+        )
+
+    def connect(self, project_name: str = None, username: str = None, **kwargs):
+        """Return a connection scoped to a project, or an admin one.
+
+        Takes the arguments of cloud.connect, so it can stand in for it.
+        """
+        return FakeConnection(self, project_name, username)
+
+    def floating_ip(self) -> str:
+        """Return a new public address."""
+        return f"203.0.113.{next(self._addresses) % 250}"
+
+
+class Proxy:
+    """The calls of one OpenStack service, scoped to a connection."""
+
+    def __init__(self, connection: "FakeConnection"):
+        """Initialise the proxy of a connection."""
+        self._connection = connection
+        self._cloud = connection.cloud
+
+    def _project_id(self, project_id: str = None) -> str:
+        """Return the project a call applies to."""
+        if project_id is not None:
+            return project_id
+        project = self._connection.project
+        return project.id if project is not None else None
+
+    def _quota(self, resource: str, resources: dict, project_id: str) -> None:
+        """Refuse to create one more of a project's resources beyond quota."""
+        self._cloud.check_quota(
+            resource, project_id, self._cloud.used(resources, project_id)
+        )
+
+    def _owned(self, resources: dict, project_id: str = None) -> list:
+        """Return the resources of a project, or all of them for an admin."""
+        project_id = self._project_id(project_id)
+        return [
+            resource
+            for resource in resources.values()
+            if project_id is None or resource.project_id == project_id
+        ]
+
+
+class IdentityProxy(Proxy):
+    """Keystone projects, users and role assignments."""
+
+    def find_project(self, name_or_id: str, ignore_missing: bool = True):
+        self._cloud.call("identity.find_project")
+        with self._cloud.lock:
+            return by_name_or_id(
+                list(self._cloud.projects.values()), name_or_id, ignore_missing
+            )
+
+    def create_project(self, name: str, **attrs):
+        self._cloud.call("identity.create_project")
+        with self._cloud.lock:
+            if by_name_or_id(self._cloud.projects.values(), name) is not None:
+                raise api_error(
+                    exceptions.ConflictException,
+                    f"Conflict occurred attempting to store project - "
+                    f"it is not permitted to have two projects with the same "
+                    f"name in the same domain : {name}.",
+                )
+            project = Project(id=new_id(), name=name, **attrs)
+            self._cloud.projects[project.id] = project
+            return project
+
+    def find_user(self, name_or_id: str, ignore_missing: bool = True):
+        self._cloud.call("identity.find_user")
+        with self._cloud.lock:
+            return by_name_or_id(
+                list(self._cloud.users.values()), name_or_id, ignore_missing
+            )
+
+    def create_user(self, name: str, default_project=None, password=None, **attrs):
+        self._cloud.call("identity.create_user")
+        with self._cloud.lock:
+            if by_name_or_id(self._cloud.users.values(), name) is not None:
+                raise api_error(
+                    exceptions.ConflictException,
+                    f"Duplicate entry found with name {name}.",
+                )
+            user = User(
+                id=new_id(),
+                name=name,
+                default_project_id=getattr(default_project, "id", default_project),
+                password=password,
+                **attrs,
+            )
+            self._cloud.users[user.id] = user
+            return user
+
+    def update_user(self, user, **attrs):
+        self._cloud.call("identity.update_user")
+        with self._cloud.lock:
+            stored = self._cloud.users.get(user.id)
+            if stored is None:
+                raise exceptions.ResourceNotFound(f"No user {user.id} found.")
+            stored._update(**attrs)
+            return stored
+
+    def find_role(self, name_or_id: str, ignore_missing: bool = True):
+        self._cloud.call("identity.find_role")
+        with self._cloud.lock:
+            return by_name_or_id(
+                list(self._cloud.roles.values()), name_or_id, ignore_missing
+            )
+
+    def assign_project_role_to_user(self, project, user, role):
+        self._cloud.call("identity.assign_project_role_to_user")
+        with self._cloud.lock:
+            self._cloud.role_assignments.add((project.id, user.id, role.id))
+
+
+class NetworkProxy(Proxy):
+    """Neutron networks, routers, subnets and security groups."""
+
+    def find_network(
+        self, name_or_id: str, ignore_missing: bool = True, project_id: str = None
+    ):
+        self._cloud.call("network.find_network")
+        with self._cloud.lock:
+            networks = [
+                network
+                for network in self._cloud.networks.values()
+                if project_id is None
+                or network.project_id == project_id
+                or network.is_router_external
+            ]
+            return by_name_or_id(networks, name_or_id, ignore_missing)
+
+    def create_network(self, project_id: str = None, **attrs):
+        self._cloud.call("network.create_network")
+        project_id = self._project_id(project_id)
+        with self._cloud.lock:
+            self._quota("networks", self._cloud.networks, project_id)
+            network = Network(id=new_id(), project_id=project_id, **attrs)
+            self._cloud.networks[network.id] = network
+            return network
+
+    def create_router(self, project_id: str = None, **attrs):
+        self._cloud.call("network.create_router")
+        project_id = self._project_id(project_id)
+        with self._cloud.lock:
+            self._quota("routers", self._cloud.routers, project_id)
+            router = Router(id=new_id(), project_id=project_id, **attrs)
+            self._cloud.routers[router.id] = router
+            return router
+
+    def create_subnet(self, network_id: str, project_id: str = None, **attrs):
+        self._cloud.call("network.create_subnet")
+        project_id = self._project_id(project_id)
+        with self._cloud.lock:
+            if network_id not in self._cloud.networks:
+                raise exceptions.ResourceNotFound(f"Network {network_id} not found.")
+            self._quota("subnets", self._cloud.subnets, project_id)
+            subnet = Subnet(
+                id=new_id(), network_id=network_id, project_id=project_id, **attrs
+            )
+            self._cloud.subnets[subnet.id] = subnet
+            return subnet
+
+    def add_interface_to_router(self, router, subnet_id: str = None, port_id=None):
+        self._cloud.call("network.add_interface_to_router")
+        with self._cloud.lock:
+            if router.id not in self._cloud.routers:
+                raise exceptions.ResourceNotFound(f"Router {router.id} not found.")
+            if subnet_id not in self._cloud.subnets:
+                raise exceptions.ResourceNotFound(f"Subnet {subnet_id} not found.")
+            return {"id": router.id, "subnet_id": subnet_id}
+
+    def find_security_group(
+        self, name_or_id: str, ignore_missing: bool = True, project_id: str = None
+    ):
+        self._cloud.call("network.find_security_group")
+        with self._cloud.lock:
+            return by_name_or_id(
+                self._owned(self._cloud.security_groups, project_id),
+                name_or_id,
+                ignore_missing,
+            )
+
+    def create_security_group(self, project_id: str = None, **attrs):
+        self._cloud.call("network.create_security_group")
+        project_id = self._project_id(project_id)
+        with self._cloud.lock:
+            self._quota("security_groups", self._cloud.security_groups, project_id)
+            security_group = SecurityGroup(id=new_id(), project_id=project_id, **attrs)
+            self._cloud.security_groups[security_group.id] = security_group
+            return security_group
+
+    def create_security_group_rule(self, security_group_id: str, **attrs):
+        self._cloud.call("network.create_security_group_rule")
+        with self._cloud.lock:
+            security_group = self._cloud.security_groups.get(security_group_id)
+            if security_group is None:
+                raise exceptions.ResourceNotFound(
+                    f"Security group {security_group_id} not found."
+                )
+            for rule in self._cloud.security_group_rules.values():
+                if rule.security_group_id == security_group_id and all(
+                    getattr(rule, key) == value for key, value in attrs.items()
+                ):
+                    raise api_error(
+                        exceptions.ConflictException,
+                        f"Security group rule already exists. "
+                        f"Rule id is {rule.id}.",
+                    )
+            self._quota(
+                "security_group_rules",
+                self._cloud.security_group_rules,
+                security_group.project_id,
+            )
+            rule = SecurityGroupRule(
+                id=new_id(),
+                security_group_id=security_group_id,
+                project_id=security_group.project_id,
+                **attrs,
+            )
+            self._cloud.security_group_rules[rule.id] = rule
+            return rule
+
+
+class ComputeProxy(Proxy):
+    """Nova keypairs, servers and flavors."""
+
+    def find_keypair(self, name_or_id: str, ignore_missing: bool = True):
+        self._cloud.call("compute.find_keypair")
+        with self._cloud.lock:
+            keypair = self._cloud.keypairs.get((self._connection.username, name_or_id))
+        if keypair is None and not ignore_missing:
+            raise exceptions.ResourceNotFound(f"No keypair {name_or_id} found.")
+        return keypair
+
+    def create_keypair(self, name: str, public_key: str = None, **attrs):
+        self._cloud.call("compute.create_keypair")
+        if public_key is not None and not public_key.startswith(("ssh-", "ecdsa-")):
+            raise api_error(
+                exceptions.BadRequestException,
+                "Keypair data is invalid: failed to generate fingerprint",
+            )
+        username = self._connection.username
+        with self._cloud.lock:
+            if (username, name) in self._cloud.keypairs:
+                raise api_error(
+                    exceptions.ConflictException, f"Key pair '{name}' already exists."
+                )
+            # Keypairs belong to users, not projects
+            self._cloud.check_quota(
+                "keypairs",
+                username,
+                sum(1 for owner, _ in self._cloud.keypairs if owner == username),
+            )
+            keypair = Keypair(id=name, name=name, public_key=public_key, **attrs)
+            self._cloud.keypairs[username, name] = keypair
+            return keypair
+
+    def delete_keypair(self, keypair, ignore_missing: bool = True):
+        self._cloud.call("compute.delete_keypair")
+        with self._cloud.lock:
+            self._cloud.keypairs.pop((self._connection.username, keypair.name), None)
+
+    def find_server(self, name_or_id: str, ignore_missing: bool = True, **query):
+        self._cloud.call("compute.find_server")
+        with self._cloud.lock:
+            project_id = self._project_id()
+            for attrs in self._cloud.servers.values():
+                if name_or_id in (attrs["id"], attrs["name"]) and (
+                    project_id is None or attrs["project_id"] == project_id
+                ):
+                    return self._connection._settle(attrs)
+        if not ignore_missing:
+            raise exceptions.ResourceNotFound(f"No server {name_or_id} found.")
+        return None
+
+    def get_server(self, server):
+        self._cloud.call("compute.get_server")
+        with self._cloud.lock:
+            attrs = self._cloud.servers.get(server.id)
+            if attrs is None:
+                raise exceptions.ResourceNotFound(f"No server {server.id} found.")
+            return self._connection._settle(attrs)
+
+    def rebuild_server(self, server, image: str = None, **attrs):
+        self._cloud.call("compute.rebuild_server")
+        with self._cloud.lock:
+            image = by_name_or_id(self._cloud.images.values(), image)
+            if image is None:
+                raise api_error(exceptions.BadRequestException, "Invalid image.")
+            attrs = self._cloud.servers[server.id]
+            attrs["image"] = {"id": image.id}
+            return self._connection._transition(attrs, "REBUILD", "ACTIVE")
+
+    def resize_server(self, server, flavor):
+        self._cloud.call("compute.resize_server")
+        with self._cloud.lock:
+            flavor = by_name_or_id(
+                self._cloud.flavors.values(), getattr(flavor, "id", flavor)
+            )
+            if flavor is None:
+                raise api_error(exceptions.BadRequestException, "Invalid flavor.")
+            attrs = self._cloud.servers[server.id]
+            attrs["flavor"] = {"id": flavor.id, "original_name": flavor.name}
+            self._connection._transition(attrs, "RESIZE", "VERIFY_RESIZE")
+
+    def confirm_server_resize(self, server):
+        self._cloud.call("compute.confirm_server_resize")
+        with self._cloud.lock:
+            self._connection._transition(
+                self._cloud.servers[server.id], "ACTIVE", "ACTIVE"
+            )
+
+    def find_flavor(self, name_or_id: str, ignore_missing: bool = True):
+        self._cloud.call("compute.find_flavor")
+        with self._cloud.lock:
+            return by_name_or_id(
+                list(self._cloud.flavors.values()), name_or_id, ignore_missing
+            )
+
+    def flavors(self, limit: int = None, **query):
+        """Yield flavors sorted by name, one call per page of limit."""
+        with self._cloud.lock:
+            flavors = sorted(self._cloud.flavors.values(), key=lambda f: f.name)
+        yield from self._connection._pages("compute.flavors", flavors, limit)
+
+
+class ImageProxy(Proxy):
+    """Glance images."""
+
+    def images(self, limit: int = None, status: str = None, **query):
+        """Yield images sorted by name, one call per page of limit."""
+        with self._cloud.lock:
+            images = sorted(
+                (
+                    image
+                    for image in self._cloud.images.values()
+                    if status is None or image.status == status
+                ),
+                key=lambda image: image.name,
+            )
+        yield from self._connection._pages("image.images", images, limit)
+
+    def find_image(self, name_or_id: str, ignore_missing: bool = True):
+        self._cloud.call("image.find_image")
+        with self._cloud.lock:
+            return by_name_or_id(
+                list(self._cloud.images.values()), name_or_id, ignore_missing
+            )
+
+
+class FakeConnection:
+    """The subset of openstack.connection.Connection the bot uses.
+
+    A connection made with a project name only sees that project's
+    resources, like a user's scoped token; one without is an admin.
+    """
+
+    def __init__(self, cloud: FakeCloud, project_name: str = None, username=None):
+        """Initialise a connection to a fake deployment."""
+        self.cloud = cloud
+        self.project_name = project_name
+        self.username = username
+        self.closed = False
+        self.identity = IdentityProxy(self)
+        self.network = NetworkProxy(self)
+        self.compute = ComputeProxy(self)
+        self.image = ImageProxy(self)
+
+    @property
+    def project(self) -> Project:
+        """Return the project the connection is scoped to, if any."""
+        if self.project_name is None:
+            return None
+        with self.cloud.lock:
+            return by_name_or_id(self.cloud.projects.values(), self.project_name)
+
+    def close(self) -> None:
+        self.closed = True
+
+    def _pages(self, name: str, resources: list, limit: int = None):
+        """Yield resources, making one call per page like a paginated listing."""
+        limit = limit or len(resources) or 1
+        for start in range(0, len(resources) + 1, limit):
+            self.cloud.call(name)
+            yield from resources[start : start + limit]
+
+    def _transition(self, attrs: dict, status: str, settled: str) -> Server:
+        """Put a server in status until build_time has passed, then settled."""
+        attrs["status"] = status
+        self.cloud.settling[attrs["id"]] = (
+            time.monotonic() + self.cloud.build_time,
+            settled,
+        )
+        return self._settle(attrs)
+
+    def _settle(self, attrs: dict) -> Server:
+        """Return a server, in its settled status once its time has come."""
+        settling = self.cloud.settling.get(attrs["id"])
+        if settling is not None and time.monotonic() >= settling[0]:
+            attrs["status"] = settling[1]
+            del self.cloud.settling[attrs["id"]]
+        return Server(**attrs)
+
+    def create_server(
+        self,
+        name: str,
+        image=None,
+        flavor=None,
+        key_name: str = None,
+        security_groups: list = None,
+        wait: bool = False,
+        **kwargs,
+    ) -> Server:
+        self.cloud.call("create_server")
+        project = self.project
+        project_id = project.id if project is not None else None
+        with self.cloud.lock:
+            image = by_name_or_id(self.cloud.images.values(), image)
+            flavor = by_name_or_id(self.cloud.flavors.values(), flavor)
+            if image is None or flavor is None:
+                raise api_error(
+                    exceptions.BadRequestException,
+                    "Invalid flavorRef or imageRef provided.",
+                )
+            if (self.username, key_name) not in self.cloud.keypairs:
+                raise api_error(
+                    exceptions.BadRequestException, "Invalid key_name provided."
+                )
+            self.cloud.check_quota(
+                "instances", project_id, self.cloud.used(self.cloud.servers, project_id)
+            )
+            attrs = {
+                "id": new_id(),
+                "name": name,
+                "project_id": project_id,
+                "key_name": key_name,
+                "image": {"id": image.id},
+                "flavor": {"id": flavor.id, "original_name": flavor.name},
+                "security_groups": [{"name": group} for group in security_groups or []],
+                "addresses": {
+                    "default": [{"addr": "10.0.0.8", "OS-EXT-IPS:type": "fixed"}]
+                },
+            }
+            self.cloud.servers[attrs["id"]] = attrs
+            server = self._transition(attrs, "BUILD", "ACTIVE")
+        if wait:
+            time.sleep(self.cloud.build_time)
+            return self.compute.get_server(server)
+        return server
+
+    def available_floating_ip(self, network: str = None, server=None):
+        self.cloud.call("available_floating_ip")
+        project = self.project
+        project_id = project.id if project is not None else None
+        with self.cloud.lock:
+            for floating_ip in self.cloud.floating_ips.values():
+                if floating_ip.port_id is None and (
+                    project_id is None or floating_ip.project_id == project_id
+                ):
+                    return floating_ip
+            self.cloud.check_quota(
+                "floatingip",
+                project_id,
+                self.cloud.used(self.cloud.floating_ips, project_id),
+            )
+            floating_ip = FloatingIP(
+                id=new_id(),
+                floating_ip_address=self.cloud.floating_ip(),
+                project_id=project_id,
+                port_id=None,
+            )
+            self.cloud.floating_ips[floating_ip.id] = floating_ip
+            return floating_ip
+
+    def add_ips_to_server(
+        self, server, auto_ip: bool = True, reuse: bool = True, wait=False, **kwargs
+    ) -> Server:
+        floating_ip = self.available_floating_ip(server=server)
+        self.cloud.call("add_ips_to_server")
+        with self.cloud.lock:
+            attrs = self.cloud.servers[server.id]
+            floating_ip._update(port_id=server.id)
+            attrs["addresses"] = {
+                **attrs["addresses"],
+                "default": attrs["addresses"]["default"]
+                + [
+                    {
+                        "addr": floating_ip.floating_ip_address,
+                        "OS-EXT-IPS:type": "floating",
+                    }
+                ],
+            }
+            return self._settle(attrs)
@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+
+from midgard_discord import jobs
+
+
+@pytest.mark.asyncio
+async def test_submit_returns_immediately():
+    """Submitting should not wait for the job to finish."""
+    queue = jobs.JobQueue()
+    release = asyncio.Event()
+
+    async def work(job):
+        await release.wait()
+        return "server"
+
+    job = queue.submit("alice", "server create", work)
+    await asyncio.sleep(0)
+
+    assert job.status == "running"
+    assert queue.jobs("alice") == [job]
+    release.set()
+    assert await job.wait() == "server"
+    assert job.status == "done"
+    assert queue.jobs() == []
+
+
+@pytest.mark.asyncio
+async def test_per_user_limit():
+    """A user should not run more jobs than allowed."""
+    queue = jobs.JobQueue(max_per_user=1)
+    release = asyncio.Event()
+
+    async def work(job):
+        await release.wait()
+
+    job = queue.submit("alice", "server create", work)
+    with pytest.raises(jobs.JobLimitError):
+        queue.submit("alice", "server rebuild", work)
+    other = queue.submit("bob", "server create", work)
+
+    release.set()
+    await asyncio.gather(job.wait(), other.wait())
+    # Finished jobs free the slot
+    await queue.submit("alice", "server rebuild", work).wait()
+
+
+@pytest.mark.asyncio
+async def test_global_limit():
+    """No more than max_concurrent jobs should run at once."""
+    queue = jobs.JobQueue(max_concurrent=2, max_per_user=10)
+    running = 0
+    peak = 0
+
+    async def work(job):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    submitted = [queue.submit(str(i), "server create", work) for i in range(6)]
+    await asyncio.sleep(0)
+    assert [job.status for job in submitted].count("queued") == 4
+
+    await asyncio.gather(*(job.wait() for job in submitted))
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_job():
+    """A failing job should be marked failed and release its slot."""
+    queue = jobs.JobQueue()
+
+    async def work(job):
+        raise RuntimeError("No valid host was found.")
+
+    job = queue.submit("alice", "server create", work)
+    with pytest.raises(RuntimeError):
+        await job.wait()
+    assert job.status == "failed"
+    assert queue.jobs("alice") == []
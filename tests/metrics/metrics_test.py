@@ -0,0 +1,95 @@
+import aiohttp
+import pytest
+from types import SimpleNamespace
+
+from midgard_discord import metrics
+from midgard_discord import tracing
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    tracing.reset()
+    metrics.autocompletes.clear()
+    metrics.caches.clear()
+    yield
+    tracing.reset()
+    metrics.autocompletes.clear()
+    metrics.caches.clear()
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = tracing.Histogram()
+    for value in (0.001, 0.005, 0.3, 100):
+        histogram.observe(value)
+
+    buckets = dict(histogram.cumulative())
+    assert buckets[0.005] == 2
+    assert buckets[0.25] == 2
+    assert buckets[0.5] == 3
+    assert buckets[60] == 3
+    assert buckets[float("inf")] == 4
+
+
+def test_format_labels_escapes_values():
+    assert metrics.format_labels({}) == ""
+    assert metrics.format_labels({"command": 'say "hi"\n'}) == (
+        '{command="say \\"hi\\"\\n"}'
+    )
+
+
+def test_render():
+    tracing.commands["midgard-register"].observe(0.2)
+    tracing.errors["midgard-register"] += 1
+    tracing.operations["cloud.find_server"].observe(0.02)
+    tracing.operations["networking.create_dns_record"].observe(0.4)
+    metrics.autocompletes["flavor", "ok"] += 3
+    metrics.caches["flavors"] = SimpleNamespace(hits=3, misses=1)
+
+    text = metrics.render()
+
+    assert "# TYPE midgard_command_duration_seconds histogram" in text
+    assert (
+        'midgard_command_duration_seconds_bucket{command="midgard-register",le="0.25"} 1'
+        in text
+    )
+    assert (
+        'midgard_command_duration_seconds_bucket{command="midgard-register",le="0.1"} 0'
+        in text
+    )
+    assert (
+        'midgard_command_duration_seconds_bucket{command="midgard-register",le="+Inf"} 1'
+        in text
+    )
+    assert (
+        'midgard_command_duration_seconds_count{command="midgard-register"} 1' in text
+    )
+    assert 'midgard_command_errors_total{command="midgard-register"} 1' in text
+    assert 'midgard_autocomplete_total{option="flavor",outcome="ok"} 3' in text
+    assert (
+        'midgard_backend_duration_seconds_count{backend="openstack",operation="find_server"} 1'
+        in text
+    )
+    assert (
+        'midgard_backend_duration_seconds_count{backend="cloudflare",operation="create_dns_record"} 1'
+        in text
+    )
+    assert 'midgard_cache_hits_total{cache="flavors"} 3' in text
+    assert 'midgard_cache_misses_total{cache="flavors"} 1' in text
+    assert 'midgard_cache_hit_ratio{cache="flavors"} 0.75' in text
+
+
+@pytest.mark.asyncio
+async def test_start_server():
+    tracing.commands["midgard-help"].observe(0.01)
+    runner = await metrics.start_server(0, "127.0.0.1")
+    try:
+        host, port = runner.addresses[0][:2]
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://{host}:{port}/metrics") as response:
+                assert response.status == 200
+                assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+                text = await response.text()
+    finally:
+        await runner.cleanup()
+
+    assert 'midgard_command_duration_seconds_count{command="midgard-help"} 1' in text
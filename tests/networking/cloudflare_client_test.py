@@ -0,0 +1,36 @@
+import pytest
+
+from midgard_discord import networking
+
+
+@pytest.mark.asyncio
+async def test_client_reuses_connection(cloudflare):
+    """A portforward's tunnel and DNS calls should share one warm connection."""
+    tunnels = networking.IngressTable.from_json(await networking.get_tunnel_config())
+    networking.add_tunnel_config(tunnels, "ssh://192.168.0.8:22", "user-ssh")
+    await networking.update_tunnel_config(tunnels)
+    await networking.create_dns_record("user-ssh")
+
+    assert [method for method, _ in cloudflare.requests] == [
+        "GET",
+        "PUT",
+        "GET",
+        "POST",
+    ]
+    assert len(cloudflare.peers) == 1
+    assert cloudflare.ingress[0]["hostname"] == "user-ssh.midgard.io"
+    assert cloudflare.dns_records[0]["name"] == "user-ssh.midgard.io"
+    assert cloudflare.dns_records[0]["content"] == "tunnel.cfargotunnel.com"
+
+
+@pytest.mark.asyncio
+async def test_client_close(cloudflare):
+    """Closing the shared client should release the session."""
+    client = networking.get_client()
+    await networking.get_tunnel_config()
+    session = client.session
+
+    await networking.close_client()
+
+    assert session.closed
+    assert networking._client is None
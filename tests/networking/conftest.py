@@ -0,0 +1,29 @@
+import os
+import pytest
+import pytest_asyncio
+
+from midgard_discord import networking
+from tests.fakes.cloudflare import FakeCloudflare
+
+
+@pytest.fixture(scope="session", autouse=True)
+def set_env():
+    os.environ["CF_DOMAIN"] = "midgard.io"
+
+
+@pytest_asyncio.fixture
+async def cloudflare():
+    """Run a fake CloudFlare API and point the shared client at it."""
+    stub = FakeCloudflare()
+    api_url = await stub.start()
+    networking._client = networking.CloudflareClient(
+        api_key="token",
+        account_id="account",
+        tunnel_id="tunnel",
+        zone_id="zone",
+        api_url=api_url,
+    )
+    networking._writer = networking.TunnelConfigWriter(batch_window=0.05)
+    yield stub
+    await networking.close_client()
+    await stub.close()
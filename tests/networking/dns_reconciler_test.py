@@ -0,0 +1,158 @@
+import asyncio
+import pytest
+
+from midgard_discord import networking
+
+
+def names(stub):
+    return sorted(record["name"] for record in stub.dns_records)
+
+
+@pytest.fixture
+def reconciler():
+    networking._reconciler = networking.DNSReconciler(concurrency=2, backoff=0)
+    yield networking._reconciler
+    networking._reconciler = None
+
+
+@pytest.mark.asyncio
+async def test_create_dns_record_idempotent(cloudflare, reconciler):
+    """Creating the same record twice should POST once."""
+    await networking.create_dns_record("user-ssh")
+    await networking.create_dns_record("user-ssh.midgard.io")
+
+    assert names(cloudflare) == ["user-ssh.midgard.io"]
+    assert [method for method, _ in cloudflare.requests] == ["GET", "POST"]
+
+
+@pytest.mark.asyncio
+async def test_create_dns_record_created_elsewhere(cloudflare, reconciler):
+    """A record created behind the cache should be picked up, not fail."""
+    await networking.create_dns_record("user1-ssh")
+    cloudflare.dns_records.append(
+        {
+            "id": "99",
+            "name": "user2-ssh.midgard.io",
+            "content": "tunnel.cfargotunnel.com",
+        }
+    )
+
+    await networking.create_dns_record("user2-ssh")
+
+    assert reconciler.records["user2-ssh.midgard.io"] == "99"
+
+
+@pytest.mark.asyncio
+async def test_create_dns_record_while_refreshing(cloudflare, reconciler):
+    """A refresh after a conflict should not break creates in flight."""
+    await networking.create_dns_record("user1-ssh")
+    cloudflare.dns_records.append(
+        {
+            "id": "99",
+            "name": "user2-ssh.midgard.io",
+            "content": "tunnel.cfargotunnel.com",
+        }
+    )
+
+    await asyncio.gather(
+        networking.create_dns_record("user2-ssh"),
+        networking.create_dns_record("user3-ssh"),
+    )
+
+    assert "user2-ssh.midgard.io" in reconciler.records
+    assert "user3-ssh.midgard.io" in names(cloudflare)
+
+
+@pytest.mark.asyncio
+async def test_reconcile_pages_and_diffs(cloudflare, reconciler):
+    """Reconciling should page existing records and only touch the difference."""
+    cloudflare.dns_records = [
+        {
+            "id": str(i),
+            "name": f"old{i}.midgard.io",
+            "content": "tunnel.cfargotunnel.com",
+        }
+        for i in range(250)
+    ]
+    cloudflare.record_ids = 250
+    # A record of someone else in the zone
+    cloudflare.dns_records.append(
+        {"id": "www", "name": "www.midgard.io", "content": "192.0.2.1"}
+    )
+
+    desired = [f"old{i}" for i in range(200)] + ["new1", "new2"]
+    created, deleted = await reconciler.reconcile(desired)
+
+    assert created == {"new1.midgard.io", "new2.midgard.io"}
+    assert deleted == {f"old{i}.midgard.io" for i in range(200, 250)}
+    methods = [method for method, _ in cloudflare.requests]
+    assert methods.count("GET") == 3
+    assert methods.count("POST") == 2
+    assert methods.count("DELETE") == 50
+    assert "www.midgard.io" in names(cloudflare)
+    assert len(cloudflare.dns_records) == 203
+
+
+@pytest.mark.asyncio
+async def test_reconcile_backs_off_when_rate_limited(cloudflare, reconciler):
+    """429 responses should be retried."""
+    cloudflare.rate_limited = 3
+
+    created, _ = await reconciler.reconcile(["a", "b"])
+
+    assert created == {"a.midgard.io", "b.midgard.io"}
+    assert names(cloudflare) == ["a.midgard.io", "b.midgard.io"]
+
+
+@pytest.mark.asyncio
+async def test_reconcile_from_tunnel_ingress(cloudflare, reconciler):
+    """The desired hostnames should come from the tunnel ingress rules."""
+    await asyncio.gather(
+        networking.add_ingress("ssh://10.0.0.1:22", "user1-ssh"),
+        networking.add_ingress("ssh://10.0.0.2:22", "user2-ssh"),
+    )
+
+    created, deleted = await networking.reconcile_dns_records()
+
+    assert created == {"user1-ssh.midgard.io", "user2-ssh.midgard.io"}
+    assert deleted == set()
+
+
+@pytest.mark.asyncio
+async def test_create_dns_record_deleted_elsewhere(cloudflare, reconciler):
+    """A record deleted behind the cache should be recreated once it expires."""
+    await networking.create_dns_record("user-ssh")
+    cloudflare.dns_records.clear()
+
+    reconciler.ttl = 0
+    reconciler.expires_at = 0
+    await networking.create_dns_record("user-ssh")
+
+    assert names(cloudflare) == ["user-ssh.midgard.io"]
+
+
+@pytest.mark.asyncio
+async def test_reconcile_record_deleted_elsewhere(cloudflare, reconciler):
+    """Deleting a record already gone should not fail the reconcile."""
+    await reconciler.reconcile(["a", "b"])
+    cloudflare.dns_records = [
+        r for r in cloudflare.dns_records if r["name"] != "b.midgard.io"
+    ]
+
+    _, deleted = await reconciler.reconcile(["a"])
+
+    assert deleted == {"b.midgard.io"}
+    assert "b.midgard.io" not in reconciler.records
+
+
+@pytest.mark.asyncio
+async def test_reconcile_dns_records_refreshes(cloudflare, reconciler):
+    """Reconciling from the ingress should notice records deleted elsewhere."""
+    await networking.add_ingress("ssh://10.0.0.1:22", "user1-ssh")
+    await networking.reconcile_dns_records()
+    cloudflare.dns_records.clear()
+
+    created, _ = await networking.reconcile_dns_records()
+
+    assert created == {"user1-ssh.midgard.io"}
+    assert names(cloudflare) == ["user1-ssh.midgard.io"]
@@ -0,0 +1,83 @@
+import pytest
+
+from midgard_discord import networking
+
+
+@pytest.fixture
+def ingress():
+    """A CloudFlare ingress list, newest rule first."""
+    return [
+        {"service": "ssh://10.0.0.2:22", "hostname": "bob-ssh.midgard.io"},
+        {
+            "service": "http://10.0.0.1:8080",
+            "hostname": "alice-http-8080.midgard.io",
+            "originRequest": {},
+        },
+        {"service": "http://10.0.0.1:80", "hostname": "alice.midgard.io"},
+        {"service": "http_status:404"},
+    ]
+
+
+def test_table_round_trip(ingress):
+    """Serialising a loaded table should give back the same list."""
+    table = networking.IngressTable.from_json(ingress)
+
+    assert len(table) == 4
+    assert table.to_json() == ingress
+
+
+def test_table_exact_hostname(ingress):
+    """Lookups should match exact hostnames, not substrings."""
+    table = networking.IngressTable.from_json(ingress)
+
+    assert "alice.midgard.io" in table
+    assert "alice" not in table
+    assert "ice.midgard.io" not in table
+    assert table.get("bob-ssh.midgard.io").service == "ssh://10.0.0.2:22"
+    # A hostname contained in another one is not a duplicate
+    networking.add_tunnel_config(table, "http://10.0.0.3:80", "bob")
+    assert "bob.midgard.io" in table
+
+
+def test_table_add_newest_first_catch_all_last(ingress):
+    """New rules should go first and the catch-all should stay last."""
+    table = networking.IngressTable.from_json(ingress)
+    networking.add_tunnel_config(table, "ssh://10.0.0.3:22", "carol-ssh")
+
+    rules = table.to_json()
+    assert rules[0] == {
+        "service": "ssh://10.0.0.3:22",
+        "hostname": "carol-ssh.midgard.io",
+        "originRequest": {},
+    }
+    assert rules[-1] == {"service": "http_status:404"}
+    with pytest.raises(IndexError):
+        networking.add_tunnel_config(table, "ssh://10.0.0.9:22", "carol-ssh")
+
+
+def test_table_remove(ingress):
+    """Removing a rule should keep the order of the others."""
+    table = networking.IngressTable.from_json(ingress)
+    networking.remove_tunnel_config(table, "alice-http-8080")
+
+    assert [rule.hostname for rule in table] == [
+        "bob-ssh.midgard.io",
+        "alice.midgard.io",
+        None,
+    ]
+    with pytest.raises(IndexError):
+        networking.remove_tunnel_config(table, "alice-http-8080")
+
+
+def test_table_default_catch_all():
+    """A table without a catch-all should get the default one."""
+    table = networking.IngressTable.from_json([])
+
+    assert table.to_json() == [{"service": networking.DEFAULT_CATCH_ALL_SERVICE}]
+
+
+def test_ingress_slots():
+    """Ingress rules should not carry a per-instance __dict__."""
+    rule = networking.Ingress("ssh://10.0.0.1:22", hostname="a.midgard.io")
+
+    assert not hasattr(rule, "__dict__")
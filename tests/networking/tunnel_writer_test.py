@@ -0,0 +1,87 @@
+import asyncio
+import pytest
+
+from midgard_discord import networking
+
+
+def hostnames(stub):
+    return [rule.get("hostname") for rule in stub.ingress]
+
+
+@pytest.mark.asyncio
+async def test_writer_coalesces_concurrent_adds(cloudflare):
+    """Concurrent additions should all land with one GET and one PUT."""
+    await asyncio.gather(
+        *(
+            networking.add_ingress(f"ssh://10.0.0.{i}:22", f"user{i}-ssh")
+            for i in range(10)
+        )
+    )
+
+    assert [method for method, _ in cloudflare.requests] == ["GET", "PUT"]
+    assert sorted(hostnames(cloudflare)[:-1]) == sorted(
+        f"user{i}-ssh.midgard.io" for i in range(10)
+    )
+    # The catch-all rule stays last
+    assert cloudflare.ingress[-1] == {"service": "http_status:404"}
+
+
+@pytest.mark.asyncio
+async def test_writer_rejects_duplicate_only(cloudflare):
+    """A duplicate hostname should fail alone without dropping the batch."""
+    await networking.add_ingress("ssh://10.0.0.1:22", "user1-ssh")
+
+    results = await asyncio.gather(
+        networking.add_ingress("ssh://10.0.0.9:22", "user1-ssh"),
+        networking.add_ingress("ssh://10.0.0.2:22", "user2-ssh"),
+        return_exceptions=True,
+    )
+
+    assert isinstance(results[0], IndexError)
+    assert results[1] is None
+    assert hostnames(cloudflare).count("user1-ssh.midgard.io") == 1
+    assert "user2-ssh.midgard.io" in hostnames(cloudflare)
+
+
+@pytest.mark.asyncio
+async def test_writer_keeps_external_change(cloudflare):
+    """Rules added outside the bot should survive the next batch."""
+    await networking.add_ingress("ssh://10.0.0.1:22", "user1-ssh")
+    # Someone edits the tunnel from the dashboard
+    cloudflare.ingress.insert(0, {"service": "http://10.0.0.5", "hostname": "docs"})
+    cloudflare.version += 1
+
+    await networking.add_ingress("ssh://10.0.0.2:22", "user2-ssh")
+
+    assert "docs" in hostnames(cloudflare)
+    assert "user2-ssh.midgard.io" in hostnames(cloudflare)
+
+
+@pytest.mark.asyncio
+async def test_writer_cached_copy_resyncs_on_version_jump(cloudflare):
+    """With a sync interval the copy is reused until the version jumps."""
+    networking._writer = networking.TunnelConfigWriter(
+        batch_window=0.01, sync_interval=60
+    )
+    await networking.add_ingress("ssh://10.0.0.1:22", "user1-ssh")
+    await networking.add_ingress("ssh://10.0.0.2:22", "user2-ssh")
+    assert [method for method, _ in cloudflare.requests] == ["GET", "PUT", "PUT"]
+
+    cloudflare.version += 1
+    await networking.add_ingress("ssh://10.0.0.3:22", "user3-ssh")
+    await networking.add_ingress("ssh://10.0.0.4:22", "user4-ssh")
+
+    methods = [method for method, _ in cloudflare.requests]
+    assert methods == ["GET", "PUT", "PUT", "PUT", "GET", "PUT"]
+    assert "user4-ssh.midgard.io" in hostnames(cloudflare)
+
+
+@pytest.mark.asyncio
+async def test_writer_remove(cloudflare):
+    """Removing a rule should drop it from the tunnel."""
+    await networking.add_ingress("ssh://10.0.0.1:22", "user1-ssh")
+    await networking.remove_ingress("user1-ssh")
+
+    assert hostnames(cloudflare) == [None]
+    with pytest.raises(IndexError):
+        await networking.remove_ingress("user1-ssh")
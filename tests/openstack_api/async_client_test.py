@@ -0,0 +1,104 @@
+import pytest
+
+from midgard_discord import cloud
+from midgard_discord import openstack_api
+
+
+@pytest.mark.asyncio
+async def test_find_resources(openstack):
+    """Finds should return SDK resources, or None when missing."""
+    stub, client = openstack
+
+    server = await client.find_server("midgard-server")
+    assert server.id == "s1" and server.status == "ACTIVE"
+    assert (await client.find_keypair("midgard-keypair")).name == "midgard-keypair"
+    assert (await client.find_user("123456789")).id == "u1"
+    assert (await client.find_project("midgard-123456789")).id == "p1"
+    assert (await client.find_security_group("midgard")).id == "sg1"
+
+    assert await client.find_server("missing-server") is None
+    assert await client.find_keypair("missing-keypair") is None
+    assert await client.find_user("987654321") is None
+
+
+@pytest.mark.asyncio
+async def test_find_server_by_id(openstack):
+    """A server should also be found by its ID."""
+    stub, client = openstack
+
+    assert (await client.find_server("s1")).name == "midgard-server"
+
+
+@pytest.mark.asyncio
+async def test_reuses_token(openstack):
+    """Every request should reuse the token of the SDK session."""
+    stub, client = openstack
+
+    await client.find_server("midgard-server")
+    await client.find_keypair("midgard-keypair")
+    await client.find_user("123456789")
+
+    client.connection.session.get_token.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_refreshes_revoked_token(openstack):
+    """A 401 should fetch a new token and retry once."""
+    stub, client = openstack
+    await client.find_user("123456789")
+
+    stub.token = "token-2"
+    assert (await client.find_user("123456789")).id == "u1"
+    assert client.connection.session.get_token.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_paginate_flavors(openstack):
+    """Flavors should be fetched page by page through the next links."""
+    stub, client = openstack
+
+    flavors = [flavor async for flavor in client.flavors()]
+
+    assert [flavor.id for flavor in flavors] == [f"f{i}" for i in range(5)]
+    pages = [query for path, query in stub.requests if path.endswith("/flavors/detail")]
+    assert len(pages) == 3
+
+
+@pytest.mark.asyncio
+async def test_paginate_images_lazily(openstack):
+    """Glance's relative next links should be followed only as items are read."""
+    stub, client = openstack
+
+    images = client.images()
+    first = [await images.__anext__() for _ in range(2)]
+    await images.aclose()
+
+    assert [image.name for image in first] == ["image00", "image01"]
+    assert len([path for path, _ in stub.requests if path.endswith("/images")]) == 1
+    assert [image.id async for image in client.images()] == [f"i{i}" for i in range(5)]
+
+
+@pytest.mark.asyncio
+async def test_api_error(openstack):
+    """Errors other than 401 and 404 should raise OpenStackError."""
+    stub, client = openstack
+    stub.servers = None
+
+    with pytest.raises(openstack_api.OpenStackError) as error:
+        await client.find_server("midgard-server")
+    assert error.value.status == 500
+
+
+@pytest.mark.asyncio
+async def test_cloud_async_reads(openstack, monkeypatch):
+    """cloud functions should use the async client when OS_ASYNC_READS is set."""
+    stub, client = openstack
+    monkeypatch.setenv("OS_ASYNC_READS", "true")
+    monkeypatch.setitem(cloud._async_clients, client.connection, client)
+
+    server = await cloud.find_server(client.connection)
+    flavors = await cloud.list_flavors(client.connection)
+
+    assert server.name == "midgard-server"
+    assert len(flavors) == 5
+    client.connection.compute.find_server.assert_not_called()
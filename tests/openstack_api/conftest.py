@@ -0,0 +1,148 @@
+import datetime
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from midgard_discord import openstack_api
+
+
+class OpenStackStub:
+    """A local stand-in for the Nova, Neutron, Keystone and Glance read APIs."""
+
+    def __init__(self):
+        self.token = "token-1"
+        self.servers = [{"id": "s1", "name": "midgard-server", "status": "ACTIVE"}]
+        self.keypairs = {"midgard-keypair": {"name": "midgard-keypair"}}
+        self.users = [{"id": "u1", "name": "123456789"}]
+        self.projects = [{"id": "p1", "name": "midgard-123456789"}]
+        self.security_groups = [{"id": "sg1", "name": "midgard"}]
+        self.flavors = [
+            {"id": f"f{i}", "name": f"m1.flavor{i:02d}", "vcpus": 1} for i in range(5)
+        ]
+        self.images = [{"id": f"i{i}", "name": f"image{i:02d}"} for i in range(5)]
+        self.requests = []
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self.auth])
+        app.router.add_get("/compute/v2.1/servers/detail", self.list_servers)
+        app.router.add_get("/compute/v2.1/servers/{id}", self.get_server)
+        app.router.add_get("/compute/v2.1/os-keypairs/{name}", self.get_keypair)
+        app.router.add_get("/compute/v2.1/flavors/detail", self.list_flavors)
+        app.router.add_get("/identity/v3/users", self.list_users)
+        app.router.add_get("/identity/v3/users/{id}", self.not_found)
+        app.router.add_get("/identity/v3/projects", self.list_projects)
+        app.router.add_get("/identity/v3/projects/{id}", self.not_found)
+        app.router.add_get("/network/v2.0/security-groups", self.list_security_groups)
+        app.router.add_get("/image/v2/images", self.list_images)
+        return app
+
+    @web.middleware
+    async def auth(self, request: web.Request, handler) -> web.Response:
+        self.requests.append((request.path, dict(request.query)))
+        if request.headers.get("X-Auth-Token") != self.token:
+            return web.json_response({}, status=401)
+        return await handler(request)
+
+    def page(self, request: web.Request, items: list[dict]) -> tuple[list, str]:
+        limit = int(request.query.get("limit", len(items) or 1))
+        marker = request.query.get("marker")
+        start = [item["id"] for item in items].index(marker) + 1 if marker else 0
+        page = items[start : start + limit]
+        if len(page) == limit and start + limit < len(items):
+            return page, f"marker={page[-1]['id']}&limit={limit}"
+        return page, None
+
+    def named(self, request: web.Request, items: list[dict]) -> list[dict]:
+        name = request.query.get("name")
+        return [item for item in items if name is None or name in item["name"]]
+
+    async def not_found(self, request: web.Request) -> web.Response:
+        return web.json_response({}, status=404)
+
+    async def list_servers(self, request: web.Request) -> web.Response:
+        return web.json_response({"servers": self.named(request, self.servers)})
+
+    async def get_server(self, request: web.Request) -> web.Response:
+        for server in self.servers:
+            if server["id"] == request.match_info["id"]:
+                return web.json_response({"server": server})
+        return await self.not_found(request)
+
+    async def get_keypair(self, request: web.Request) -> web.Response:
+        keypair = self.keypairs.get(request.match_info["name"])
+        if keypair is None:
+            return await self.not_found(request)
+        return web.json_response({"keypair": keypair})
+
+    async def list_flavors(self, request: web.Request) -> web.Response:
+        page, query = self.page(request, self.flavors)
+        body = {"flavors": page}
+        if query:
+            body["flavors_links"] = [
+                {"rel": "next", "href": str(request.url.with_query(query))}
+            ]
+        return web.json_response(body)
+
+    async def list_users(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {"users": self.named(request, self.users), "links": {"next": None}}
+        )
+
+    async def list_projects(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {"projects": self.named(request, self.projects), "links": {"next": None}}
+        )
+
+    async def list_security_groups(self, request: web.Request) -> web.Response:
+        name = request.query.get("name")
+        return web.json_response(
+            {
+                "security_groups": [
+                    group
+                    for group in self.security_groups
+                    if name is None or group["name"] == name
+                ]
+            }
+        )
+
+    async def list_images(self, request: web.Request) -> web.Response:
+        page, query = self.page(request, self.images)
+        body = {"images": page}
+        if query:
+            # Glance links are relative to the unversioned endpoint
+            body["next"] = f"/v2/images?{query}"
+        return web.json_response(body)
+
+
+def sdk_connection(stub: OpenStackStub, url: str) -> MagicMock:
+    """An openstacksdk connection whose session hands out the stub's token."""
+    connection = MagicMock()
+    session = connection.session
+    session.get_token.side_effect = lambda: stub.token
+    session.auth.get_access.return_value = SimpleNamespace(
+        expires=datetime.datetime.now(datetime.timezone.utc)
+        + datetime.timedelta(hours=1)
+    )
+    session.get_endpoint.side_effect = lambda service_type, **kwargs: {
+        "compute": f"{url}/compute/v2.1",
+        "identity": f"{url}/identity",
+        "image": f"{url}/image",
+        "network": f"{url}/network",
+    }[service_type]
+    return connection
+
+
+@pytest_asyncio.fixture
+async def openstack():
+    """Run an OpenStack stub and return it with a client pointed at it."""
+    stub = OpenStackStub()
+    server = TestServer(stub.app())
+    await server.start_server()
+    connection = sdk_connection(stub, str(server.make_url("")).rstrip("/"))
+    client = openstack_api.AsyncOpenStackClient(connection, page_size=2)
+    yield stub, client
+    await openstack_api.close_session()
+    await server.close()
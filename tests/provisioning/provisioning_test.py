@@ -0,0 +1,79 @@
+import asyncio
+import pytest
+
+from midgard_discord import provisioning
+
+
+def step(name, log, requires=(), delay=0.01, result=None):
+    """A step that records when it starts and finishes."""
+
+    async def func(results):
+        log.append(f"start {name}")
+        await asyncio.sleep(delay)
+        log.append(f"end {name}")
+        return result or name
+
+    return provisioning.Step(name, func, requires=requires)
+
+
+@pytest.mark.asyncio
+async def test_run_independent_steps_concurrently():
+    """Independent branches should overlap, dependants wait for their inputs."""
+    log = []
+    results = await provisioning.run(
+        [
+            step("project", log),
+            step("network", log, requires=("project",)),
+            step("security_group", log, requires=("project",)),
+            step("subnet", log, requires=("network",)),
+        ]
+    )
+
+    assert results == {
+        "project": "project",
+        "network": "network",
+        "security_group": "security_group",
+        "subnet": "subnet",
+    }
+    assert log.index("end project") < log.index("start network")
+    # Both branches start before either finishes
+    assert log.index("start security_group") < log.index("end network")
+    assert log.index("end network") < log.index("start subnet")
+
+
+@pytest.mark.asyncio
+async def test_run_skips_completed_steps():
+    """Steps with a known result should not run again."""
+    log = []
+    results = await provisioning.run(
+        [step("project", log), step("network", log, requires=("project",))],
+        {"project": "existing"},
+    )
+
+    assert results["project"] == "existing"
+    assert log == ["start network", "end network"]
+
+
+@pytest.mark.asyncio
+async def test_run_failure_cancels_running_steps():
+    """A failing step should cancel its siblings and raise."""
+    log = []
+
+    async def fail(results):
+        raise RuntimeError("Quota exceeded.")
+
+    with pytest.raises(RuntimeError, match="Quota exceeded."):
+        await provisioning.run(
+            [
+                step("slow", log, delay=1),
+                provisioning.Step("broken", fail),
+            ]
+        )
+    assert "end slow" not in log
+
+
+@pytest.mark.asyncio
+async def test_run_unknown_requirement():
+    """Requiring an undeclared step should be rejected."""
+    with pytest.raises(ValueError):
+        await provisioning.run([step("network", [], requires=("project",))])
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import threading
+import pytest
+from unittest.mock import MagicMock
+
+from midgard_discord import executor
+from midgard_discord import tracing
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    tracing.reset()
+    yield
+    tracing.reset()
+
+
+def test_histogram_percentiles():
+    histogram = tracing.Histogram()
+    for i in range(1, 101):
+        histogram.observe(i / 1000)
+
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 100
+    assert snapshot["p50"] == 0.051
+    assert snapshot["p99"] == 0.1
+    assert abs(snapshot["mean"] - 0.0505) < 1e-9
+
+
+@pytest.mark.asyncio
+async def test_command_spans_and_queue_wait(capsys, monkeypatch):
+    """Spans nest, and time queued for a pool thread is kept apart."""
+    monkeypatch.setenv("TRACE_LOG", "true")
+    pool = executor.Executor("read", max_workers=1)
+    release = threading.Event()
+
+    async def find(name):
+        return await pool.run(lambda: release.wait() and name)
+
+    async def lookup():
+        return await asyncio.gather(
+            namespace["find"]("server"), namespace["find"]("keypair")
+        )
+
+    namespace = {"__name__": "midgard_discord.fake", "find": find, "lookup": lookup}
+    find.__module__ = lookup.__module__ = "midgard_discord.fake"
+    tracing.instrument(namespace)
+
+    @tracing.command("server create")
+    async def handler(ctx):
+        task = asyncio.ensure_future(namespace["lookup"]())
+        await asyncio.sleep(0.05)
+        release.set()
+        return await task
+
+    assert await handler(MagicMock(id=42)) == ["server", "keypair"]
+    pool.shutdown()
+
+    trace = json.loads(capsys.readouterr().out)["trace"]
+    assert trace["command"] == "server create"
+    assert trace["interaction_id"] == "42"
+    assert [(s["name"], s["depth"]) for s in trace["spans"]] == [
+        ("fake.lookup", 0),
+        ("fake.find", 1),
+        ("fake.find", 1),
+    ]
+    # The second call queued behind the first for the only thread
+    assert max(s["wait"] for s in trace["spans"]) >= 0.04
+    assert all(s["backend"] >= 0 for s in trace["spans"])
+    snapshot = tracing.snapshot()
+    assert snapshot["commands"]["server create"]["count"] == 1
+    assert snapshot["operations"]["fake.find"]["count"] == 2
+    assert snapshot["waits"]["read"]["count"] == 2
+
+
+@pytest.mark.asyncio
+async def test_command_records_errors(capsys, monkeypatch):
+    monkeypatch.setenv("TRACE_LOG", "false")
+
+    @tracing.command("register")
+    async def handler(ctx):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        await handler(MagicMock(id=1))
+
+    assert capsys.readouterr().out == ""
+    assert tracing.recent[-1].error == "RuntimeError"
+    assert tracing.snapshot()["commands"]["register"]["count"] == 1
+
+
+def test_instrument_skips_private_and_foreign_functions():
+    async def public():
+        pass
+
+    async def _private():
+        pass
+
+    def sync():
+        pass
+
+    for func in (public, _private, sync):
+        func.__module__ = "midgard_discord.fake"
+    namespace = {
+        "__name__": "midgard_discord.fake",
+        "public": public,
+        "_private": _private,
+        "sync": sync,
+        "sleep": asyncio.sleep,
+    }
+    tracing.instrument(namespace)
+
+    assert namespace["public"] is not public
+    assert namespace["public"].__wrapped__ is public
+    assert namespace["_private"] is _private
+    assert namespace["sync"] is sync
+    assert namespace["sleep"] is asyncio.sleep
@@ -0,0 +1,64 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock
+
+from midgard_discord import warmup
+
+
+@pytest.mark.asyncio
+async def test_warmup_runs_concurrently():
+    """Every task should run at once and the bot become ready."""
+    running = 0
+    peak = 0
+
+    async def lookup():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return "found"
+
+    startup = warmup.Warmup({"role": lookup, "network": lookup, "flavors": lookup})
+    startup.start()
+
+    assert await startup.wait_ready(timeout=1)
+    assert peak == 3
+    assert startup.status == {"role": "ready", "network": "ready", "flavors": "ready"}
+    await startup.close()
+
+
+@pytest.mark.asyncio
+async def test_warmup_failure_retried():
+    """A failing task should not block the others and be retried later."""
+    role = AsyncMock(side_effect=[Exception("Keystone unavailable"), "member"])
+    network = AsyncMock()
+    startup = warmup.Warmup({"role": role, "network": network}, interval=0.01)
+
+    startup.start()
+    assert not await startup.wait_ready(timeout=0.005)
+    assert startup.status["role"] == "failed"
+    assert startup.status["network"] == "ready"
+
+    assert await startup.wait_ready(timeout=1)
+    assert startup.status["role"] == "ready"
+    await startup.close()
+
+
+@pytest.mark.asyncio
+async def test_warmup_nothing_found():
+    """A task finding nothing should not make the bot ready."""
+    startup = warmup.Warmup({"role": AsyncMock(return_value=None)}, interval=0)
+
+    assert not await startup.run_once()
+    assert startup.status["role"] == "failed"
+    assert not startup.ready
+
+
+@pytest.mark.asyncio
+async def test_warmup_start_once():
+    """on_ready firing again should not start a second warm-up."""
+    startup = warmup.Warmup({"role": AsyncMock()}, interval=10)
+
+    assert startup.start() is startup.start()
+    await startup.close()